@@ -6,6 +6,7 @@ A production-ready fitness app with AI-powered workout and nutrition recommendat
 Quick Start:
 1. Install dependencies: pip install -r requirements.txt
 2. Initialize database: flask --app app initdb
+   (existing databases: flask --app app upgrade-db)
 3. Seed data: python seed_data.py
 4. Create admin: flask --app app create-admin
 5. Run: python run.py or flask --app app run
@@ -14,12 +15,15 @@ from __future__ import annotations
 
 import os
 import getpass
+import time
+import click
 from flask import Flask
 from flask_login import LoginManager
 from werkzeug.security import generate_password_hash
 
 from config import Config
 from models import User, db
+from services import job_service
 
 # Import Blueprints
 from routes.auth import auth_bp
@@ -52,6 +56,8 @@ def create_app() -> Flask:
     app.register_blueprint(onboarding_bp)
     app.register_blueprint(api_bp)
 
+    job_service.init_app(app)
+
     # CLI Commands
     @app.cli.command("initdb")
     def initdb_command():
@@ -60,6 +66,88 @@ def create_app() -> Flask:
             db.create_all()
         print("Database initialized.")
 
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """Bring an existing database up to date with the models."""
+        import migrations
+        with app.app_context():
+            migrations.run_all()
+        print("Database upgraded.")
+
+    @app.cli.command("regenerate-plans")
+    @click.option("--goal", help="Only users with this goal.")
+    @click.option("--fitness-level", help="Only users at this fitness level.")
+    @click.option("--expiring-before", type=click.DateTime(formats=["%Y-%m-%d"]), help="Only users whose latest plan ends before this date.")
+    @click.option("--start-date", help="Start date of the new plans (YYYY-MM-DD, default today).")
+    @click.option("--workers", default=4, show_default=True, help="Worker processes.")
+    @click.option("--batch-size", default=200, show_default=True, help="Users per worker task.")
+    @click.option("--keep-history", is_flag=True, help="Keep existing plans instead of deleting them.")
+    def regenerate_plans_command(goal, fitness_level, expiring_before, start_date, workers, batch_size, keep_history):
+        """Regenerate plans for matching users in parallel."""
+        from services.plan_service import plan_regeneration_query, regenerate_plans
+        with app.app_context():
+            query = plan_regeneration_query(goal, fitness_level, expiring_before.date() if expiring_before else None)
+            totals = regenerate_plans(query, workers, batch_size, start_date, keep_history)
+        print(f"Regenerated plans for {totals['users']} users ({totals['entries']} entries) in {totals['seconds']}s.")
+
+    @app.cli.command("streaks-rollover")
+    @click.option("--date", "day", type=click.DateTime(formats=["%Y-%m-%d"]), help="Day to judge (default yesterday, UTC).")
+    def streaks_rollover_command(day):
+        """Extend or reset every user's streaks for a finished day; run daily after midnight UTC."""
+        from services.streak_service import rollover_streaks
+        with app.app_context():
+            counts = rollover_streaks(day.date() if day else None)
+        print(f"Rolled over workout streaks for {counts['workout']} users and diet streaks for {counts['diet']} "
+              f"({counts['caught_up']} caught up individually).")
+
+    @app.cli.command("recompute-streaks")
+    def recompute_streaks_command():
+        """Recompute every user's streaks and streak history from their plans."""
+        from services.streak_service import recompute_streaks
+        started = time.perf_counter()
+        with app.app_context():
+            counts = recompute_streaks()
+        print(f"Recomputed streaks for {counts['users']} users ({counts['streak_days']} streak days) "
+              f"in {time.perf_counter() - started:.2f}s.")
+
+    @app.cli.command("notifications-run")
+    @click.option("--loop", is_flag=True, help="Keep running, one pass every --interval seconds.")
+    @click.option("--interval", default=600, show_default=True, help="Seconds between passes with --loop.")
+    def notifications_run_command(loop, interval):
+        """Send due coach, missed-workout, tomorrow's-plan and weekly-summary notices by each user's local time."""
+        from services.notification_scheduler import run_notifications
+        while True:
+            with app.app_context():
+                counts = run_notifications()
+            print(f"Sent {counts['coach']} coach updates, {counts['missed_workout']} missed-workout alerts, "
+                  f"{counts['tomorrow_plan']} tomorrow's-plan notices and {counts['weekly_summary']} weekly summaries.")
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("notifications-archive")
+    @click.option("--days", type=int, help="Archive read notifications older than this (default NOTIFICATION_RETENTION_DAYS).")
+    @click.option("--chunk-size", default=1000, show_default=True, help="Notifications moved per transaction.")
+    def notifications_archive_command(days, chunk_size):
+        """Move old read notifications to notifications_archive; run daily."""
+        from services.notification_service import archive_read_notifications
+        if days is None:
+            days = app.config["NOTIFICATION_RETENTION_DAYS"]
+        with app.app_context():
+            archived = archive_read_notifications(days, chunk_size)
+        print(f"Archived {archived} read notifications older than {days} days.")
+
+    @app.cli.command("leaderboards-prune")
+    @click.option("--weeks", type=int, help="Weekly boards to keep before the current one (default LEADERBOARD_KEEP_WEEKS).")
+    def leaderboards_prune_command(weeks):
+        """Delete expired weekly leaderboards; run weekly."""
+        from services.leaderboard_service import prune_leaderboards
+        if weeks is None:
+            weeks = app.config["LEADERBOARD_KEEP_WEEKS"]
+        with app.app_context():
+            removed = prune_leaderboards(weeks)
+        print(f"Removed {removed} scores from weekly leaderboards more than {weeks} weeks old.")
+
     @app.cli.command("create-admin")
     def create_admin_command():
         """Create an admin user via CLI prompts."""
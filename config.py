@@ -19,6 +19,35 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url or "sqlite:///" + os.path.join(BASE_DIR, "gym.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Seconds before the in-memory exercise catalog reloads (0 = only on invalidation)
+    EXERCISE_CATALOG_TTL = int(os.getenv("EXERCISE_CATALOG_TTL", 300))
+
+    # Days ahead of today that get DailyPlanEntry rows; later days are created on demand (0 = all up front)
+    PLAN_MATERIALIZE_DAYS = int(os.getenv("PLAN_MATERIALIZE_DAYS", 7))
+
+    # In-process worker pool for background jobs (plan generation, check-in follow-ups)
+    BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 2))
+    # Seconds after which a job stuck in "running" is considered orphaned and re-queued
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+
+    # `flask notifications-run`: local hours after which morning/evening notices go out, users per batch
+    NOTIFICATION_MORNING_HOUR = int(os.getenv("NOTIFICATION_MORNING_HOUR", 7))
+    NOTIFICATION_EVENING_HOUR = int(os.getenv("NOTIFICATION_EVENING_HOUR", 18))
+    NOTIFICATION_CHUNK_SIZE = int(os.getenv("NOTIFICATION_CHUNK_SIZE", 500))
+    # `flask notifications-archive`: read notifications older than this many days move to notifications_archive
+    NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))
+    # `flask leaderboards-prune`: weekly boards older than this many weeks are deleted (the all-time board stays)
+    LEADERBOARD_KEEP_WEEKS = int(os.getenv("LEADERBOARD_KEEP_WEEKS", 8))
+
+    # Live notification stream: Redis URL for cross-worker delivery (needs the redis package; unset = in-process only)
+    NOTIFICATION_BUS_URL = os.getenv("NOTIFICATION_BUS_URL") or os.getenv("REDIS_URL")
+    # Each open stream holds a request for its whole lifetime, so only enable it under threaded or async
+    # workers (see gunicorn.conf.py: GUNICORN_WORKER_CLASS=gthread); with it off, pages poll /api/notifications
+    NOTIFICATION_STREAM_ENABLED = os.getenv("NOTIFICATION_STREAM_ENABLED", "0").lower() in ("1", "true", "yes")
+    # Seconds between stream heartbeats, and before a stream closes so the browser reconnects and catches up
+    NOTIFICATION_STREAM_HEARTBEAT = int(os.getenv("NOTIFICATION_STREAM_HEARTBEAT", 15))
+    NOTIFICATION_STREAM_SECONDS = int(os.getenv("NOTIFICATION_STREAM_SECONDS", 300))
+
 
 
 
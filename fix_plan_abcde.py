@@ -1,6 +1,6 @@
 from app import create_app
 from models import User, UserPlan, DailyPlanEntry, db
-from services.plan_service import generate_month_plan
+from services.plan_service import generate_month_plan, entry_exercise_payload
 
 app = create_app()
 
@@ -37,7 +37,7 @@ with app.app_context():
         print(f"Today's Entry ({today}):")
         print(f"  - Is Exercise Day: {entry.is_exercise_day}")
         if entry.is_exercise_day:
-            print(f"  - Exercise Count: {len(entry.exercise_payload)}")
+            print(f"  - Exercise Count: {len(entry_exercise_payload(entry))}")
         else:
             print("  - REST DAY")
     else:
@@ -0,0 +1,17 @@
+"""
+Gunicorn settings, picked up automatically from the working directory:
+gunicorn wsgi:application
+
+The notification stream (/api/notifications/stream) holds its request open,
+so it is only usable with a threaded or async worker. To turn it on, run
+GUNICORN_WORKER_CLASS=gthread (or gevent) and set
+NOTIFICATION_STREAM_ENABLED=1 in the environment. With the default sync
+worker, leave the stream off and pages poll instead.
+"""
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+# Requests in flight per worker under gthread, open notification streams included
+threads = int(os.getenv("GUNICORN_THREADS", 1))
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
@@ -0,0 +1,68 @@
+"""
+Idempotent schema and data upgrades for existing GymSphere databases.
+
+db.create_all() only creates missing tables; this module also adds columns
+and indexes introduced after a table was first created, and converts old
+data. Run with: flask --app app upgrade-db
+"""
+from sqlalchemy import inspect, text
+
+from models import db
+from services.badge_service import collapse_duplicate_badges
+from services.checkin_service import collapse_duplicate_checkins
+from services.exercise_catalog import sync_exercise_tags
+from services.leaderboard_service import rebuild_leaderboards
+from services.notification_service import backfill_notification_keys
+from services.plan_service import compact_legacy_payloads
+from services.streak_service import recompute_streaks
+from services.water_service import collapse_water_logs, rebuild_water_rollups
+
+
+def add_missing_columns() -> list:
+    """ALTER TABLE ... ADD COLUMN for model columns the database lacks."""
+    added = []
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+            added.append(f"{table.name}.{column.name}")
+    db.session.commit()
+    return added
+
+
+def create_missing_indexes() -> None:
+    """Create model indexes that were declared after their table existed."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+# Data migrations, run in order after columns exist and before indexes are built
+DATA_MIGRATIONS = [
+    ("compact exercise payloads", compact_legacy_payloads),
+    ("backfill exercise tags", sync_exercise_tags),
+    ("recompute streaks", recompute_streaks),
+    ("backfill notification keys", backfill_notification_keys),
+    ("collapse duplicate check-ins", collapse_duplicate_checkins),
+    ("collapse duplicate badges", collapse_duplicate_badges),
+    ("collapse water logs", collapse_water_logs),
+    ("rebuild water rollups", rebuild_water_rollups),
+    ("rebuild leaderboards", rebuild_leaderboards),
+]
+
+
+def run_all() -> None:
+    db.create_all()
+    for name in add_missing_columns():
+        print(f" - added column {name}")
+    for label, migration in DATA_MIGRATIONS:
+        result = migration()
+        print(f" - {label}: {result}")
+    create_missing_indexes()
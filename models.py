@@ -3,7 +3,7 @@ from datetime import datetime
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, text
 
 db = SQLAlchemy()
 
@@ -30,6 +30,7 @@ class User(UserMixin, db.Model):
     goal = db.Column(db.String(100))
     estimate_days = db.Column(db.Integer)
     last_check_date = db.Column(db.DateTime)
+    timezone = db.Column(db.String(64), default="UTC", index=True)  # IANA name; sets the local day for notifications
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     # Streak Tracking
@@ -37,6 +38,9 @@ class User(UserMixin, db.Model):
     diet_streak = db.Column(db.Integer, default=0)
     last_workout_date = db.Column(db.Date)
     last_diet_date = db.Column(db.Date)
+    # Last day already counted in each streak; check-ins and rollover advance these
+    workout_streak_through = db.Column(db.Date)
+    diet_streak_through = db.Column(db.Date)
 
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
 
@@ -126,12 +130,36 @@ class Exercise(db.Model):
     animation_url = db.Column(db.String(500)) # URL to asset
     thumbnail_url = db.Column(db.String(500)) # Static preview
     
-    tags = db.Column(db.String(200)) # Comma-separated tags
+    tags = db.Column(db.String(200)) # Comma-separated tags (display copy of tag_links)
+
+    tag_links = db.relationship(
+        "ExerciseTag",
+        back_populates="exercise",
+        cascade="all, delete-orphan",
+    )
 
     def __repr__(self) -> str:
         return f"<Exercise {self.name}>"
 
 
+class ExerciseTag(db.Model):
+    """Normalized exercise tag (one row per exercise/tag pair)."""
+
+    __tablename__ = "exercise_tags"
+
+    exercise_id = db.Column(db.Integer, ForeignKey("exercises.id"), primary_key=True)
+    tag = db.Column(db.String(50), primary_key=True)  # Lowercased, e.g. warmup, strength
+
+    exercise = db.relationship("Exercise", back_populates="tag_links")
+
+    __table_args__ = (
+        db.Index("idx_exercise_tags_tag", "tag", "exercise_id"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ExerciseTag {self.tag} exercise={self.exercise_id}>"
+
+
 class WaterLog(db.Model):
     """Track daily water intake."""
     __tablename__ = "water_logs"
@@ -143,6 +171,39 @@ class WaterLog(db.Model):
     
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # One row per user and day; each glass adds to it with an upsert
+        db.Index("uq_water_logs_user_date", "user_id", "date", unique=True),
+    )
+
+
+class WaterRollup(db.Model):
+    """Water intake per user and week or month, kept in step with water_logs."""
+    __tablename__ = "water_rollups"
+
+    user_id = db.Column(db.Integer, ForeignKey("users.id"), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # week, month
+    period_start = db.Column(db.Date, primary_key=True)  # Monday of the week, or the 1st of the month
+    total_ml = db.Column(db.Integer, default=0, nullable=False)
+    days_logged = db.Column(db.Integer, default=0, nullable=False)  # Days with any water logged
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class LeaderboardScore(db.Model):
+    """A user's check-in count on one leaderboard, kept in step with user_checkins."""
+    __tablename__ = "leaderboard_scores"
+
+    board = db.Column(db.String(20), primary_key=True)  # "all", or "week:<Monday>" for a week's board
+    user_id = db.Column(db.Integer, ForeignKey("users.id"), primary_key=True)
+    score = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Top-K reads walk a board from its highest score; ranks count the scores above
+        db.Index("idx_leaderboard_scores_rank", "board", "score", "user_id"),
+    )
+
+
 class SleepLog(db.Model):
     """Track nightly sleep."""
     __tablename__ = "sleep_logs"
@@ -175,6 +236,11 @@ class UserBadge(db.Model):
     badge = db.relationship("Badge")
     user = db.relationship("User", backref="badges")
 
+    __table_args__ = (
+        # Each badge is earned once; concurrent evaluations insert-or-ignore
+        db.Index("uq_user_badges", "user_id", "badge_id", unique=True),
+    )
+
 
 class UserProgress(db.Model):
     """Weight/progress log per user."""
@@ -188,6 +254,10 @@ class UserProgress(db.Model):
 
     user = db.relationship("User", back_populates="progress_logs")
 
+    __table_args__ = (
+        db.Index("idx_user_progress_user_logged", "user_id", "logged_at"),
+    )
+
     def __repr__(self) -> str:
         return f"<UserProgress user={self.user_id} at {self.logged_at}>"
 
@@ -209,13 +279,47 @@ class Notification(db.Model):
     
     is_read = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    dedupe_key = db.Column(db.String(120))  # type:user:date, see notification_key()
 
     user = db.relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        # One notification per key: writers insert-or-ignore instead of checking first
+        db.Index("uq_notifications_dedupe_key", "dedupe_key", unique=True),
+        # The feed: unread then read, newest first, paged by (created_at, id)
+        db.Index("idx_notifications_feed", "user_id", "is_read", "created_at", "id"),
+    )
+
     def __repr__(self) -> str:
         return f"<Notification {self.title}>"
 
 
+class NotificationArchive(db.Model):
+    """Read notifications moved out of the hot table by `flask notifications-archive`."""
+
+    __tablename__ = "notifications_archive"
+
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False)  # its id in notifications
+    user_id = db.Column(db.Integer, ForeignKey("users.id"), nullable=False)
+    type = db.Column(db.String(50))
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text)
+    payload_json = db.Column(db.JSON)
+    scheduled_for = db.Column(db.DateTime)
+    is_read = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    dedupe_key = db.Column(db.String(120))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("idx_notifications_archive_user", "user_id", "created_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<NotificationArchive {self.title}>"
+
+
 class Order(db.Model):
     """Store order."""
 
@@ -248,7 +352,9 @@ class UserPlan(db.Model):
     frequency_per_week = db.Column(db.Integer)
     fitness_level = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    metadata_json = db.Column(db.JSON)  # For summary, break days list, etc.
+    metadata_json = db.Column(db.JSON)  # For summary, break days list, seed & generation rules
+    materialized_through = db.Column(db.Date)  # Last day with DailyPlanEntry rows; NULL = fully materialized
+    version = db.Column(db.Integer, default=1, nullable=False)  # Bumped when a day changes; part of the plan ETags
 
     daily_entries = db.relationship(
         "DailyPlanEntry",
@@ -270,7 +376,7 @@ class DailyPlanEntry(db.Model):
     plan_id = db.Column(db.Integer, ForeignKey("user_plans.id"), nullable=False, index=True)
     date = db.Column(db.Date, nullable=False)
     is_exercise_day = db.Column(db.Boolean, default=False)
-    exercise_payload = db.Column(db.JSON)  # List of exercises
+    exercise_payload = db.Column(db.JSON)  # [[exercise_id, phase, sets, reps], ...]
     diet_payload = db.Column(db.JSON)  # Macros, meals
     
     # Completion status
@@ -280,24 +386,134 @@ class DailyPlanEntry(db.Model):
     is_diet_completed = db.Column(db.Boolean, default=False)
     diet_completed_at = db.Column(db.DateTime)
 
-    streak_group = db.Column(db.Integer)  # Optimization for streak queries
+    # Workout streak run this day belongs to: date.toordinal() of the run's first
+    # day; NULL for missed days and days not judged yet. See streak_service.
+    streak_group = db.Column(db.Integer)
+
+    # Shared day contents; when set, exercise_payload/diet_payload are left empty
+    template_day_id = db.Column(db.Integer, ForeignKey("plan_template_days.id"), index=True)
 
     plan = db.relationship("UserPlan", back_populates="daily_entries")
+    template_day = db.relationship("PlanTemplateDay")
     checkins = db.relationship(
         "UserCheckIn",
         back_populates="daily_entry",
         cascade="all, delete-orphan",
         lazy="dynamic",
     )
+    exercises = db.relationship(
+        "PlanEntryExercise",
+        back_populates="daily_entry",
+        cascade="all, delete-orphan",
+        order_by="PlanEntryExercise.position",
+    )
 
     __table_args__ = (
         db.Index("idx_plan_date", "plan_id", "date"),
+        db.Index("idx_plan_streak_group", "plan_id", "streak_group"),
     )
 
     def __repr__(self) -> str:
         return f"<DailyPlanEntry {self.date} plan={self.plan_id}>"
 
 
+class PlanEntryExercise(db.Model):
+    """Exercise prescribed on a plan entry that carries its own payload (from before templates)."""
+
+    __tablename__ = "plan_entry_exercises"
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, ForeignKey("daily_plan_entries.id"), nullable=False)
+    exercise_id = db.Column(db.Integer, ForeignKey("exercises.id"), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    phase = db.Column(db.String(30))  # Warm-up, Main Workout, Finisher, Cool-down
+    sets = db.Column(db.Integer)
+    reps = db.Column(db.String(30))
+
+    daily_entry = db.relationship("DailyPlanEntry", back_populates="exercises")
+
+    __table_args__ = (
+        db.Index("idx_entry_exercise_position", "entry_id", "position"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PlanEntryExercise entry={self.entry_id} exercise={self.exercise_id}>"
+
+
+class PlanTemplate(db.Model):
+    """Plan day contents shared by every user with the same generation inputs."""
+
+    __tablename__ = "plan_templates"
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)  # sha256 of inputs_json
+    inputs_json = db.Column(db.JSON)  # goal, fitness_level, preference, equipment, version
+    seed = db.Column(db.Integer)
+    total_days = db.Column(db.Integer, default=30)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    days = db.relationship(
+        "PlanTemplateDay",
+        back_populates="template",
+        cascade="all, delete-orphan",
+        order_by="PlanTemplateDay.day_index",
+    )
+
+    def __repr__(self) -> str:
+        return f"<PlanTemplate {self.id} {self.content_hash[:8]}>"
+
+
+class PlanTemplateDay(db.Model):
+    """One day of a plan template."""
+
+    __tablename__ = "plan_template_days"
+
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, ForeignKey("plan_templates.id"), nullable=False)
+    day_index = db.Column(db.Integer, nullable=False)  # 0-based
+    is_exercise_day = db.Column(db.Boolean, default=False)
+    exercise_payload = db.Column(db.JSON)  # [[exercise_id, phase, sets, reps], ...]
+    diet_payload = db.Column(db.JSON)  # {"meals": {...}}; targets come from the user's plan
+
+    template = db.relationship("PlanTemplate", back_populates="days")
+    exercises = db.relationship(
+        "PlanTemplateExercise",
+        back_populates="template_day",
+        cascade="all, delete-orphan",
+        order_by="PlanTemplateExercise.position",
+    )
+
+    __table_args__ = (
+        db.UniqueConstraint("template_id", "day_index", name="uq_template_day"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PlanTemplateDay {self.day_index} template={self.template_id}>"
+
+
+class PlanTemplateExercise(db.Model):
+    """Exercise prescribed on a template day (normalized for analytics)."""
+
+    __tablename__ = "plan_template_exercises"
+
+    id = db.Column(db.Integer, primary_key=True)
+    template_day_id = db.Column(db.Integer, ForeignKey("plan_template_days.id"), nullable=False)
+    exercise_id = db.Column(db.Integer, ForeignKey("exercises.id"), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    phase = db.Column(db.String(30))
+    sets = db.Column(db.Integer)
+    reps = db.Column(db.String(30))
+
+    template_day = db.relationship("PlanTemplateDay", back_populates="exercises")
+
+    __table_args__ = (
+        db.Index("idx_template_exercise_position", "template_day_id", "position"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<PlanTemplateExercise day={self.template_day_id} exercise={self.exercise_id}>"
+
+
 class UserCheckIn(db.Model):
     """Log of user check-ins."""
 
@@ -312,5 +528,42 @@ class UserCheckIn(db.Model):
 
     daily_entry = db.relationship("DailyPlanEntry", back_populates="checkins")
 
+    __table_args__ = (
+        # One check-in per entry and type: repeats and re-synced offline check-ins are ignored
+        db.Index("uq_checkin_entry_type", "daily_entry_id", "type", unique=True),
+    )
+
     def __repr__(self) -> str:
         return f"<UserCheckIn {self.type} user={self.user_id}>"
+
+
+class Job(db.Model):
+    """Background job (e.g. plan generation), durable across restarts."""
+
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = db.Column(db.String(50), nullable=False)  # generate_plan
+    status = db.Column(db.String(20), default="queued", nullable=False)  # queued, running, done, failed
+    params_json = db.Column(db.JSON)
+    result_json = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # At most one queued/running job per user and kind: concurrent requests coalesce
+        db.Index(
+            "uq_jobs_active",
+            "user_id",
+            "kind",
+            unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id} {self.kind} {self.status}>"
@@ -1,76 +1,100 @@
+import json
+import queue
+import time
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_login import current_user, login_required
 from flask import current_app
-from models import UserPlan, DailyPlanEntry, UserCheckIn, Notification, WaterLog, SleepLog, User, UserProgress, db
-from services.plan_service import generate_month_plan
-from services.streak_service import compute_streaks
-from services.notification_service import schedule_tomorrow_plan_notification 
+from models import DailyPlanEntry, UserCheckIn, Notification, SleepLog, Job, db
+from services.job_service import enqueue_job
+from services.plan_service import bump_plan_version, entry_exercise_payload, entry_diet_payload, exercise_totals, plan_etag
+from services.read_models import PlanDay, plan_days
+from services.streak_service import record_checkin, streak_stats, streak_stats_etag
+from services.day_context import day_context
+from services.checkin_service import MAX_BATCH, apply_checkins, queue_checkin_effects
+from services.db_utils import insert_ignore
+from services.leaderboard_service import PERIODS, add_checkin_points, top_scores, user_standing
+from services.notification_service import (
+    decode_feed_cursor, latest_notification_id, notification_feed, notifications_after,
+    publish_unread, serialize_notification, unread_count,
+)
+from services.notification_bus import get_bus
 from services.diet_service import recommend_shopping
+from services.water_service import DAILY_GOAL_ML, MAX_LOG_ML, ROLLUP_PERIODS, log_water, water_rollups, water_today
+from services.workout_service import hydrate_exercises
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+def _conditional_json(etag: str, build):
+    """
+    JSON response validated by `etag`. When the client already holds it
+    (If-None-Match, compared weakly so proxies that re-encode and weaken
+    the tag still match) this is a bare 304 and `build` is never called.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # The browser may keep it, but must revalidate on every use
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 @api_bp.route("/plan/generate", methods=["POST"])
 @login_required
 def api_plan_generate():
     data = request.get_json(force=True, silent=True) or {}
     start_date = data.get("start_date")
     
-    plan = generate_month_plan(current_user, start_date)
+    # Runs on the background pool; repeat clicks join the job already in flight
+    job = enqueue_job(current_user.id, "generate_plan", {"start_date": start_date})
     
     return jsonify({
-        "status": "ok",
-        "plan_id": plan.id,
-        "message": "Plan generated successfully"
+        "status": job.status,
+        "job_id": job.id,
+        "message": "Plan generation started"
+    }), 202
+
+@api_bp.route("/jobs/<int:job_id>")
+@login_required
+def api_job_status(job_id):
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify({
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result_json,
+        "error": job.error
     })
 
 @api_bp.route("/plan/today")
 @login_required
 def api_plan_today():
-    today = datetime.utcnow().date()
+    ctx = day_context(current_user)
     
-    # Find active plan (end date >= today)
-    plan = UserPlan.query.filter(
-        UserPlan.user_id == current_user.id,
-        UserPlan.end_date >= today
-    ).order_by(UserPlan.created_at.desc()).first()
-    
-    if not plan:
+    # Active plan (end date >= today)
+    if not ctx.active_plan:
         return jsonify({"status": "no_plan"})
         
-    entry = DailyPlanEntry.query.filter_by(plan_id=plan.id, date=today).first()
+    entry = ctx.today_entry
     if not entry:
             return jsonify({"status": "no_entry_for_today"})
             
-    return jsonify({
+    # Payload columns are deferred on the shared entry: resolved only on a cache miss
+    return _conditional_json(plan_etag(ctx.active_plan, "today", ctx.today), lambda: {
         "status": "ok",
-        "entry": {
-            "id": entry.id,
-            "date": entry.date.isoformat(),
-            "is_exercise_day": entry.is_exercise_day,
-            "is_exercise_completed": entry.is_exercise_completed,
-            "is_diet_completed": entry.is_diet_completed,
-            "exercise_payload": entry.exercise_payload,
-            "diet_payload": entry.diet_payload
-        }
+        "entry": dict(
+            PlanDay.of(entry).to_dict(),
+            exercise_payload=hydrate_exercises(entry_exercise_payload(entry)),
+            diet_payload=entry_diet_payload(entry),
+        )
     })
 
 @api_bp.route("/plan/checkin", methods=["POST"])
 @login_required
 def api_plan_checkin():
-    # We need to manually import schedule_next_day_notifications if it wasn't migrated?
-    # Actually wait, `schedule_next_day_notifications` was in `utils.py`? 
-    # I saw `schedule_tomorrow_plan_notification` in `notification_service`.
-    # Let's check imports in `utils.py` previously... 
-    # The original code called `utils.schedule_next_day_notifications`.
-    # But in my read of `utils.py`, I saw `schedule_tomorrow_plan_notification`.
-    # Maybe I missed a rename? Or it was an alias?
-    # Checking `utils.py` (Step 58): line 589 is `schedule_tomorrow_plan_notification`
-    # Checking `app.py` (Step 59): line 380 `from utils import schedule_next_day_notifications`
-    # Something is mismatching. `utils.py` line 380 called `schedule_next_day_notifications`.
-    # But `utils.py` line 589 define `schedule_tomorrow_plan_notification`.
-    # I'll use `schedule_tomorrow_plan_notification` which I migrated.
-    
+    # One transaction: the entry, today's streak, the check-in log and the plan's ETag.
+    # The tomorrow's-plan notification, badges and any late-day rescan follow it in the background.
     data = request.get_json()
     entry_id = data.get("entry_id")
     checkin_type = data.get("type") # exercise, diet
@@ -88,100 +112,98 @@ def api_plan_checkin():
         entry.is_diet_completed = True
         entry.diet_completed_at = datetime.utcnow()
         current_user.last_diet_date = datetime.utcnow().date()
+    
+    streaks = None
+    if checkin_type in ("exercise", "diet"):
+        streaks = record_checkin(current_user, entry, "workout" if checkin_type == "exercise" else "diet")
+        bump_plan_version(entry.plan_id)
         
-    # Log check-in
-    checkin = UserCheckIn(
-        user_id=current_user.id,
-        daily_entry_id=entry.id,
-        type=checkin_type,
-        note=data.get("note")
-    )
-    db.session.add(checkin)
+    # Log check-in (once per entry and type); only a new one scores on the leaderboards
+    logged = insert_ignore(UserCheckIn, [{
+        "user_id": current_user.id,
+        "daily_entry_id": entry.id,
+        "type": checkin_type,
+        "timestamp": datetime.utcnow(),
+        "note": data.get("note")
+    }], conflict=("daily_entry_id", "type"), returning=(UserCheckIn.type,))
+    add_checkin_points(current_user.id, [(logged_type, entry.date) for (logged_type,) in logged])
+    
+    late = entry.date < datetime.utcnow().date()
+    queue_checkin_effects(current_user.id, *(("streaks",) if late else ()), "tomorrow_plan", "badges")
     db.session.commit()
     
-    # Trigger updates
-    schedule_tomorrow_plan_notification(current_user)
-    streaks = compute_streaks(current_user.id, entry.plan_id)
+    if streaks is None:
+        streaks = day_context(current_user).refresh_streaks()
     
     return jsonify({
         "status": "ok",
         "streaks": streaks
     })
 
+@api_bp.route("/plan/checkins:batch", methods=["POST"])
+@login_required
+def api_plan_checkins_batch():
+    """
+    Sync check-ins queued offline: {"checkins": [{entry_id, type, note,
+    client_ts}, ...]}. Applied in one transaction; repeats are reported as
+    duplicates rather than counted again.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("checkins")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({"error": "checkins must be a list of objects"}), 400
+    if len(items) > MAX_BATCH:
+        return jsonify({"error": f"At most {MAX_BATCH} check-ins per batch"}), 400
+    
+    result = apply_checkins(current_user, items)
+    if result["streaks"] is None:
+        result["streaks"] = day_context(current_user).refresh_streaks()
+    return jsonify(dict(result, status="ok"))
+
 @api_bp.route("/plan/calendar")
 @login_required
 def api_plan_calendar():
-    # Get active plan
-    today = datetime.utcnow().date()
-    plan = UserPlan.query.filter(
-        UserPlan.user_id == current_user.id
-    ).order_by(UserPlan.created_at.desc()).first()
+    # Get latest plan
+    ctx = day_context(current_user)
+    today = ctx.today
+    plan = ctx.plan
     
     if not plan:
             return jsonify([])
             
-    entries = DailyPlanEntry.query.filter_by(plan_id=plan.id).all()
-    
-    result = []
-    for e in entries:
-        # Determine status color/state for frontend
-        status = "future"
-        if e.date < today:
-            if (e.is_exercise_day and e.is_exercise_completed and e.is_diet_completed) or \
-                (not e.is_exercise_day and e.is_diet_completed):
-                status = "completed"
-            else:
-                status = "missed"
-        elif e.date == today:
-             if (e.is_exercise_day and e.is_exercise_completed and e.is_diet_completed) or \
-                (not e.is_exercise_day and e.is_diet_completed):
-                 status = "completed"
-             else:
-                 status = "today"
-        
-        result.append({
-            "date": e.date.isoformat(),
-            "is_exercise_day": e.is_exercise_day,
-            "is_exercise_completed": e.is_exercise_completed,
-            "is_diet_completed": e.is_diet_completed,
-            "status": status
-        })
-        
-    return jsonify(result)
+    # Status color/state for frontend: future, completed, missed or today
+    return _conditional_json(plan_etag(plan, "calendar", today), lambda: [
+        dict(day.to_dict(), status=day.status(today)) for day in plan_days(plan)
+    ])
 
 @api_bp.route("/plan/stats")
 @login_required
 def api_plan_stats():
-    today = datetime.utcnow().date()
-    plan = UserPlan.query.filter(
-        UserPlan.user_id == current_user.id,
-        UserPlan.end_date >= today
-    ).order_by(UserPlan.created_at.desc()).first()
-    
-    if not plan:
-        return jsonify({"current_streak": 0, "longest_streak": 0})
-        
-    streaks = compute_streaks(current_user.id, plan.id)
-    return jsonify(streaks)
+    # Streak history spans every plan the user has had, not just the active one
+    return _conditional_json(streak_stats_etag(current_user), lambda: streak_stats(current_user))
+
+@api_bp.route("/plan/exercises")
+@login_required
+def api_plan_exercises():
+    # Most completed exercises across every plan; ?limit= up to 50
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    return jsonify(exercise_totals(current_user.id, limit))
 
 @api_bp.route("/notifications")
 @login_required
 def api_notifications():
-    # Unread first, then recent read
-    notifs = Notification.query.filter_by(user_id=current_user.id).order_by(
-        Notification.is_read.asc(),
-        Notification.created_at.desc()
-    ).limit(20).all()
-    
-    return jsonify([{
-        "id": n.id,
-        "title": n.title,
-        "message": n.message,
-        "type": n.type,
-        "is_read": n.is_read,
-        "created_at": n.created_at.strftime("%Y-%m-%d %H:%M"),
-        "payload": n.payload_json
-    } for n in notifs])
+    # Unread first, then recent read; further pages via ?before=<X-Next-Cursor>
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    try:
+        before = decode_feed_cursor(request.args.get("before"))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    notifs, next_cursor = notification_feed(current_user.id, before, limit)
+    
+    response = jsonify([serialize_notification(n) for n in notifs])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
 
 @api_bp.route("/notifications/read", methods=["POST"])
 @login_required
@@ -198,9 +220,75 @@ def api_notifications_read():
         # Mark all as read
         Notification.query.filter_by(user_id=current_user.id, is_read=False).update({"is_read": True})
         db.session.commit()
+    
+    # Keep the badge in step on the user's other tabs
+    publish_unread(current_user.id)
         
     return jsonify({"status": "ok"})
 
+def _sse(event: str, data, event_id=None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+@api_bp.route("/notifications/stream")
+@login_required
+def api_notifications_stream():
+    """
+    Server-Sent Events: `notification` events as they are created and
+    `unread` counts, with a comment heartbeat. The stream closes after
+    NOTIFICATION_STREAM_SECONDS and the browser reconnects with Last-Event-ID,
+    which also picks up anything the bus didn't carry (e.g. notifications
+    from the scheduler process when there is no cross-worker backend).
+    Off unless NOTIFICATION_STREAM_ENABLED: a sync worker would be pinned.
+    """
+    if not current_app.config.get("NOTIFICATION_STREAM_ENABLED"):
+        return jsonify({"error": "Notification stream is disabled"}), 404
+    user_id = current_user.id
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    heartbeat = current_app.config.get("NOTIFICATION_STREAM_HEARTBEAT", 15)
+    lifetime = current_app.config.get("NOTIFICATION_STREAM_SECONDS", 300)
+    bus = get_bus()
+
+    def events():
+        nonlocal last_id
+        # Subscribe before catching up so nothing created in between is missed
+        subscription = bus.subscribe(user_id)
+        try:
+            yield "retry: 5000\n\n"
+            if last_id is None:
+                last_id = latest_notification_id(user_id)
+            else:
+                for row in notifications_after(user_id, last_id):
+                    last_id = row.id
+                    yield _sse("notification", serialize_notification(row), row.id)
+            yield _sse("unread", {"unread": unread_count(user_id)})
+            db.session.remove()  # Don't hold a pooled connection while idle
+
+            deadline = time.monotonic() + lifetime
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if event["event"] == "notification":
+                    if event["id"] <= last_id:
+                        continue
+                    last_id = event["id"]
+                yield _sse(event["event"], event["data"], event.get("id"))
+                if event["event"] == "notification":
+                    yield _sse("unread", {"unread": unread_count(user_id)})
+                    db.session.remove()
+        finally:
+            bus.unsubscribe(user_id, subscription)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @api_bp.route("/shop/recommend")
 @login_required
 def api_shop_recommend():
@@ -212,12 +300,28 @@ def api_shop_recommend():
 def api_water_log():
     data = request.get_json(silent=True) or {}
     amount = data.get("amount", 250)
+    if isinstance(amount, bool) or not isinstance(amount, int) or not 0 < amount <= MAX_LOG_ML:
+        return jsonify({"error": f"amount must be 1-{MAX_LOG_ML} ml"}), 400
     
-    log = WaterLog(user_id=current_user.id, amount_ml=amount, date=datetime.utcnow().date())
-    db.session.add(log)
-    db.session.commit()
+    total = log_water(current_user.id, amount)
+    
+    return jsonify({"status": "ok", "added": amount, "total": total})
+
+@api_bp.route("/water/summary")
+@login_required
+def api_water_summary():
+    # Hydration charts: today's total plus ?period=week|month rollups, ?count of them
+    period = request.args.get("period", "week")
+    if period not in ROLLUP_PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(ROLLUP_PERIODS)}"}), 400
+    count = max(1, min(request.args.get("count", 8, type=int), 24))
     
-    return jsonify({"status": "ok", "added": amount})
+    return jsonify({
+        "today": water_today(current_user.id),
+        "goal": DAILY_GOAL_ML,
+        "period": period,
+        "rollups": water_rollups(current_user.id, period, count),
+    })
 
 @api_bp.route("/sleep/log", methods=["POST"])
 @login_required
@@ -234,14 +338,14 @@ def api_sleep_log():
 @api_bp.route("/leaderboard")
 @login_required
 def api_leaderboard():
-    # Mock leaderboard
-    top_users = db.session.query(
-        User.fullname, db.func.count(UserProgress.id).label('score')
-    ).join(UserProgress).group_by(User.id).order_by(db.desc('score')).limit(5).all()
+    # Check-ins this week (?period=week) or ever (?period=all), read from the maintained boards
+    period = request.args.get("period", "week")
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(PERIODS)}"}), 400
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
     
-    leaderboard = [{"name": u.fullname, "score": u.score, "metric": "Check-ins"} for u in top_users]
+    top = top_scores(period, limit)
+    for row in top:
+        row["is_me"] = row.pop("user_id") == current_user.id
     
-    if not leaderboard:
-        leaderboard = [{"name": "Admin User", "score": 42, "metric": "Workouts"}, {"name": "Bot One", "score": 30, "metric": "Workouts"}]
-        
-    return jsonify(leaderboard)
+    return jsonify({"period": period, "top": top, "me": user_standing(current_user.id, period)})
@@ -1,11 +1,13 @@
 from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, session, jsonify, request, flash
 from flask_login import current_user, login_required
-from models import UserProgress, WaterLog, SleepLog, Product, UserPlan, DailyPlanEntry, db
-from services.workout_service import recommend_workout, get_equipment_for_workout
+from models import UserProgress, SleepLog, Product, db
+from services.workout_service import recommend_workout_for_user, get_equipment_for_workout, hydrate_exercises
 from services.diet_service import recommend_diet, generate_weekly_mealplan
-from services.notification_service import check_notifications_engine
-from services.streak_service import compute_streaks
+from services.day_context import day_context
+from services.plan_service import entry_exercise_payload
+from services.read_models import plan_days
+from services.water_service import DAILY_GOAL_ML, water_today
 
 core_bp = Blueprint('core', __name__)
 
@@ -39,18 +41,15 @@ def dashboard():
     chart_labels = []
     chart_values = []
     
-    today = datetime.utcnow().date()
-    # 0. Fetch Active Plan Entry for Today
-    active_plan = UserPlan.query.filter_by(user_id=current_user.id).order_by(UserPlan.created_at.desc()).first()
-    today_entry = None
-    if active_plan:
-            today_entry = DailyPlanEntry.query.filter_by(plan_id=active_plan.id, date=today).first()
+    # 0. Fetch Latest Plan Entry for Today (shared with the notification engine below)
+    ctx = day_context(current_user)
+    today_entry = ctx.today_entry
             
     try:
         # 1. Today's Workout Snippet
         if today_entry:
             if today_entry.is_exercise_day:
-                ex_list = today_entry.exercise_payload or []
+                ex_list = hydrate_exercises(entry_exercise_payload(today_entry))
                 workout = {
                     "frequency": current_user.freq_per_week,
                     "exercises": ex_list[:3] if ex_list else [],
@@ -71,7 +70,7 @@ def dashboard():
                 full_workout = {"exercises": []}
         else:
             # Fallback
-            full_workout = recommend_workout(current_user.goal, current_user.fitness_level, current_user.freq_per_week or 3)
+            full_workout = recommend_workout_for_user(current_user)
             workout = {
                 "frequency": full_workout.get("frequency"),
                 "exercises": full_workout.get("exercises", [])[:3], 
@@ -83,19 +82,11 @@ def dashboard():
         diet = recommend_diet(current_user.weight_kg, current_user.target_weight_kg, current_user.goal)
         
         # 3. Gamification & Streaks (Needed for Dashboard Summary)
-        check_notifications_engine(current_user)
-        
-        # Force recalculate streak to ensure it's up to date (especially after fixes)
-        # We need the plan_id.
-        latest_plan = UserPlan.query.filter_by(user_id=current_user.id).order_by(UserPlan.created_at.desc()).first()
-        if latest_plan:
-             compute_streaks(current_user.id, latest_plan.id)
-        
-        # Refresh user instance to get updated values
-        db.session.refresh(current_user)
-        
-        workout_streak = current_user.workout_streak
-        diet_streak = current_user.diet_streak
+        # Notifications are created by `flask notifications-run`, not on page load
+        # Streaks are kept up to date on check-in; this only reads the columns
+        streaks = ctx.streaks
+        workout_streak = streaks["workout"]
+        diet_streak = streaks["diet"]
         
         # 4. Chart Data (Last 7 entries)
         progress_logs = (
@@ -134,7 +125,7 @@ def dashboard():
 @core_bp.route("/workout")
 @login_required
 def workout_page():
-    workout = recommend_workout(current_user.goal, current_user.fitness_level, current_user.freq_per_week or 3)
+    workout = recommend_workout_for_user(current_user)
     equipment = get_equipment_for_workout(workout.get("exercises", []))
     return render_template("workout.html", workout=workout, equipment=equipment)
 
@@ -153,23 +144,20 @@ def diet_page():
 @core_bp.route("/progress")
 @login_required
 def progress_page():
-    # Fetch detailed progress data
+    # Fetch detailed progress data (just the two charted columns)
     progress_logs = (
-        UserProgress.query.filter_by(user_id=current_user.id)
+        db.session.query(UserProgress.logged_at, UserProgress.weight)
+        .filter(UserProgress.user_id == current_user.id)
         .order_by(UserProgress.logged_at.asc())
         .all()
     )
-    progress_labels = [log.logged_at.strftime("%Y-%m-%d") for log in progress_logs]
-    progress_values = [log.weight for log in progress_logs]
+    progress_labels = [logged_at.strftime("%Y-%m-%d") for logged_at, _ in progress_logs]
+    progress_values = [weight for _, weight in progress_logs]
     
     # 2. Lifestyle Data (Moved from Dashboard)
     today_date = datetime.utcnow().date()
-    water_logs = WaterLog.query.filter(
-        WaterLog.user_id == current_user.id,
-        WaterLog.date == today_date
-    ).all()
-    hydration_current = sum(log.amount_ml for log in water_logs)
-    hydration_goal = 3000 
+    hydration_current = water_today(current_user.id, today_date)
+    hydration_goal = DAILY_GOAL_ML
     
     sleep_log = SleepLog.query.filter(
         SleepLog.user_id == current_user.id,
@@ -178,11 +166,8 @@ def progress_page():
     sleep_data = {"hours": sleep_log.hours if sleep_log else 0, "quality": sleep_log.quality if sleep_log else "-"}
 
     # 3. Calendar Check-In History
-    from models import UserPlan, DailyPlanEntry
-    active_plan = UserPlan.query.filter_by(user_id=current_user.id).order_by(UserPlan.created_at.desc()).first()
-    calendar_entries = []
-    if active_plan:
-        calendar_entries = DailyPlanEntry.query.filter_by(plan_id=active_plan.id).order_by(DailyPlanEntry.date.asc()).all()
+    active_plan = day_context(current_user).plan
+    calendar_entries = plan_days(active_plan) if active_plan else []
     
     return render_template(
         "progress.html", 
@@ -217,12 +202,19 @@ def admin():
         flash("Admin access required", "warning")
         return redirect(url_for("core.dashboard"))
     from models import DietPlan, Exercise
-    exercises = Exercise.query.all()
+    from services.exercise_catalog import query_exercises_by_tags
+    # ?tag=a,b&exclude_tag=c narrow the exercise list
+    include, exclude = (
+        [tag for value in request.args.getlist(arg) for tag in value.split(",") if tag.strip()]
+        for arg in ("tag", "exclude_tag")
+    )
+    exercises = query_exercises_by_tags(include, exclude).order_by(Exercise.name).all()
     diet_plans = DietPlan.query.all()
     products = Product.query.all()
     return render_template(
         "admin.html",
         exercises=exercises,
+        tag_filter={"tag": include, "exclude_tag": exclude},
         diet_plans=diet_plans,
         products=products,
     )
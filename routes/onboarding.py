@@ -2,6 +2,8 @@ from typing import Dict, Any
 from flask import Blueprint, render_template, redirect, url_for, request, jsonify
 from flask_login import current_user, login_required
 from models import db
+from services.workout_service import invalidate_user_routines
+from services.notification_scheduler import valid_timezone
 
 onboarding_bp = Blueprint('onboarding', __name__)
 
@@ -10,6 +12,7 @@ def goal():
     if request.method == "POST" and current_user.is_authenticated:
         current_user.goal = request.form.get("goal")
         db.session.commit()
+        invalidate_user_routines(current_user.id)
         return redirect(url_for("onboarding.body_type"))
     return render_template("goal_select.html")
 
@@ -18,6 +21,7 @@ def body_type():
     if request.method == "POST" and current_user.is_authenticated:
         current_user.body_level = request.form.get("body_type")
         db.session.commit()
+        invalidate_user_routines(current_user.id)
         return redirect(url_for("onboarding.measurements"))
     return render_template("body_type.html")
 
@@ -28,6 +32,7 @@ def measurements():
         current_user.weight_kg = request.form.get("weight_kg") or current_user.weight_kg
         current_user.target_weight_kg = request.form.get("target_weight_kg") or current_user.target_weight_kg
         db.session.commit()
+        invalidate_user_routines(current_user.id)
         return redirect(url_for("onboarding.activity"))
     return render_template("measurements.html")
 
@@ -37,19 +42,21 @@ def activity():
         current_user.activity_level = request.form.get("activity_level")
         current_user.freq_per_week = request.form.get("freq_per_week") or current_user.freq_per_week
         db.session.commit()
+        invalidate_user_routines(current_user.id)
         return redirect(url_for("onboarding.fitness_level"))
     return render_template("activity.html")
 
-from services.plan_service import generate_month_plan
+from services.job_service import enqueue_job
 
 @onboarding_bp.route("/fitness-level", methods=["GET", "POST"])
 def fitness_level():
     if request.method == "POST" and current_user.is_authenticated:
         current_user.fitness_level = request.form.get("fitness_level")
         db.session.commit()
+        invalidate_user_routines(current_user.id)
         
-        # Generate 30-Day Premium Plan
-        generate_month_plan(current_user)
+        # Generate 30-Day Premium Plan in the background
+        enqueue_job(current_user.id, "generate_plan")
         
         return redirect(url_for("core.dashboard"))
     return render_template("fitness_level.html")
@@ -69,5 +76,8 @@ def api_onboard():
     for field in ["height_cm", "weight_kg", "target_weight_kg", "freq_per_week"]:
         if field in data:
             setattr(current_user, field, data[field])
+    if valid_timezone(data.get("timezone")):
+        current_user.timezone = valid_timezone(data["timezone"])
     db.session.commit()
+    invalidate_user_routines(current_user.id)
     return jsonify({"status": "ok"})
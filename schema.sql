@@ -18,15 +18,19 @@ CREATE TABLE IF NOT EXISTS users (
     goal VARCHAR(100),
     estimate_days INTEGER,
     last_check_date TIMESTAMP,
+    timezone VARCHAR(64) DEFAULT 'UTC',
     created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL,
     workout_streak INTEGER DEFAULT 0,
     diet_streak INTEGER DEFAULT 0,
     last_workout_date DATE,
     last_diet_date DATE,
+    workout_streak_through DATE,
+    diet_streak_through DATE,
     is_admin BOOLEAN DEFAULT FALSE NOT NULL
 );
 
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_timezone ON users(timezone);
 
 -- Diet Plans Table
 CREATE TABLE IF NOT EXISTS diet_plans (
@@ -69,6 +73,15 @@ CREATE TABLE IF NOT EXISTS exercises (
     tags VARCHAR(200)
 );
 
+-- Exercise Tags Table (normalized Exercise.tags)
+CREATE TABLE IF NOT EXISTS exercise_tags (
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    tag VARCHAR(50) NOT NULL,
+    PRIMARY KEY (exercise_id, tag)
+);
+
+CREATE INDEX IF NOT EXISTS idx_exercise_tags_tag ON exercise_tags(tag, exercise_id);
+
 -- Water Logs Table
 CREATE TABLE IF NOT EXISTS water_logs (
     id SERIAL PRIMARY KEY,
@@ -79,6 +92,29 @@ CREATE TABLE IF NOT EXISTS water_logs (
 );
 
 CREATE INDEX IF NOT EXISTS idx_water_logs_user_id ON water_logs(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_water_logs_user_date ON water_logs(user_id, date);
+
+-- Water Rollups Table (weekly and monthly totals of water_logs)
+CREATE TABLE IF NOT EXISTS water_rollups (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period VARCHAR(10) NOT NULL,
+    period_start DATE NOT NULL,
+    total_ml INTEGER DEFAULT 0 NOT NULL,
+    days_logged INTEGER DEFAULT 0 NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, period, period_start)
+);
+
+-- Leaderboard Scores Table (check-ins per user, all-time and per week)
+CREATE TABLE IF NOT EXISTS leaderboard_scores (
+    board VARCHAR(20) NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    score INTEGER DEFAULT 0 NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (board, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_rank ON leaderboard_scores(board, score, user_id);
 
 -- Sleep Logs Table
 CREATE TABLE IF NOT EXISTS sleep_logs (
@@ -108,6 +144,8 @@ CREATE TABLE IF NOT EXISTS user_badges (
     earned_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_badges ON user_badges(user_id, badge_id);
+
 -- User Progress Table
 CREATE TABLE IF NOT EXISTS user_progress (
     id SERIAL PRIMARY KEY,
@@ -116,6 +154,8 @@ CREATE TABLE IF NOT EXISTS user_progress (
     logged_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS idx_user_progress_user_logged ON user_progress(user_id, logged_at);
+
 -- Notifications Table
 CREATE TABLE IF NOT EXISTS notifications (
     id SERIAL PRIMARY KEY,
@@ -126,10 +166,31 @@ CREATE TABLE IF NOT EXISTS notifications (
     payload_json JSON,
     scheduled_for TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
     is_read BOOLEAN DEFAULT FALSE NOT NULL,
-    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL,
+    dedupe_key VARCHAR(120)
 );
 
 CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_dedupe_key ON notifications(dedupe_key);
+CREATE INDEX IF NOT EXISTS idx_notifications_feed ON notifications(user_id, is_read, created_at, id);
+
+-- Read notifications archived out of the hot table
+CREATE TABLE IF NOT EXISTS notifications_archive (
+    id SERIAL PRIMARY KEY,
+    notification_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    type VARCHAR(50),
+    title VARCHAR(200) NOT NULL,
+    message TEXT,
+    payload_json JSON,
+    scheduled_for TIMESTAMP WITHOUT TIME ZONE,
+    is_read BOOLEAN DEFAULT TRUE NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    dedupe_key VARCHAR(120),
+    archived_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_archive_user ON notifications_archive(user_id, created_at);
 
 -- Orders Table
 CREATE TABLE IF NOT EXISTS orders (
@@ -154,11 +215,45 @@ CREATE TABLE IF NOT EXISTS user_plans (
     frequency_per_week INTEGER,
     fitness_level VARCHAR(50),
     created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
-    metadata_json JSON
+    metadata_json JSON,
+    materialized_through DATE,
+    version INTEGER DEFAULT 1 NOT NULL
 );
 
 CREATE INDEX IF NOT EXISTS idx_user_plans_user_id ON user_plans(user_id);
 
+-- Plan Templates (day contents shared across users with identical inputs)
+CREATE TABLE IF NOT EXISTS plan_templates (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL UNIQUE,
+    inputs_json JSON,
+    seed INTEGER,
+    total_days INTEGER DEFAULT 30,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS plan_template_days (
+    id SERIAL PRIMARY KEY,
+    template_id INTEGER NOT NULL REFERENCES plan_templates(id) ON DELETE CASCADE,
+    day_index INTEGER NOT NULL,
+    is_exercise_day BOOLEAN DEFAULT FALSE,
+    exercise_payload JSON,
+    diet_payload JSON,
+    CONSTRAINT uq_template_day UNIQUE (template_id, day_index)
+);
+
+CREATE TABLE IF NOT EXISTS plan_template_exercises (
+    id SERIAL PRIMARY KEY,
+    template_day_id INTEGER NOT NULL REFERENCES plan_template_days(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id),
+    position INTEGER NOT NULL,
+    phase VARCHAR(30),
+    sets INTEGER,
+    reps VARCHAR(30)
+);
+
+CREATE INDEX IF NOT EXISTS idx_template_exercise_position ON plan_template_exercises(template_day_id, position);
+
 -- Daily Plan Entries Table
 CREATE TABLE IF NOT EXISTS daily_plan_entries (
     id SERIAL PRIMARY KEY,
@@ -171,10 +266,27 @@ CREATE TABLE IF NOT EXISTS daily_plan_entries (
     exercise_completed_at TIMESTAMP WITHOUT TIME ZONE,
     is_diet_completed BOOLEAN DEFAULT FALSE,
     diet_completed_at TIMESTAMP WITHOUT TIME ZONE,
-    streak_group INTEGER
+    streak_group INTEGER,
+    template_day_id INTEGER REFERENCES plan_template_days(id)
 );
 
 CREATE INDEX IF NOT EXISTS idx_plan_date ON daily_plan_entries(plan_id, date);
+CREATE INDEX IF NOT EXISTS idx_plan_streak_group ON daily_plan_entries(plan_id, streak_group);
+CREATE INDEX IF NOT EXISTS idx_daily_plan_entries_template_day_id ON daily_plan_entries(template_day_id);
+
+-- Plan Entry Exercises Table (normalized exercise_payload, for analytics)
+CREATE TABLE IF NOT EXISTS plan_entry_exercises (
+    id SERIAL PRIMARY KEY,
+    entry_id INTEGER NOT NULL REFERENCES daily_plan_entries(id) ON DELETE CASCADE,
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id),
+    position INTEGER NOT NULL,
+    phase VARCHAR(30),
+    sets INTEGER,
+    reps VARCHAR(30)
+);
+
+CREATE INDEX IF NOT EXISTS idx_entry_exercise_position ON plan_entry_exercises(entry_id, position);
+CREATE INDEX IF NOT EXISTS idx_plan_entry_exercises_exercise_id ON plan_entry_exercises(exercise_id);
 
 -- User Check-Ins Table
 CREATE TABLE IF NOT EXISTS user_checkins (
@@ -187,3 +299,21 @@ CREATE TABLE IF NOT EXISTS user_checkins (
 );
 
 CREATE INDEX IF NOT EXISTS idx_user_checkins_user_id ON user_checkins(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_checkin_entry_type ON user_checkins(daily_entry_id, type);
+
+-- Jobs Table (background plan generation)
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(50) NOT NULL,
+    status VARCHAR(20) DEFAULT 'queued' NOT NULL,
+    params_json JSON,
+    result_json JSON,
+    error TEXT,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW() NOT NULL,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs(user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_active ON jobs(user_id, kind) WHERE status IN ('queued', 'running');
@@ -6,6 +6,7 @@ from werkzeug.security import generate_password_hash
 
 from app import create_app
 from models import DietPlan, Exercise, Product, User, UserProgress, Notification, db
+from services.exercise_catalog import catalog, set_exercise_tags, sync_exercise_tags
 
 
 def seed_exercises():
@@ -68,22 +69,25 @@ def seed_exercises():
         {"name": "Chest Stretch", "tags": "stretch,cooldown", "muscle_group": "Chest", "equipment": "Bodyweight", "difficulty": "Beginner"},
     ]
     
+    existing_names = {name for (name,) in db.session.query(Exercise.name)}
     for ex in exercises:
-        if not Exercise.query.filter_by(name=ex["name"]).first():
+        if ex["name"] not in existing_names:
             new_ex = Exercise(
                 name=ex["name"],
                 muscle_group=ex["muscle_group"],
                 difficulty=ex["difficulty"],
                 equipment=ex["equipment"],
                 description=f"Perform {ex['name']} with proper form.",
-                tags=ex["tags"],
                 animation_type="lottie",
                 animation_url="https://assets.lottiefiles.com/packages/lf20_9xRkZk.json", # Placeholder
                 thumbnail_url=f"https://placehold.co/400x300?text={ex['name'].replace(' ', '+')}"
             )
+            set_exercise_tags(new_ex, ex["tags"].split(","))
             db.session.add(new_ex)
     
     db.session.commit()
+    sync_exercise_tags() # Backfill tag rows for exercises seeded before exercise_tags existed
+    catalog.invalidate()
     print("[SUCCESS] Comprehensive exercise library seeded.")
 
 
@@ -0,0 +1,72 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+from flask import Flask, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db
+
+# Background Executor
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _get_executor(app: Flask) -> ThreadPoolExecutor:
+    # Created lazily so each gunicorn worker gets its own pool after fork
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config.get("BACKGROUND_WORKERS", 2),
+                    thread_name_prefix="gymsphere-bg",
+                )
+    return _executor
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """Run `fn` on the in-process worker pool inside an app context."""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                logger.exception("Background task %s failed", fn.__name__)
+                raise
+
+    return _get_executor(app).submit(run)
+
+
+def after_commit(fn: Callable, *args) -> None:
+    """
+    Call `fn(*args)` once the current db.session transaction commits, in
+    registration order; dropped if it rolls back. The transaction is over by
+    then, so `fn` should hand database work to submit() rather than do it.
+    """
+    session = db.session()
+    if not session.in_transaction():
+        session.begin()  # So a rollback before any SQL still drops `fn`
+    session.info.setdefault("after_commit", []).append((fn, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for fn, args in session.info.pop("after_commit", []):
+        try:
+            fn(*args)
+        except Exception:
+            # The commit stands; don't fail the caller or skip later callbacks
+            logger.exception("After-commit callback %s failed", fn.__name__)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_after_commit(session: Session, transaction) -> None:
+    # Runs after _run_after_commit on commit, so anything left was rolled back or closed
+    if transaction.parent is None:
+        session.info.pop("after_commit", None)
@@ -0,0 +1,103 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import exists, func, or_, select
+from models import Badge, DailyPlanEntry, UserBadge, UserCheckIn, User, UserPlan, WaterLog, db
+from services.db_utils import insert_ignore
+from services.notification_scheduler import user_zone
+
+# Badge Service
+
+def _joined(user: User, criteria: Dict, today: date) -> bool:
+    return True
+
+
+def _streak(user: User, criteria: Dict, today: date) -> bool:
+    streak = user.diet_streak if criteria.get("kind") == "diet" else user.workout_streak
+    return (streak or 0) >= criteria.get("value", 0)
+
+
+def _early_workout(user: User, criteria: Dict, today: date) -> bool:
+    """A workout checked in before criteria["hour"] on the user's clock, yesterday or today."""
+    zone = user_zone(user.timezone)
+    since = datetime.combine(today - timedelta(days=1), datetime.min.time())
+    stamps = db.session.scalars(
+        select(UserCheckIn.timestamp).where(
+            UserCheckIn.user_id == user.id, UserCheckIn.type == "exercise", UserCheckIn.timestamp >= since,
+        )
+    )
+    hour = criteria.get("hour", 8)
+    return any(ts.replace(tzinfo=timezone.utc).astimezone(zone).hour < hour for ts in stamps)
+
+
+def _plan_complete(user: User, criteria: Dict, today: date) -> bool:
+    """A finished plan (for criteria["goal"], if given) with every exercise day done."""
+    missed = exists().where(
+        DailyPlanEntry.plan_id == UserPlan.id,
+        DailyPlanEntry.is_exercise_day.is_(True),
+        DailyPlanEntry.is_exercise_completed.isnot(True),
+    )
+    query = select(UserPlan.id).where(
+        UserPlan.user_id == user.id,
+        UserPlan.end_date <= today,
+        or_(UserPlan.materialized_through.is_(None), UserPlan.materialized_through >= UserPlan.end_date),
+        ~missed,
+    )
+    if criteria.get("goal"):
+        query = query.where(UserPlan.goal == criteria["goal"])
+    return db.session.scalar(query.limit(1)) is not None
+
+
+def _water_streak(user: User, criteria: Dict, today: date) -> bool:
+    """Water logged on criteria["value"] consecutive days, ending today or yesterday."""
+    days = criteria.get("value", 1)
+    logged = set(db.session.scalars(
+        select(WaterLog.date).where(
+            WaterLog.user_id == user.id, WaterLog.amount_ml > 0,
+            WaterLog.date.between(today - timedelta(days=days), today),
+        )
+    ))
+    return any(
+        all(end - timedelta(days=i) in logged for i in range(days))
+        for end in (today, today - timedelta(days=1))
+    )
+
+
+# criteria_json["type"] -> rule(user, criteria, today); badges of other types are never awarded
+BADGE_RULES: Dict[str, Callable[[User, Dict, date], bool]] = {
+    "join": _joined,
+    "streak": _streak,
+    "time": _early_workout,
+    "plan_complete": _plan_complete,
+    "water_streak": _water_streak,
+}
+
+
+def award_badges(user: User, today: Optional[date] = None) -> List[str]:
+    """
+    Check the badges the user hasn't earned yet against their criteria and
+    award the ones now met. Safe to run concurrently: uq_user_badges keeps
+    one row per user and badge. Returns the names awarded; commits.
+    """
+    today = today or datetime.utcnow().date()
+    earned = select(UserBadge.badge_id).where(UserBadge.user_id == user.id)
+    won = []
+    for badge in Badge.query.filter(Badge.id.not_in(earned)).all():
+        criteria = badge.criteria_json or {}
+        rule = BADGE_RULES.get(criteria.get("type"))
+        if rule and rule(user, criteria, today):
+            won.append(badge)
+    if won:
+        now = datetime.utcnow()
+        insert_ignore(UserBadge, [
+            {"user_id": user.id, "badge_id": badge.id, "earned_at": now} for badge in won
+        ], conflict=("user_id", "badge_id"))
+        db.session.commit()
+    return [badge.name for badge in won]
+
+
+def collapse_duplicate_badges() -> int:
+    """Keep the first award per (user, badge) so uq_user_badges can be built. Returns rows removed."""
+    first_ids = select(func.min(UserBadge.id)).group_by(UserBadge.user_id, UserBadge.badge_id)
+    removed = UserBadge.query.filter(UserBadge.id.not_in(first_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
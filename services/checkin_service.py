@@ -0,0 +1,181 @@
+import logging
+import threading
+from datetime import date, datetime, time, timezone
+from typing import Dict, List, Set
+from sqlalchemy import func, select
+from models import DailyPlanEntry, User, UserCheckIn, UserPlan, db
+from services import background
+from services.badge_service import award_badges
+from services.db_utils import insert_ignore
+from services.leaderboard_service import add_checkin_points
+from services.plan_service import bump_plan_version
+from services.streak_service import record_checkin, rescan_streaks
+from services.notification_service import NotificationBatch, schedule_tomorrow_plan_notification
+
+# Check-in Service
+
+logger = logging.getLogger(__name__)
+
+# Check-in type -> streak it counts toward, and the entry columns it sets
+CHECKIN_KINDS = {
+    "exercise": ("workout", "is_exercise_completed", "exercise_completed_at", "last_workout_date"),
+    "diet": ("diet", "is_diet_completed", "diet_completed_at", "last_diet_date"),
+}
+MAX_BATCH = 100
+
+
+def _notify_tomorrow(user: User) -> None:
+    with NotificationBatch() as batch:
+        schedule_tomorrow_plan_notification(user, batch)
+
+
+# Work that follows a check-in but needn't hold up its response, run in this order
+CHECKIN_EFFECTS = {
+    "streaks": rescan_streaks,  # all-plans rescan after a late check-in
+    "tomorrow_plan": _notify_tomorrow,
+    "badges": award_badges,
+}
+
+# user id -> effects waiting for that user's worker; a key is present while a worker owns the user
+_pending_effects: Dict[int, Set[str]] = {}
+_pending_lock = threading.Lock()
+
+
+def queue_checkin_effects(user_id: int, *effects: str) -> None:
+    """
+    Run the named CHECKIN_EFFECTS for the user on the background pool once
+    the current transaction commits (never, if it rolls back). Effects queued
+    while the user's worker is waiting or running are merged into its next
+    pass, so a burst of check-ins costs one run rather than one each.
+    """
+    background.after_commit(_submit_effects, user_id, set(effects))
+
+
+def _submit_effects(user_id: int, effects: Set[str]) -> None:
+    with _pending_lock:
+        if user_id in _pending_effects:
+            _pending_effects[user_id] |= effects
+            return
+        _pending_effects[user_id] = effects
+    background.submit(run_checkin_effects, user_id)
+
+
+def run_checkin_effects(user_id: int) -> None:
+    """The user's worker: apply their queued effects until none are left."""
+    try:
+        while True:
+            with _pending_lock:
+                effects = _pending_effects[user_id]
+                if not effects:
+                    del _pending_effects[user_id]
+                    return
+                _pending_effects[user_id] = set()
+            db.session.expire_all()  # Pick up the check-ins committed since the last pass
+            user = db.session.get(User, user_id)
+            for name, effect in CHECKIN_EFFECTS.items():
+                if user is None or name not in effects:
+                    continue
+                try:
+                    effect(user)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Check-in effect %s failed for user %s", name, user_id)
+    except Exception:
+        with _pending_lock:
+            _pending_effects.pop(user_id, None)
+        raise
+
+
+def parse_client_ts(value, now: datetime, day: date) -> datetime:
+    """
+    A client's ISO 8601 timestamp as naive UTC for a check-in on plan `day`:
+    no earlier than the start of that day and never later than `now`;
+    `now` when missing.
+    """
+    if not value:
+        return now
+    ts = datetime.fromisoformat(str(value))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(max(ts, datetime.combine(day, time.min)), now)
+
+
+def apply_checkins(user: User, items: List[Dict]) -> Dict:
+    """
+    Apply a batch of {entry_id, type, note, client_ts} check-ins in one
+    transaction. Each (entry, type) counts once: repeats, in the batch or
+    from an earlier sync, come back as "duplicate". Today's check-ins move
+    the streaks in the transaction; the rescan for late ones, the
+    tomorrow's-plan notification and badges follow once per batch after it
+    commits. Returns per-item results in request order and, when a check-in
+    for today counted, the updated streaks; commits.
+    """
+    now = datetime.utcnow()
+    today = now.date()
+    entry_ids = {item.get("entry_id") for item in items if isinstance(item.get("entry_id"), int)}
+    entries = {
+        entry.id: entry for entry in DailyPlanEntry.query.join(UserPlan).filter(
+            DailyPlanEntry.id.in_(entry_ids), UserPlan.user_id == user.id,
+        )
+    } if entry_ids else {}
+
+    results, rows, seen = [], [], set()
+    applied_kinds, touched_plans, late = set(), set(), False
+    for item in items:
+        entry_id, checkin_type = item.get("entry_id"), item.get("type")
+        result = {"entry_id": entry_id, "type": checkin_type}
+        results.append(result)
+        entry = entries.get(entry_id)
+        if entry is None:
+            result.update(status="error", error="Entry not found")
+            continue
+        if checkin_type not in CHECKIN_KINDS:
+            result.update(status="error", error="Unknown check-in type")
+            continue
+        try:
+            ts = parse_client_ts(item.get("client_ts"), now, entry.date)
+        except ValueError:
+            result.update(status="error", error="Invalid client_ts")
+            continue
+
+        kind, done_col, done_at_col, last_date_col = CHECKIN_KINDS[checkin_type]
+        if getattr(entry, done_col) or (entry.id, checkin_type) in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add((entry.id, checkin_type))
+        setattr(entry, done_col, True)
+        setattr(entry, done_at_col, ts)
+        if (getattr(user, last_date_col) or ts.date()) <= ts.date():
+            setattr(user, last_date_col, ts.date())
+        rows.append({"user_id": user.id, "daily_entry_id": entry.id, "type": checkin_type, "timestamp": ts, "note": item.get("note")})
+        applied_kinds.add((kind, entry.id))
+        touched_plans.add(entry.plan_id)
+        late = late or entry.date < today
+        result["status"] = "applied"
+
+    streaks = None
+    if rows:
+        # The flags above already dedupe; the unique index covers a concurrent sync
+        logged = insert_ignore(UserCheckIn, rows, conflict=("daily_entry_id", "type"), returning=(UserCheckIn.type, UserCheckIn.daily_entry_id))
+        add_checkin_points(user.id, [(logged_type, entries[entry_id].date) for logged_type, entry_id in logged])
+        for plan_id in touched_plans:
+            bump_plan_version(plan_id)
+        for kind, entry_id in applied_kinds:
+            streaks = record_checkin(user, entries[entry_id], kind) or streaks
+        # One rescan covers every late day
+        queue_checkin_effects(user.id, *(("streaks",) if late else ()), "tomorrow_plan", "badges")
+        db.session.commit()
+    return {"results": results, "streaks": streaks}
+
+
+def collapse_duplicate_checkins() -> int:
+    """
+    Keep the first check-in per (entry, type) so uq_checkin_entry_type can be
+    built; repeated taps used to log one row each. Returns rows removed.
+    """
+    first_ids = select(func.min(UserCheckIn.id)).group_by(UserCheckIn.daily_entry_id, UserCheckIn.type)
+    removed = UserCheckIn.query.filter(
+        UserCheckIn.type.isnot(None), UserCheckIn.id.not_in(first_ids),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,83 @@
+from datetime import date, datetime, timedelta
+from functools import cached_property
+from typing import Dict, Optional
+from flask import g, has_request_context
+from sqlalchemy.orm import defer
+from models import User, UserPlan, DailyPlanEntry
+from services.plan_service import materialize_window
+
+# Day Context Service
+
+class UserDayContext:
+    """
+    A user's plan around today, loaded once: the latest plan (with its rolling
+    window materialized), the entries for yesterday, today and tomorrow, and
+    the streaks. Use day_context() to share one instance per request.
+    """
+
+    def __init__(self, user: User, today: Optional[date] = None):
+        self.user = user
+        self.today = today or datetime.utcnow().date()
+        self.yesterday = self.today - timedelta(days=1)
+        self.tomorrow = self.today + timedelta(days=1)
+
+    @cached_property
+    def plan(self) -> Optional[UserPlan]:
+        """The user's most recently created plan, whether or not it has ended."""
+        plan = UserPlan.query.filter_by(user_id=self.user.id).order_by(UserPlan.created_at.desc()).first()
+        materialize_window(plan, self.today)
+        return plan
+
+    @property
+    def active_plan(self) -> Optional[UserPlan]:
+        """The latest plan if it still runs today."""
+        plan = self.plan
+        return plan if plan and plan.end_date >= self.today else None
+
+    @cached_property
+    def _entries(self) -> Dict[date, DailyPlanEntry]:
+        if not self.plan:
+            return {}
+        # Template plans keep their payloads on the template day; legacy rows load them on access
+        entries = DailyPlanEntry.query.options(
+            defer(DailyPlanEntry.exercise_payload), defer(DailyPlanEntry.diet_payload),
+        ).filter(
+            DailyPlanEntry.plan_id == self.plan.id,
+            DailyPlanEntry.date.between(self.yesterday, self.tomorrow),
+        ).all()
+        return {entry.date: entry for entry in entries}
+
+    @property
+    def yesterday_entry(self) -> Optional[DailyPlanEntry]:
+        return self._entries.get(self.yesterday)
+
+    @property
+    def today_entry(self) -> Optional[DailyPlanEntry]:
+        return self._entries.get(self.today)
+
+    @property
+    def tomorrow_entry(self) -> Optional[DailyPlanEntry]:
+        return self._entries.get(self.tomorrow)
+
+    @cached_property
+    def streaks(self) -> Dict:
+        from services.streak_service import current_streaks # streak_service builds on this module
+        return current_streaks(self.user)
+
+    def refresh_streaks(self) -> Dict:
+        """Re-read the streaks after a check-in changed them."""
+        self.__dict__.pop("streaks", None)
+        return self.streaks
+
+
+def day_context(user: User) -> UserDayContext:
+    """
+    The UserDayContext for `user`, memoized on flask.g for the current request.
+    Outside a request (CLI, background jobs) a fresh context is returned.
+    """
+    if not has_request_context():
+        return UserDayContext(user)
+    contexts = g.setdefault("day_contexts", {})
+    if user.id not in contexts:
+        contexts[user.id] = UserDayContext(user)
+    return contexts[user.id]
@@ -0,0 +1,53 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db
+
+# Database Utilities
+
+_DIALECT_INSERTS = {
+    "postgresql": pg_insert,
+    "sqlite": sqlite_insert,
+}
+
+
+def insert_ignore(model, rows: Iterable[Dict], conflict: Sequence[str], returning: Optional[Sequence] = None):
+    """
+    INSERT ... ON CONFLICT (`conflict`) DO NOTHING for `rows` in a single
+    statement. Rows that would violate the unique index on `conflict` are
+    skipped; returns the number actually inserted, or with `returning`
+    (columns) the inserted rows. Does not commit.
+    """
+    rows: List[Dict] = list(rows)
+    if not rows:
+        return [] if returning else 0
+    stmt = _dialect_insert(model, "insert_ignore").values(rows).on_conflict_do_nothing(index_elements=list(conflict))
+    if returning:
+        return db.session.execute(stmt.returning(*returning)).all()
+    return db.session.execute(stmt).rowcount
+
+
+def upsert(model, rows: Iterable[Dict], conflict: Sequence[str], update: Callable[[object], Dict], returning: Optional[Sequence] = None):
+    """
+    INSERT ... ON CONFLICT (`conflict`) DO UPDATE for `rows` in a single
+    statement. `update(excluded)` gives the SET clause for rows that already
+    exist, where `excluded` holds the values that were to be inserted, e.g.
+    {"total": Model.total + excluded.total} for an atomic increment. Returns
+    the number of rows written, or with `returning` (columns) the rows as
+    inserted or updated. Does not commit.
+    """
+    rows: List[Dict] = list(rows)
+    if not rows:
+        return [] if returning else 0
+    stmt = _dialect_insert(model, "upsert").values(rows)
+    stmt = stmt.on_conflict_do_update(index_elements=list(conflict), set_=update(stmt.excluded))
+    if returning:
+        return db.session.execute(stmt.returning(*returning)).all()
+    return db.session.execute(stmt).rowcount
+
+
+def _dialect_insert(model, caller: str):
+    dialect = db.session.get_bind().dialect.name
+    if dialect not in _DIALECT_INSERTS:
+        raise NotImplementedError(f"{caller} does not support {dialect}")
+    return _DIALECT_INSERTS[dialect](model)
@@ -333,6 +333,13 @@ def recommend_meals_for_day(calories: int, macros: Dict, preference: str, goal:
     """
     Generate a full day of eating based on calories/macros and preferences.
     """
+    return day_diet_payload(calories, macros, meals_for_day(preference, goal, day_index))
+
+
+def meals_for_day(preference: str, goal: str, day_index: int) -> Dict:
+    """
+    Meal choices for a plan day; depends only on preference, goal and day.
+    """
     # Base templates
     is_nonveg = preference == "nonveg" or preference == "mixed"
     
@@ -360,16 +367,23 @@ def recommend_meals_for_day(calories: int, macros: Dict, preference: str, goal:
         variations = [" (Option A)", " (Option B)", " (Spicy)", " (Herbal)"]
         return base + variations[day_index % 4]
 
+    return {
+        "breakfast": get_meal("breakfast"),
+        "lunch": get_meal("lunch"),
+        "dinner": get_meal("dinner"),
+        "snacks": get_meal("snacks")
+    }
+
+
+def day_diet_payload(calories: int, macros: Dict, meals: Dict) -> Dict:
+    """
+    Combine a user's calorie/macro targets with a day's meals.
+    """
     return {
         "calories": calories,
         "protein_g": macros.get("protein_g"),
         "carbs_g": macros.get("carbs_g"),
         "fats_g": macros.get("fats_g"),
-        "meals": {
-            "breakfast": get_meal("breakfast"),
-            "lunch": get_meal("lunch"),
-            "dinner": get_meal("dinner"),
-            "snacks": get_meal("snacks")
-        },
+        "meals": meals,
         "note": f"Focus on hitting ~{macros.get('protein_g')}g protein today."
     }
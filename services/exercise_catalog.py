@@ -0,0 +1,181 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from flask import current_app
+from sqlalchemy import event, select
+from models import Exercise, ExerciseTag, db
+
+# Exercise Catalog
+
+def _split(value: Optional[str]) -> List[str]:
+    """Split a comma-separated column into lowercased items."""
+    return [part.strip().lower() for part in (value or "").split(",") if part.strip()]
+
+
+class ExerciseCatalog:
+    """
+    Process-wide snapshot of the exercise library.
+    Loaded once and indexed by tag, muscle group, equipment and difficulty so
+    routine generation can pick candidates without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+        self.exercises: Dict[int, Dict] = {}
+        self.by_tag: Dict[str, Set[int]] = {}
+        self.by_muscle: Dict[str, Set[int]] = {}
+        self.by_equipment: Dict[str, Set[int]] = {}
+        self.by_difficulty: Dict[str, Set[int]] = {}
+
+    def invalidate(self) -> None:
+        """Drop the snapshot; the next lookup reloads it."""
+        self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None:
+            return False
+        # Other processes (e.g. seed_data.py) can't reach our invalidate(), so
+        # the snapshot also expires after EXERCISE_CATALOG_TTL seconds.
+        ttl = current_app.config.get("EXERCISE_CATALOG_TTL")
+        return not ttl or (time.monotonic() - self._loaded_at) < ttl
+
+    def ensure_loaded(self) -> "ExerciseCatalog":
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._load()
+        return self
+
+    def _load(self) -> None:
+        exercises, by_tag, by_muscle, by_equipment, by_difficulty = {}, {}, {}, {}, {}
+
+        tag_rows: Dict[int, List[str]] = {}
+        for exercise_id, tag in db.session.query(ExerciseTag.exercise_id, ExerciseTag.tag).order_by(ExerciseTag.tag):
+            tag_rows.setdefault(exercise_id, []).append(tag)
+
+        for ex in Exercise.query.order_by(Exercise.id).all():
+            # Fall back to the comma-separated copy until sync_exercise_tags() has run
+            tags = tag_rows.get(ex.id) or _split(ex.tags)
+            exercises[ex.id] = {
+                "id": ex.id,
+                "name": ex.name,
+                "muscle_group": ex.muscle_group,
+                "equipment": ex.equipment,
+                "difficulty": ex.difficulty,
+                "description": ex.description,
+                "animation_url": ex.animation_url,
+                "thumbnail_url": ex.thumbnail_url,
+                "tags": tags,
+            }
+            for tag in tags:
+                by_tag.setdefault(tag, set()).add(ex.id)
+            for item in _split(ex.equipment):
+                by_equipment.setdefault(item, set()).add(ex.id)
+            if ex.muscle_group:
+                by_muscle.setdefault(ex.muscle_group.lower(), set()).add(ex.id)
+            if ex.difficulty:
+                by_difficulty.setdefault(ex.difficulty.lower(), set()).add(ex.id)
+
+        # Swap in complete indexes so concurrent readers never see a partial load
+        self.exercises = exercises
+        self.by_tag = by_tag
+        self.by_muscle = by_muscle
+        self.by_equipment = by_equipment
+        self.by_difficulty = by_difficulty
+        self._loaded_at = time.monotonic()
+
+    def get(self, exercise_id: int) -> Optional[Dict]:
+        return self.ensure_loaded().exercises.get(exercise_id)
+
+    def candidates(
+        self,
+        tags: Iterable[str] = (),
+        exclude_tags: Iterable[str] = (),
+        muscle_groups: Iterable[str] = (),
+        equipment: Optional[str] = None,
+        difficulty: Optional[str] = None,
+    ) -> List[Dict]:
+        """
+        Return exercises matching every filter, ordered by id.
+        Muscle groups match by substring (e.g. "Legs" matches "Legs & Glutes").
+        """
+        self.ensure_loaded()
+        ids: Optional[Set[int]] = None
+
+        def narrow(found: Set[int]) -> Set[int]:
+            return set(found) if ids is None else ids & found
+
+        for tag in tags:
+            ids = narrow(self.by_tag.get(tag.lower(), set()))
+
+        muscle_groups = [m.lower() for m in muscle_groups]
+        if muscle_groups:
+            matched = set()
+            for key, members in self.by_muscle.items():
+                if any(m in key for m in muscle_groups):
+                    matched |= members
+            ids = narrow(matched)
+
+        if equipment:
+            ids = narrow(self.by_equipment.get(equipment.lower(), set()))
+        if difficulty:
+            ids = narrow(self.by_difficulty.get(difficulty.lower(), set()))
+
+        if ids is None:
+            ids = set(self.exercises)
+        for tag in exclude_tags:
+            ids -= self.by_tag.get(tag.lower(), set())
+
+        return [self.exercises[i] for i in sorted(ids)]
+
+
+catalog = ExerciseCatalog()
+
+
+def query_exercises_by_tags(include: Iterable[str] = (), exclude: Iterable[str] = ()):
+    """
+    Exercise query filtered on the exercise_tags table.
+    Every `include` tag must be present and no `exclude` tag may be; each
+    condition is an indexed semi-join on (tag, exercise_id).
+    """
+    query = Exercise.query
+    for tag in include:
+        query = query.filter(Exercise.id.in_(
+            select(ExerciseTag.exercise_id).where(ExerciseTag.tag == tag.strip().lower())
+        ))
+    exclude = [tag.strip().lower() for tag in exclude]
+    if exclude:
+        query = query.filter(Exercise.id.not_in(
+            select(ExerciseTag.exercise_id).where(ExerciseTag.tag.in_(exclude))
+        ))
+    return query
+
+
+def set_exercise_tags(exercise: Exercise, tags: Iterable[str]) -> None:
+    """Replace an exercise's tags, keeping the comma-separated copy in step."""
+    tags = list(dict.fromkeys(tag.strip().lower() for tag in tags if tag.strip()))
+    current = {link.tag: link for link in exercise.tag_links}
+    exercise.tag_links = [current.get(tag) or ExerciseTag(tag=tag) for tag in tags]
+    exercise.tags = ",".join(tags)
+
+
+def sync_exercise_tags() -> int:
+    """Backfill exercise_tags from Exercise.tags; returns exercises updated."""
+    tagged = {exercise_id for (exercise_id,) in db.session.query(ExerciseTag.exercise_id).distinct()}
+    updated = 0
+    for ex in Exercise.query.filter(Exercise.tags.isnot(None)).all():
+        if ex.id not in tagged and _split(ex.tags):
+            set_exercise_tags(ex, _split(ex.tags))
+            updated += 1
+    db.session.commit()
+    return updated
+
+
+@event.listens_for(Exercise, "after_insert")
+@event.listens_for(Exercise, "after_update")
+@event.listens_for(Exercise, "after_delete")
+@event.listens_for(ExerciseTag, "after_insert")
+@event.listens_for(ExerciseTag, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    catalog.invalidate()
@@ -0,0 +1,119 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+from models import Job, User, db
+from services import background
+from services.plan_service import generate_month_plan
+
+# Job Service
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _generate_plan(job: Job) -> Dict:
+    user = User.query.get(job.user_id)
+    plan = generate_month_plan(user, (job.params_json or {}).get("start_date"), commit=False)
+    return {"plan_id": plan.id}
+
+
+# kind -> handler(job) returning the job's result payload
+HANDLERS: Dict[str, Callable[[Job], Dict]] = {
+    "generate_plan": _generate_plan,
+}
+
+
+def _active_job(user_id: int, kind: str) -> Optional[Job]:
+    return Job.query.filter(
+        Job.user_id == user_id,
+        Job.kind == kind,
+        Job.status.in_(ACTIVE_STATUSES),
+    ).first()
+
+
+def enqueue_job(user_id: int, kind: str, params: Optional[Dict] = None) -> Job:
+    """
+    Queue a job unless one of the same kind is already queued or running for
+    the user, in which case that job is returned (single-flight).
+    """
+    for _ in range(2):
+        existing = _active_job(user_id, kind)
+        if existing:
+            return existing
+
+        job = Job(user_id=user_id, kind=kind, params_json=params or {})
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request won the uq_jobs_active race: join its job
+            db.session.rollback()
+            continue
+
+        background.submit(run_job, job.id)
+        return job
+
+    raise RuntimeError(f"Could not enqueue {kind} job for user {user_id}")
+
+
+def run_job(job_id: int) -> None:
+    """Claim a queued job and run its handler; the outcome commits with the job status."""
+    claimed = Job.query.filter_by(id=job_id, status="queued").update(
+        {"status": "running", "started_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    if not claimed:
+        return  # Another worker took it
+
+    job = Job.query.get(job_id)
+    try:
+        job.result_json = HANDLERS[job.kind](job)
+        job.status = "done"
+    except Exception as e:
+        db.session.rollback()
+        job = Job.query.get(job_id)
+        job.status = "failed"
+        job.error = str(e)
+        print(f"Job {job_id} failed: {e}")
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def resume_pending_jobs(stale_after: int = 900) -> int:
+    """
+    Re-submit jobs left queued by a restart. Jobs stuck in running for longer
+    than `stale_after` seconds are assumed orphaned and queued again.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    Job.query.filter(Job.status == "running", Job.started_at < cutoff).update(
+        {"status": "queued", "started_at": None},
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+    pending = [job_id for (job_id,) in db.session.query(Job.id).filter(Job.status == "queued")]
+    for job_id in pending:
+        background.submit(run_job, job_id)
+    return len(pending)
+
+
+def init_app(app: Flask) -> None:
+    """Resume durable jobs once per process, on the first request it serves."""
+    state = {"resumed": False}
+    lock = threading.Lock()
+
+    @app.before_request
+    def _resume_jobs_once():
+        if state["resumed"]:
+            return
+        with lock:
+            if state["resumed"]:
+                return
+            state["resumed"] = True
+        try:
+            resume_pending_jobs(app.config.get("JOB_STALE_SECONDS", 900))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Job resume failed: {e}")
@@ -0,0 +1,137 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert, select
+from models import DailyPlanEntry, LeaderboardScore, User, UserCheckIn, db
+from services.db_utils import upsert
+
+# Leaderboard Service
+
+PERIODS = ("week", "all")
+SCORED_CHECKINS = ("exercise", "diet")  # Check-in types worth a point
+METRIC = "Check-ins"
+
+
+def board_key(period: str, day: date) -> str:
+    """The board a check-in on `day` counts toward for `period`."""
+    if period == "all":
+        return "all"
+    return f"week:{(day - timedelta(days=day.weekday())).isoformat()}"
+
+
+def _board_points(checkins: Iterable[Tuple[str, date]]) -> Counter:
+    points = Counter()
+    for checkin_type, day in checkins:
+        if checkin_type not in SCORED_CHECKINS:
+            continue
+        for period in PERIODS:
+            points[board_key(period, day)] += 1
+    return points
+
+
+def add_checkin_points(user_id: int, checkins: Iterable[Tuple[str, date]]) -> None:
+    """
+    Count newly logged (type, plan day) check-ins on the user's all-time and
+    weekly boards with one atomic upsert. The plan day picks the week, so a
+    late or offline check-in scores on the week it belongs to. Pass only rows
+    that were actually inserted, so a repeated check-in scores nothing. Does
+    not commit.
+    """
+    now = datetime.utcnow()
+    points = _board_points(checkins)
+    upsert(
+        LeaderboardScore,
+        [{"board": board, "user_id": user_id, "score": score, "updated_at": now} for board, score in points.items()],
+        conflict=("board", "user_id"),
+        update=lambda excluded: {
+            "score": LeaderboardScore.score + excluded.score,
+            "updated_at": excluded.updated_at,
+        },
+    )
+
+
+def top_scores(period: str, limit: int, today: Optional[date] = None) -> List[Dict]:
+    """
+    The board's `limit` highest scores with competition ranks (1, 2, 2, 4).
+    Reads `limit` rows off idx_leaderboard_scores_rank, whatever the history.
+    """
+    board = board_key(period, today or datetime.utcnow().date())
+    rows = db.session.execute(
+        select(LeaderboardScore.user_id, User.fullname, LeaderboardScore.score)
+        .join(User, User.id == LeaderboardScore.user_id)
+        .where(LeaderboardScore.board == board, LeaderboardScore.score > 0)
+        .order_by(LeaderboardScore.score.desc(), LeaderboardScore.user_id.desc())
+        .limit(limit)
+    ).all()
+    top = []
+    for i, row in enumerate(rows):
+        rank = top[-1]["rank"] if top and top[-1]["score"] == row.score else i + 1
+        top.append({"rank": rank, "user_id": row.user_id, "name": row.fullname, "score": row.score, "metric": METRIC})
+    return top
+
+
+def user_standing(user_id: int, period: str, today: Optional[date] = None) -> Optional[Dict]:
+    """
+    The user's score and rank on the board, or None before their first
+    check-in on it. The rank counts the scores above theirs off
+    idx_leaderboard_scores_rank, reading those rows rather than the board.
+    """
+    board = board_key(period, today or datetime.utcnow().date())
+    score = db.session.scalar(
+        select(LeaderboardScore.score).where(LeaderboardScore.board == board, LeaderboardScore.user_id == user_id)
+    )
+    if not score:
+        return None
+    above = db.session.scalar(
+        select(func.count()).where(LeaderboardScore.board == board, LeaderboardScore.score > score)
+    )
+    return {"rank": above + 1, "score": score, "metric": METRIC}
+
+
+def prune_leaderboards(keep_weeks: int, today: Optional[date] = None) -> int:
+    """
+    Delete the weekly boards that started more than `keep_weeks` weeks before
+    the current one; nothing reads them once the week is over. Week keys sort
+    by date, so this is one range of the primary key. Returns rows removed;
+    commits.
+    """
+    today = today or datetime.utcnow().date()
+    oldest = board_key("week", today - timedelta(weeks=keep_weeks))
+    removed = LeaderboardScore.query.filter(
+        LeaderboardScore.board.startswith("week:"), LeaderboardScore.board < oldest,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def rebuild_leaderboards(user_ids: Optional[List[int]] = None, commit: bool = True) -> int:
+    """
+    Recompute every board from user_checkins, or just the scores of
+    `user_ids`. Returns score rows written; with commit=False the caller's
+    transaction carries the rewrite.
+    """
+    now = datetime.utcnow()
+    scores = Counter()
+    query = (
+        select(UserCheckIn.user_id, UserCheckIn.type, DailyPlanEntry.date, UserCheckIn.timestamp)
+        .outerjoin(DailyPlanEntry, DailyPlanEntry.id == UserCheckIn.daily_entry_id)
+        .where(UserCheckIn.type.in_(SCORED_CHECKINS))
+    )
+    stale = db.session.query(LeaderboardScore)
+    if user_ids is not None:
+        query = query.where(UserCheckIn.user_id.in_(user_ids))
+        stale = stale.filter(LeaderboardScore.user_id.in_(user_ids))
+    for user_id, checkin_type, day, checked_at in db.session.execute(query):
+        day = day or (checked_at or now).date()  # Check-ins whose entry is gone
+        for board, points in _board_points([(checkin_type, day)]).items():
+            scores[(board, user_id)] += points
+
+    stale.delete(synchronize_session=False)
+    if scores:
+        db.session.execute(insert(LeaderboardScore), [
+            {"board": board, "user_id": user_id, "score": score, "updated_at": now}
+            for (board, user_id), score in scores.items()
+        ])
+    if commit:
+        db.session.commit()
+    return len(scores)
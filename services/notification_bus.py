@@ -0,0 +1,134 @@
+import json
+import queue
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+from flask import current_app
+
+# Notification Bus
+
+class NotificationBus:
+    """
+    In-process pub/sub for live notification streams. Each open stream
+    subscribes a queue for its user; publish() drops events into the queues
+    of that user's streams in this process. Events are dicts with an "event"
+    name, "data" and, for notifications, an "id".
+    """
+
+    # Whether publishers in other processes (workers, the scheduler) reach our subscribers
+    cross_process = False
+
+    def __init__(self, queue_size: int = 100):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[queue.Queue]] = {}
+        self._queue_size = queue_size
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        subscription: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id: int, subscription: queue.Queue) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: Dict) -> None:
+        self.publish_many([(user_id, event)])
+
+    def publish_many(self, events: Iterable[Tuple[int, Dict]]) -> None:
+        for user_id, event in events:
+            self._deliver(user_id, event)
+
+    def _deliver(self, user_id: int, event: Dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                pass  # A stalled stream; it catches up from the database on reconnect
+
+
+class RedisNotificationBus(NotificationBus):
+    """
+    Cross-worker bus over one Redis pub/sub channel: publish() goes through
+    Redis and a listener thread per process fans messages out to the local
+    subscribers. Needs the optional `redis` package.
+    """
+
+    cross_process = True
+
+    def __init__(self, url: str, channel: str = "gymsphere:notifications", queue_size: int = 100):
+        try:
+            import redis  # optional dependency, only needed when NOTIFICATION_BUS_URL is set
+        except ImportError as e:
+            raise RuntimeError(
+                "NOTIFICATION_BUS_URL (or REDIS_URL) is set but the redis package is not installed: "
+                "pip install redis, or unset it to keep notifications in-process"
+            ) from e
+        super().__init__(queue_size)
+        self._redis = redis.Redis.from_url(url)
+        self._channel = channel
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._listen, name="gymsphere-bus", daemon=True)
+                    self._listener.start()
+        return super().subscribe(user_id)
+
+    def publish_many(self, events: Iterable[Tuple[int, Dict]]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for user_id, event in events:
+            pipe.publish(self._channel, json.dumps({"user_id": user_id, "event": event}, default=str))
+        pipe.execute()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    self._deliver(data["user_id"], data["event"])
+            except Exception as e:
+                print(f"Notification bus listener error: {e}")
+                time.sleep(1)
+
+
+_bus: Optional[NotificationBus] = None
+_lock = threading.Lock()
+
+
+def get_bus() -> NotificationBus:
+    # Not built at import: the Redis listener thread does not survive gunicorn's fork, and
+    # in-memory subscribers only make sense in the process that holds their open stream
+    global _bus
+    if _bus is None:
+        with _lock:
+            if _bus is None:
+                url = current_app.config.get("NOTIFICATION_BUS_URL")
+                _bus = RedisNotificationBus(url) if url else NotificationBus()
+    return _bus
+
+
+def publish_many(events: Iterable[Tuple[int, Dict]]) -> None:
+    """Publish (user_id, event) pairs; a bus failure never fails the caller's write."""
+    events = list(events)
+    if not events:
+        return
+    try:
+        get_bus().publish_many(events)
+    except Exception as e:
+        print(f"Error publishing notifications: {e}")
+
+
+def publish(user_id: int, event: Dict) -> None:
+    publish_many([(user_id, event)])
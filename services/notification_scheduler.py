@@ -0,0 +1,146 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from flask import current_app
+from sqlalchemy import String, cast, func, literal, select
+from sqlalchemy.orm import aliased
+from models import DailyPlanEntry, Notification, PlanTemplateDay, User, UserPlan, db
+from services.plan_service import materialize_plans_through
+from services.notification_service import (
+    COACH_TITLE, MISSED_WORKOUT_MESSAGE, MISSED_WORKOUT_TITLE, TOMORROW_PLAN_TITLE,
+    NotificationBatch, coach_message, generate_weekly_summary, notification_key, tomorrow_plan_message,
+)
+
+# Notification Scheduler
+
+def valid_timezone(name: Optional[str]) -> Optional[str]:
+    """`name` if it is a known IANA time zone, else None."""
+    try:
+        return ZoneInfo(name).key if name else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def user_zone(name: Optional[str]) -> ZoneInfo:
+    return ZoneInfo(valid_timezone(name) or "UTC")
+
+
+def _not_sent(kind: str, day: date):
+    """No notification yet under the user's notification_key(kind, id, day)."""
+    key = literal(f"{kind}:") + cast(User.id, String) + literal(f":{day.isoformat()}")
+    return ~select(Notification.id).where(Notification.dedupe_key == key).exists()
+
+
+def _latest_plan_entries(day: date):
+    """Users joined to their latest plan's entry for `day`."""
+    newest = aliased(UserPlan)
+    latest_plan = select(func.max(newest.id)).where(newest.user_id == User.id).correlate(User).scalar_subquery()
+    return (
+        select(User.id)
+        .join(UserPlan, UserPlan.user_id == User.id)
+        .join(DailyPlanEntry, DailyPlanEntry.plan_id == UserPlan.id)
+        .where(UserPlan.id == latest_plan, DailyPlanEntry.date == day)
+    )
+
+
+def _send_in_chunks(candidates, kind: str, day: date, build: Callable, chunk_size: int, now: datetime) -> int:
+    """
+    Queue one `kind` notification for `day` per row of `candidates` (a select
+    starting with User.id), walking users in id order `chunk_size` at a time.
+    The NotificationBatch flushes each chunk as one insert-or-ignore on the
+    dedupe key and one commit, so a concurrent run can't double-send. `now`
+    is the naive UTC creation time. Returns notifications inserted.
+    """
+    last_id = 0
+    with NotificationBatch(size=chunk_size) as batch:
+        while True:
+            rows = db.session.execute(
+                candidates.where(User.id > last_id).order_by(User.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                batch.add(row.id, dedupe_key=notification_key(kind, row.id, day), created_at=now, **build(row))
+            last_id = rows[-1].id
+    return batch.sent
+
+
+def run_notifications(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    One scheduler pass over every user, grouped by time zone. Each notice is
+    due once the user's local clock passes its hour and is sent at most once
+    per local day, so running this every few minutes is safe.
+    """
+    now = now or datetime.now(timezone.utc)
+    config = current_app.config
+    chunk_size = config.get("NOTIFICATION_CHUNK_SIZE", 500)
+    morning_hour = config.get("NOTIFICATION_MORNING_HOUR", 7)
+    evening_hour = config.get("NOTIFICATION_EVENING_HOUR", 18)
+    counts = {"coach": 0, "missed_workout": 0, "tomorrow_plan": 0, "weekly_summary": 0}
+    sent_at = now.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # Tomorrow's rows, in the time zone furthest ahead, must exist for inactive users too
+    materialize_plans_through(now.date() + timedelta(days=2))
+
+    user_tz = func.coalesce(User.timezone, "UTC")
+    for (tz_name,) in db.session.query(user_tz).distinct().all():
+        zone = user_zone(tz_name)
+        local_now = now.astimezone(zone)
+        local_today = local_now.date()
+        yesterday = local_today - timedelta(days=1)
+        in_zone = user_tz == tz_name
+
+        if local_now.hour >= morning_hour:
+            counts["coach"] += _send_in_chunks(
+                select(User.id, User.workout_streak).where(in_zone, _not_sent("coach", local_today)),
+                "coach",
+                local_today,
+                lambda row: dict(title=COACH_TITLE, message=coach_message(row.workout_streak or 0), type="motivation"),
+                chunk_size,
+                sent_at,
+            )
+            counts["missed_workout"] += _send_in_chunks(
+                _latest_plan_entries(yesterday).where(
+                    in_zone,
+                    DailyPlanEntry.is_exercise_day.is_(True),
+                    DailyPlanEntry.is_exercise_completed.isnot(True),
+                    _not_sent("missed_workout", yesterday),
+                ),
+                "missed_workout",
+                yesterday,
+                lambda row: dict(title=MISSED_WORKOUT_TITLE, message=MISSED_WORKOUT_MESSAGE, type="alert"),
+                chunk_size,
+                sent_at,
+            )
+
+        if local_now.hour >= evening_hour:
+            tomorrow = local_today + timedelta(days=1)
+            counts["tomorrow_plan"] += _send_in_chunks(
+                _latest_plan_entries(tomorrow)
+                .add_columns(
+                    DailyPlanEntry.is_exercise_day,
+                    func.coalesce(PlanTemplateDay.exercise_payload, DailyPlanEntry.exercise_payload).label("exercise_payload"),
+                )
+                .outerjoin(PlanTemplateDay, PlanTemplateDay.id == DailyPlanEntry.template_day_id)
+                .where(in_zone, _not_sent("tomorrow_plan", tomorrow)),
+                "tomorrow_plan",
+                tomorrow,
+                lambda row: dict(
+                    title=TOMORROW_PLAN_TITLE,
+                    message=tomorrow_plan_message(row.is_exercise_day, row.exercise_payload),
+                    type="plan",
+                    payload={"date": str(tomorrow)},
+                ),
+                chunk_size,
+                sent_at,
+            )
+
+            # Sunday evening: the week's figures for the whole zone in one aggregate query
+            if local_now.weekday() == 6:
+                counts["weekly_summary"] += generate_weekly_summary(
+                    select(User.id).where(in_zone, _not_sent("weekly_summary", local_today)),
+                    local_today,
+                    now=sent_at,
+                )
+
+    return counts
@@ -1,122 +1,294 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from models import Notification, User, DailyPlanEntry, UserPlan, db
-from services.streak_service import calculate_streaks
+import base64
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, null, select, tuple_
+from models import (
+    Notification, NotificationArchive, User, DailyPlanEntry, UserPlan, UserCheckIn, WaterLog, SleepLog, UserProgress, db,
+)
+from services.day_context import day_context
+from services.db_utils import insert_ignore
+from services.read_models import NotificationView
+from services import notification_bus
+from services.workout_service import hydrate_exercises
+from services.plan_service import entry_exercise_payload
 
 # Notification Service
 
-def create_notification(user, title, message, type="info", payload=None):
-    """Helper to create and commit a notification."""
+TOMORROW_PLAN_TITLE = "Tomorrow's Plan Ready 📅"
+COACH_TITLE = "Coach Update 🤖"
+MISSED_WORKOUT_TITLE = "Missed Workout ⚠️"
+MISSED_WORKOUT_MESSAGE = "You missed yesterday's workout. Don't let it break your momentum! Get back on track today."
+WEEKLY_SUMMARY_TITLE = "Your Weekly Summary 📊"
+
+def notification_key(kind: str, user_id: int, day: date) -> str:
+    """Dedupe key: at most one notification of `kind` per user and day."""
+    return f"{kind}:{user_id}:{day.isoformat()}"
+
+
+def serialize_notification(n) -> Dict:
+    """API shape of a Notification, NotificationView or row selected with NotificationView.COLUMNS."""
+    return {
+        "id": n.id,
+        "title": n.title,
+        "message": n.message,
+        "type": n.type,
+        "is_read": n.is_read,
+        "created_at": n.created_at.strftime("%Y-%m-%d %H:%M"),
+        "payload": n.payload_json
+    }
+
+
+def unread_count(user_id: int) -> int:
+    return Notification.query.filter_by(user_id=user_id, is_read=False).count()
+
+
+def latest_notification_id(user_id: int) -> int:
+    return db.session.query(func.max(Notification.id)).filter(Notification.user_id == user_id).scalar() or 0
+
+
+def notifications_after(user_id: int, after_id: int, limit: int = 50) -> List[NotificationView]:
+    """The user's notifications newer than `after_id`, oldest first."""
+    return NotificationView.from_rows(db.session.execute(
+        select(*NotificationView.COLUMNS)
+        .where(Notification.user_id == user_id, Notification.id > after_id)
+        .order_by(Notification.id)
+        .limit(limit)
+    ))
+
+
+def encode_feed_cursor(n) -> str:
+    """Opaque cursor pointing just past notification `n` in the feed order."""
+    raw = json.dumps([n.is_read, n.created_at.isoformat(), n.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_feed_cursor(cursor: Optional[str]) -> Optional[Tuple[bool, datetime, int]]:
+    """Inverse of encode_feed_cursor; raises ValueError on a malformed cursor."""
+    if not cursor:
+        return None
     try:
-        n = Notification(
-            user_id=user.id,
-            title=title,
-            message=message,
-            type=type,
-            payload_json=payload,
-            created_at=datetime.utcnow()
-        )
-        db.session.add(n)
+        is_read, created_at, notification_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return bool(is_read), datetime.fromisoformat(created_at), int(notification_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def notification_feed(user_id: int, before: Optional[Tuple[bool, datetime, int]] = None,
+                      limit: int = 20) -> Tuple[List[NotificationView], Optional[str]]:
+    """
+    One page of the feed, unread first and newest first within each group,
+    and the cursor for the next page (None on the last). Each group is an
+    index range on idx_notifications_feed, keyset-paged by (created_at, id),
+    so deep pages cost the same as the first.
+    """
+    page: List[NotificationView] = []
+    for is_read in (False, True):
+        if before and is_read < before[0]:
+            continue  # The cursor is already past this group
+        query = select(*NotificationView.COLUMNS).where(Notification.user_id == user_id, Notification.is_read == is_read)
+        if before and is_read == before[0]:
+            query = query.where(tuple_(Notification.created_at, Notification.id) < (before[1], before[2]))
+        # One row beyond the page tells whether there is a next one
+        query = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1 - len(page))
+        page += NotificationView.from_rows(db.session.execute(query))
+        if len(page) > limit:
+            return page[:limit], encode_feed_cursor(page[limit - 1])
+    return page, None
+
+
+def archive_read_notifications(days: int, chunk_size: int = 1000) -> int:
+    """
+    Move read notifications older than `days` into notifications_archive,
+    `chunk_size` rows per transaction. Returns notifications archived.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    columns = ("user_id", "type", "title", "message", "payload_json", "scheduled_for", "is_read", "created_at", "dedupe_key")
+    archived = 0
+    while True:
+        ids = db.session.execute(
+            select(Notification.id)
+            .where(Notification.is_read.is_(True), Notification.created_at < cutoff)
+            .order_by(Notification.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return archived
+        db.session.execute(insert(NotificationArchive).from_select(
+            ("notification_id",) + columns,
+            select(Notification.id, *(getattr(Notification, name) for name in columns)).where(Notification.id.in_(ids)),
+        ))
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
         db.session.commit()
-        return n
-    except Exception as e:
-        print(f"Error creating notification: {e}")
-        return None
+        archived += len(ids)
+
+
+def publish_unread(user_id: int) -> None:
+    """Push the user's unread count to their open notification streams."""
+    notification_bus.publish(user_id, {"event": "unread", "data": {"unread": unread_count(user_id)}})
 
-def check_notifications_engine(user: User) -> None:
+
+class NotificationBatch:
     """
-    Master function to check and generate all smart notifications.
-    Should be called on dashboard load or via background job.
+    Buffered notification writer. add() queues rows; flush() writes them with
+    one insert-or-ignore on the dedupe key and, unless commit=False, one
+    commit. The buffer flushes itself every `size` rows and when the `with`
+    block exits cleanly. If the bulk insert fails, the rows are retried one
+    by one so a bad row doesn't sink the rest; those land in `failed`.
+    Inserted notifications are published to the notification bus once
+    committed; with commit=False, call publish() after the caller commits.
     """
-    if not user: return
 
-    # 1. Update & Check Streaks (Core Logic)
-    streaks = calculate_streaks(user)
-    
-    # 2. Tomorrow's Plan (Evening Reminder)
-    # Trigger after 6 PM
-    if datetime.utcnow().hour >= 18:
-        schedule_tomorrow_plan_notification(user)
+    def __init__(self, size: Optional[int] = None, commit: bool = True):
+        self.size = size or current_app.config.get("NOTIFICATION_CHUNK_SIZE", 500)
+        self.commit = commit
+        self.rows: List[Dict] = []
+        self.sent = 0     # rows inserted
+        self.skipped = 0  # rows whose dedupe key was already taken
+        self.failed: List[Tuple[Dict, str]] = []  # (row, error)
+        self.unpublished: List = []  # inserted rows not yet on the bus
 
-    # 3. Morning Motivation (Daily)
-    schedule_morning_reminder(user)
+    def __enter__(self) -> "NotificationBatch":
+        return self
 
-    # 4. Missed Workout Alert (Yesterday)
-    check_missed_workout(user)
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self.rows = []
 
-    # 5. Weekly Summary (Sunday Evening)
-    if datetime.utcnow().weekday() == 6 and datetime.utcnow().hour >= 18:
-        generate_weekly_summary(user)
+    def add(self, user_id: int, title: str, message: str, type: str = "info",
+            payload: Optional[Dict] = None, dedupe_key: Optional[str] = None,
+            created_at: Optional[datetime] = None) -> None:
+        # Every row carries every column: one multi-row VALUES needs uniform keys
+        now = created_at or datetime.utcnow()
+        self.rows.append(dict(
+            user_id=user_id,
+            title=title,
+            message=message,
+            type=type,
+            payload_json=null() if payload is None else payload,  # SQL NULL, not JSON 'null'
+            is_read=False,
+            created_at=now,
+            scheduled_for=now,
+            dedupe_key=dedupe_key,
+        ))
+        if len(self.rows) >= self.size:
+            self.flush()
 
+    def flush(self) -> int:
+        """Write the buffered rows; returns how many were inserted."""
+        rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        inserted, failed = [], 0
+        try:
+            with db.session.begin_nested():
+                inserted = insert_ignore(Notification, rows, conflict=("dedupe_key",), returning=NotificationView.COLUMNS)
+        except Exception:
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        inserted += insert_ignore(Notification, [row], conflict=("dedupe_key",), returning=NotificationView.COLUMNS)
+                except Exception as e:
+                    failed += 1
+                    self.failed.append((row, str(e)))
+                    print(f"Error creating notification for user {row['user_id']}: {e}")
+        self.sent += len(inserted)
+        self.skipped += len(rows) - len(inserted) - failed
+        self.unpublished += inserted
+        if self.commit:
+            db.session.commit()
+            self.publish()
+        return len(inserted)
 
-def schedule_tomorrow_plan_notification(user: User):
-    """Check tomorrow's plan and notify user."""
-    
-    tomorrow = datetime.utcnow().date() + timedelta(days=1)
-    
-    # Find active plan
-    plan = UserPlan.query.filter(UserPlan.user_id == user.id, UserPlan.end_date >= tomorrow).first()
-    if not plan: return
+    def publish(self) -> None:
+        """Push the committed notifications to their users' open streams."""
+        rows, self.unpublished = self.unpublished, []
+        notification_bus.publish_many(
+            (row.user_id, {"event": "notification", "id": row.id, "data": serialize_notification(row)})
+            for row in rows
+        )
 
-    entry = DailyPlanEntry.query.filter_by(plan_id=plan.id, date=tomorrow).first()
-    if not entry: return
 
-    title = "Tomorrow's Plan Ready 📅"
-    if Notification.query.filter_by(user_id=user.id, title=title, is_read=False).first():
-        return
+def create_notification(user, title, message, type="info", payload=None, dedupe_key=None, batch=None):
+    """
+    Helper to create and commit a notification. With a `dedupe_key` this is a
+    single insert-or-ignore; returns False when the key was already used.
+    Given a `batch`, the notification is queued there instead (returns None).
+    """
+    if batch is not None:
+        batch.add(user.id, title, message, type=type, payload=payload, dedupe_key=dedupe_key)
+        return None
+    with NotificationBatch(size=1) as single:
+        single.add(user.id, title, message, type=type, payload=payload, dedupe_key=dedupe_key)
+    return single.sent == 1
 
-    if entry.is_exercise_day:
-        # Get first 2 exercises
-        ex_names = [ex['name'] for ex in (entry.exercise_payload or [])[:2]]
-        workout_preview = ", ".join(ex_names)
-        msg = f"Tomorrow's Workout: {workout_preview} + more. Get ready!"
-    else:
-        msg = "Tomorrow is a Rest Day. Focus on recovery and nutrition."
-        
-    create_notification(user, title, msg, type="plan", payload={"date": str(tomorrow)})
+def backfill_notification_keys(days: int = 2) -> int:
+    """
+    Key the recent notifications written before dedupe_key existed, so an
+    upgraded scheduler doesn't resend today's notices. Older rows can never
+    collide with a new key and stay NULL, as do duplicates the old checks let
+    through. Returns rows keyed.
+    """
+    kinds = {TOMORROW_PLAN_TITLE: "tomorrow_plan", COACH_TITLE: "coach", MISSED_WORKOUT_TITLE: "missed_workout"}
+    rows = Notification.query.filter(
+        Notification.dedupe_key.is_(None),
+        Notification.title.in_(kinds),
+        Notification.created_at >= datetime.utcnow() - timedelta(days=days),
+    ).order_by(Notification.id).all()
+    if not rows:
+        return 0
+
+    taken = {key for (key,) in db.session.query(Notification.dedupe_key).filter(Notification.dedupe_key.isnot(None))}
+    keyed = 0
+    for n in rows:
+        kind = kinds[n.title]
+        if kind == "tomorrow_plan":
+            day = date.fromisoformat((n.payload_json or {}).get("date") or str(n.created_at.date() + timedelta(days=1)))
+        elif kind == "missed_workout":
+            day = n.created_at.date() - timedelta(days=1)
+        else:
+            day = n.created_at.date()
+        key = notification_key(kind, n.user_id, day)
+        if key not in taken:
+            n.dedupe_key = key
+            taken.add(key)
+            keyed += 1
+    db.session.commit()
+    return keyed
 
 
-def schedule_morning_reminder(user: User):
-    """Daily AI Coach motivation."""
-    today = datetime.utcnow().date()
-    title = "Coach Update 🤖"
+def schedule_tomorrow_plan_notification(user: User, batch: Optional[NotificationBatch] = None):
+    """Check tomorrow's plan and notify user."""
     
-    # Only one per day
-    if Notification.query.filter(
-        Notification.user_id == user.id, 
-        Notification.title == title,
-        Notification.created_at >= datetime.utcnow().replace(hour=0, minute=0)
-    ).first():
-        return
+    ctx = day_context(user)
+    tomorrow = ctx.tomorrow
     
-    msg = get_ai_coach_message(user)
-    create_notification(user, title, msg, type="motivation")
+    # Only set when the latest plan still runs tomorrow
+    entry = ctx.tomorrow_entry
+    if not entry: return
 
+    msg = tomorrow_plan_message(entry.is_exercise_day, entry_exercise_payload(entry))
+    create_notification(
+        user, TOMORROW_PLAN_TITLE, msg, type="plan", payload={"date": str(tomorrow)},
+        dedupe_key=notification_key("tomorrow_plan", user.id, tomorrow), batch=batch,
+    )
 
-def check_missed_workout(user: User):
-    """Check if yesterday's workout was missed."""
-    
-    yesterday = datetime.utcnow().date() - timedelta(days=1)
-    
-    # active plan covering yesterday
-    plan = UserPlan.query.filter(UserPlan.user_id == user.id, UserPlan.start_date <= yesterday).first()
-    if not plan: return
-    
-    entry = DailyPlanEntry.query.filter_by(plan_id=plan.id, date=yesterday).first()
-    
-    # If it was exercise day, and NOT completed
-    if entry and entry.is_exercise_day and not entry.is_exercise_completed:
-        title = "Missed Workout ⚠️"
-        if not Notification.query.filter_by(user_id=user.id, title=title, created_at=yesterday).first():
-             create_notification(user, title, "You missed yesterday's workout. Don't let it break your momentum! Get back on track today.", type="alert")
+
+def tomorrow_plan_message(is_exercise_day: bool, exercise_payload: list) -> str:
+    if is_exercise_day:
+        # Get first 2 exercises
+        ex_names = [ex['name'] for ex in hydrate_exercises((exercise_payload or [])[:2])]
+        workout_preview = ", ".join(ex_names)
+        return f"Tomorrow's Workout: {workout_preview} + more. Get ready!"
+    return "Tomorrow is a Rest Day. Focus on recovery and nutrition."
 
 
-def get_ai_coach_message(user: User) -> str:
-    """Generate rule-based AI coach message."""
+def coach_message(streak: int) -> str:
     import random
     
-    streak = user.workout_streak
-    
     if streak > 5:
         return random.choice([
             f"Unstoppable! {streak} day streak. You're building a new version of yourself.",
@@ -138,10 +310,173 @@ def get_ai_coach_message(user: User) -> str:
         ])
 
 
-def generate_weekly_summary(user):
+def weekly_summary_rows(users, week_end: date) -> List:
     """
-    Weekly summary notification.
+    Week-to-`week_end` figures for every user in `users` (a select of
+    User.id), in one statement: each source table is aggregated once, grouped
+    by user and limited to those users, then outer-joined onto them.
+    Rows: id, planned, completed, plan_days, diet_days, checkins, water_ml
+    and water_days, sleep_hours, weight, previous_weight (None when nothing
+    logged).
     """
-    # Logic in a future weekly_progress_check function
-    # For now, just a stub
-    pass
+    week_start = week_end - timedelta(days=6)
+    starts_at = datetime.combine(week_start, datetime.min.time())
+    ends_at = datetime.combine(week_end + timedelta(days=1), datetime.min.time())
+
+    latest_plans = (
+        select(UserPlan.user_id, func.max(UserPlan.id).label("plan_id"))
+        .where(UserPlan.user_id.in_(users))
+        .group_by(UserPlan.user_id)
+        .subquery()
+    )
+    plan_days = (
+        select(
+            latest_plans.c.user_id,
+            func.count(DailyPlanEntry.id).label("plan_days"),
+            func.count(DailyPlanEntry.id).filter(DailyPlanEntry.is_exercise_day.is_(True)).label("planned"),
+            func.count(DailyPlanEntry.id).filter(
+                DailyPlanEntry.is_exercise_day.is_(True), DailyPlanEntry.is_exercise_completed.is_(True)
+            ).label("completed"),
+            func.count(DailyPlanEntry.id).filter(DailyPlanEntry.is_diet_completed.is_(True)).label("diet_days"),
+        )
+        .join(DailyPlanEntry, DailyPlanEntry.plan_id == latest_plans.c.plan_id)
+        .where(DailyPlanEntry.date.between(week_start, week_end))
+        .group_by(latest_plans.c.user_id)
+        .subquery()
+    )
+    checkins = (
+        select(UserCheckIn.user_id, func.count(UserCheckIn.id).label("checkins"))
+        .where(UserCheckIn.user_id.in_(users), UserCheckIn.timestamp >= starts_at, UserCheckIn.timestamp < ends_at)
+        .group_by(UserCheckIn.user_id)
+        .subquery()
+    )
+    # Averaged over the days something was logged
+    water = (
+        select(
+            WaterLog.user_id,
+            func.sum(WaterLog.amount_ml).label("water_ml"),
+            func.count(func.distinct(WaterLog.date)).label("water_days"),
+        )
+        .where(WaterLog.user_id.in_(users), WaterLog.date.between(week_start, week_end))
+        .group_by(WaterLog.user_id)
+        .subquery()
+    )
+    sleep = (
+        select(SleepLog.user_id, func.avg(SleepLog.hours).label("sleep_hours"))
+        .where(SleepLog.user_id.in_(users), SleepLog.date.between(week_start, week_end))
+        .group_by(SleepLog.user_id)
+        .subquery()
+    )
+    # Latest weigh-in this week against the latest one in the four weeks before it
+    before_week = UserProgress.logged_at < starts_at
+    weigh_ins = (
+        select(
+            UserProgress.user_id,
+            UserProgress.weight,
+            before_week.label("before_week"),
+            func.row_number().over(
+                partition_by=(UserProgress.user_id, before_week), order_by=UserProgress.logged_at.desc()
+            ).label("newest"),
+        )
+        .where(
+            UserProgress.user_id.in_(users),
+            UserProgress.weight.isnot(None),
+            UserProgress.logged_at >= starts_at - timedelta(days=28),
+            UserProgress.logged_at < ends_at,
+        )
+        .subquery()
+    )
+    weights = (
+        select(
+            weigh_ins.c.user_id,
+            func.max(case((weigh_ins.c.before_week.is_(False), weigh_ins.c.weight))).label("weight"),
+            func.max(case((weigh_ins.c.before_week.is_(True), weigh_ins.c.weight))).label("previous_weight"),
+        )
+        .where(weigh_ins.c.newest == 1)
+        .group_by(weigh_ins.c.user_id)
+        .subquery()
+    )
+
+    return db.session.execute(
+        select(
+            User.id,
+            func.coalesce(plan_days.c.planned, 0).label("planned"),
+            func.coalesce(plan_days.c.completed, 0).label("completed"),
+            func.coalesce(plan_days.c.plan_days, 0).label("plan_days"),
+            func.coalesce(plan_days.c.diet_days, 0).label("diet_days"),
+            func.coalesce(checkins.c.checkins, 0).label("checkins"),
+            water.c.water_ml,
+            water.c.water_days,
+            sleep.c.sleep_hours,
+            weights.c.weight,
+            weights.c.previous_weight,
+        )
+        .outerjoin(plan_days, plan_days.c.user_id == User.id)
+        .outerjoin(checkins, checkins.c.user_id == User.id)
+        .outerjoin(water, water.c.user_id == User.id)
+        .outerjoin(sleep, sleep.c.user_id == User.id)
+        .outerjoin(weights, weights.c.user_id == User.id)
+        .where(User.id.in_(users))
+        .order_by(User.id)
+    ).all()
+
+
+def weekly_summary_payload(row, week_end: date) -> Optional[Dict]:
+    """The summary figures for one weekly_summary_rows() row, or None for an empty week."""
+    has_weights = row.weight is not None and row.previous_weight is not None
+    if not (row.plan_days or row.checkins or row.water_ml or row.sleep_hours or has_weights):
+        return None
+    return {
+        "week_start": str(week_end - timedelta(days=6)),
+        "week_end": str(week_end),
+        "workouts_completed": row.completed,
+        "workouts_planned": row.planned,
+        "diet_days": row.diet_days,
+        "plan_days": row.plan_days,
+        "checkins": row.checkins,
+        "water_ml_avg": round(row.water_ml / row.water_days) if row.water_days else None,
+        "sleep_hours_avg": round(row.sleep_hours, 1) if row.sleep_hours is not None else None,
+        "weight_delta": round(row.weight - row.previous_weight, 1) if has_weights else None,
+    }
+
+
+def weekly_summary_message(summary: Dict) -> str:
+    parts = []
+    if summary["workouts_planned"]:
+        parts.append(f"{summary['workouts_completed']}/{summary['workouts_planned']} workouts done")
+    if summary["plan_days"]:
+        parts.append(f"diet on track {summary['diet_days']}/{summary['plan_days']} days")
+    if summary["water_ml_avg"] is not None:
+        parts.append(f"{summary['water_ml_avg'] / 1000:.1f} L water a day")
+    if summary["sleep_hours_avg"] is not None:
+        parts.append(f"{summary['sleep_hours_avg']:.1f} h sleep a night")
+    if summary["weight_delta"] is not None:
+        parts.append(f"weight {summary['weight_delta']:+.1f} kg")
+    return "This week: " + ", ".join(parts) + "." if parts else "A new week starts tomorrow. Let's make it count!"
+
+
+def generate_weekly_summary(users=None, week_end: Optional[date] = None,
+                            batch: Optional[NotificationBatch] = None, now: Optional[datetime] = None) -> int:
+    """
+    Weekly summary notification for each user in `users` (a select of User.id,
+    default everyone) for the week ending `week_end` (default today), once
+    per user and week. Users with nothing planned or logged are skipped.
+    Returns summaries inserted, or queued when writing to the caller's `batch`.
+    """
+    week_end = week_end or datetime.utcnow().date()
+    users = users if users is not None else select(User.id)
+    writer = batch or NotificationBatch()
+    queued = 0
+    for row in weekly_summary_rows(users, week_end):
+        summary = weekly_summary_payload(row, week_end)
+        if summary is None:
+            continue
+        writer.add(
+            row.id, WEEKLY_SUMMARY_TITLE, weekly_summary_message(summary), type="summary", payload=summary,
+            dedupe_key=notification_key("weekly_summary", row.id, week_end), created_at=now,
+        )
+        queued += 1
+    if batch is not None:
+        return queued
+    writer.flush()
+    return writer.sent
@@ -1,69 +1,549 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from models import User, UserPlan, DailyPlanEntry, db
-from services.workout_service import recommend_workout_day
-from services.diet_service import recommend_meals_for_day, recommend_diet
+import hashlib
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from models import (
+    Exercise, User, UserPlan, DailyPlanEntry, PlanEntryExercise, PlanTemplate, PlanTemplateDay,
+    PlanTemplateExercise, UserCheckIn, db,
+)
+from services.cache import TTLCache
+from services.workout_service import generate_workout_month, compact_routine
+from services.diet_service import recommend_meals_for_day, recommend_diet, meals_for_day, day_diet_payload
 
 # Plan Service
 
-def generate_month_plan(user: User, start_date: Optional[str] = None) -> Optional[UserPlan]:
+TOTAL_DAYS = 30
+
+# Bump when workout or meal generation changes so new plans stop reusing old templates
+TEMPLATE_VERSION = 1
+
+# template id -> template day ids by day_index; committed templates never change
+_template_day_ids = TTLCache(maxsize=1024, ttl=24 * 3600)
+
+def _parse_start_date(start_date: Optional[str]) -> date:
+    if not start_date:
+        return datetime.utcnow().date()
+    try:
+        return datetime.strptime(start_date, "%Y-%m-%d").date()
+    except:
+        return datetime.utcnow().date()
+
+
+def plan_rules(user: User) -> Dict:
+    """Generation inputs stored on the plan so later days can be rebuilt identically."""
+    goal = user.goal or "maintain"
+    diet_info = recommend_diet(user.weight_kg, user.target_weight_kg, goal)
+    return {
+        "goal": goal,
+        "fitness_level": user.fitness_level or "beginner",
+        "preference": "nonveg", # Default preference
+        "equipment": "with_equipment", # Default to using equipment if available
+        "calories": diet_info["calories"],
+        "macros": diet_info["macros"],
+    }
+
+
+def is_break_day(day_index: int) -> bool:
+    # Rule: Every 3rd day is a Rest Day (Day 3, 6, 9...)
+    return (day_index + 1) % 3 == 0
+
+
+def build_plan_days(rules: Dict, start_date_obj: date, seed: int, day_indexes: Iterable[int]) -> List[Dict]:
     """
-    Generate a 30-day workout and diet plan.
+    DailyPlanEntry row dicts for the given 0-based day indexes.
+    Workouts come from one seeded RNG in day order, so every exercise day up to
+    the last requested one is redrawn; any subset therefore matches eager generation.
     """
+    day_indexes = sorted(day_indexes)
+    if not day_indexes:
+        return []
     
-    if not start_date:
-        start_date_obj = datetime.utcnow().date()
-    else:
+    exercise_days = [i for i in range(day_indexes[-1] + 1) if not is_break_day(i)]
+    workouts = generate_workout_month(rules["goal"], rules["fitness_level"], rules["equipment"], exercise_days, seed)
+    
+    return [
+        dict(
+            date=start_date_obj + timedelta(days=i),
+            is_exercise_day=not is_break_day(i),
+            exercise_payload=compact_routine(workouts.get(i, [])),
+            diet_payload=recommend_meals_for_day(rules["calories"], rules["macros"], rules["preference"], rules["goal"], i),
+            streak_group=None
+        )
+        for i in day_indexes
+    ]
+
+
+# Plan Templates
+
+def template_inputs(rules: Dict) -> Dict:
+    """
+    The generation inputs that determine a plan's day contents.
+    Calories and macros are per-user and are applied when an entry is read.
+    """
+    return {
+        "version": TEMPLATE_VERSION,
+        "total_days": TOTAL_DAYS,
+        "goal": rules["goal"],
+        "fitness_level": rules["fitness_level"],
+        "preference": rules["preference"],
+        "equipment": rules["equipment"],
+    }
+
+
+def template_hash(inputs: Dict) -> str:
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def build_template(inputs: Dict, content_hash: str) -> PlanTemplate:
+    """Generate every day of a template; the workout seed is derived from the hash."""
+    seed = int(content_hash[:7], 16)
+    exercise_days = [i for i in range(TOTAL_DAYS) if not is_break_day(i)]
+    workouts = generate_workout_month(inputs["goal"], inputs["fitness_level"], inputs["equipment"], exercise_days, seed)
+
+    template = PlanTemplate(content_hash=content_hash, inputs_json=inputs, seed=seed, total_days=TOTAL_DAYS)
+    for i in range(TOTAL_DAYS):
+        payload = compact_routine(workouts.get(i, []))
+        template.days.append(PlanTemplateDay(
+            day_index=i,
+            is_exercise_day=not is_break_day(i),
+            exercise_payload=payload,
+            diet_payload={"meals": meals_for_day(inputs["preference"], inputs["goal"], i)},
+            exercises=_entry_exercises(payload, PlanTemplateExercise),
+        ))
+    return template
+
+
+def template_day_ids(template_id: int) -> List[int]:
+    """Day ids of a committed template, indexed by day_index."""
+    return _template_day_ids.get_or_set(template_id, lambda: list(db.session.scalars(
+        select(PlanTemplateDay.id)
+        .where(PlanTemplateDay.template_id == template_id)
+        .order_by(PlanTemplateDay.day_index)
+    )))
+
+
+def get_or_create_template(rules: Dict) -> Tuple[int, List[int]]:
+    """
+    Find the template for `rules` by content hash, generating it on first use.
+    Returns the template id and its day ids indexed by day_index.
+    """
+    inputs = template_inputs(rules)
+    content_hash = template_hash(inputs)
+    lookup = select(PlanTemplate.id).where(PlanTemplate.content_hash == content_hash)
+
+    template_id = db.session.scalar(lookup)
+    if template_id is None:
+        template = build_template(inputs, content_hash)
         try:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-        except:
-            start_date_obj = datetime.utcnow().date()
+            with db.session.begin_nested():
+                db.session.add(template)
+        except IntegrityError:
+            # A concurrent generator committed the same template first
+            template_id = db.session.scalar(lookup)
+        else:
+            # Not cached until it is committed and looked up again
+            return template.id, [day.id for day in template.days]
+    return template_id, template_day_ids(template_id)
 
-    goal = user.goal or "maintain"
-    fitness_level = user.fitness_level or "beginner"
-    preference = "nonveg" # Default preference
+
+def template_plan_days(start_date_obj: date, day_ids: List[int], day_indexes: Iterable[int]) -> List[Dict]:
+    """DailyPlanEntry row dicts that point at template days."""
+    return [
+        dict(
+            date=start_date_obj + timedelta(days=i),
+            is_exercise_day=not is_break_day(i),
+            template_day_id=day_ids[i],
+            streak_group=None
+        )
+        for i in day_indexes
+    ]
+
+
+def entry_exercise_payload(entry: DailyPlanEntry) -> List:
+    """Compact exercise payload of an entry, wherever it is stored."""
+    if entry.template_day_id is not None:
+        return entry.template_day.exercise_payload or []
+    return entry.exercise_payload or []
+
+
+def entry_diet_payload(entry: DailyPlanEntry) -> Optional[Dict]:
+    """Diet payload of an entry, with the plan's own calorie and macro targets."""
+    if entry.template_day_id is None:
+        return entry.diet_payload
+    rules = (entry.plan.metadata_json or {}).get("rules") or {}
+    return day_diet_payload(rules.get("calories"), rules.get("macros") or {}, entry.template_day.diet_payload["meals"])
+
+
+def build_month_plan(user: User, start_date_obj: date, materialize_days: Optional[int] = None) -> Tuple[Dict, List[Dict]]:
+    """
+    Compute a 30-day plan on top of the user's shared template.
+    Returns the UserPlan column values and the DailyPlanEntry row dicts to write now:
+    all 30 days, or with `materialize_days` only those up to that many days past today.
+    """
+    rules = plan_rules(user)
+    template_id, day_ids = get_or_create_template(rules)
+    total_days = TOTAL_DAYS
+    end_date = start_date_obj + timedelta(days=total_days - 1)
     
-    diet_info = recommend_diet(user.weight_kg, user.target_weight_kg, goal)
-    calories = diet_info["calories"]
-    macros = diet_info["macros"]
+    materialized_through = None
+    last_index = total_days - 1
+    if materialize_days:
+        through = max(start_date_obj, datetime.utcnow().date()) + timedelta(days=materialize_days)
+        if through < end_date:
+            materialized_through = through
+            last_index = (through - start_date_obj).days
 
-    plan = UserPlan(
+    plan_values = dict(
         user_id=user.id,
         plan_type="workout+diet",
-        goal=goal,
-        preference=preference,
+        goal=rules["goal"],
+        preference=rules["preference"],
         start_date=start_date_obj,
-        end_date=start_date_obj + timedelta(days=29),
+        end_date=end_date,
         frequency_per_week=5,
-        fitness_level=fitness_level,
-        metadata_json={"total_days": 30}
+        fitness_level=rules["fitness_level"],
+        metadata_json={"total_days": total_days, "template_id": template_id, "equipment": rules["equipment"], "rules": rules},
+        materialized_through=materialized_through
     )
     
-    entries = []
-    
-    for i in range(30):
-        current_date = start_date_obj + timedelta(days=i)
-        
-        # Rule: Every 3rd day is a Rest Day (Day 3, 6, 9...)
-        is_break = ((i + 1) % 3 == 0)
-            
-        diet_payload = recommend_meals_for_day(calories, macros, preference, goal, i)
-        
-        exercise_payload = []
-        if not is_break:
-            exercise_payload = recommend_workout_day(goal, fitness_level, i, is_break)
-        
-        entry = DailyPlanEntry(
-            date=current_date,
-            is_exercise_day=not is_break,
-            exercise_payload=exercise_payload,
-            diet_payload=diet_payload,
-            streak_group=1
-        )
-        entries.append(entry)
+    return plan_values, template_plan_days(start_date_obj, day_ids, range(last_index + 1))
+
+
+def generate_month_plan(user: User, start_date: Optional[str] = None, commit: bool = True) -> Optional[UserPlan]:
+    """
+    Generate a 30-day workout and diet plan.
+    Day contents live in a template shared with every user on the same inputs.
+    With commit=False the plan is only flushed, leaving the transaction to the caller.
+    """
+    plan_values, days = build_month_plan(user, _parse_start_date(start_date), current_app.config.get("PLAN_MATERIALIZE_DAYS"))
     
-    plan.daily_entries = entries
+    plan = UserPlan(**plan_values)
+    plan.daily_entries = [DailyPlanEntry(**day) for day in days]
     
     db.session.add(plan)
-    db.session.commit()
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
     return plan
+
+
+def ensure_plan_entries(plan: UserPlan, through_date: date, commit: bool = True) -> int:
+    """
+    Materialize a rolling plan's missing days up to `through_date` (capped at
+    the plan end). Plans generated eagerly are left alone. Concurrent callers
+    claim the range with a conditional UPDATE so days are written once.
+    With commit=False the rows are only flushed, for the caller to commit.
+    Returns the number of entries created.
+    """
+    meta = plan.metadata_json or {}
+    old = plan.materialized_through
+    if old is None or not ("template_id" in meta or "seed" in meta):
+        return 0
+    through = min(through_date, plan.end_date)
+    if through <= old:
+        return 0
+    
+    claimed = UserPlan.query.filter_by(id=plan.id, materialized_through=old).update(
+        {"materialized_through": through}, synchronize_session=False
+    )
+    if not claimed:
+        db.session.refresh(plan) # Someone else materialized these days
+        return 0
+    
+    first = (old - plan.start_date).days + 1
+    last = (through - plan.start_date).days
+    day_indexes = range(max(first, 0), last + 1)
+    if "template_id" in meta:
+        days = template_plan_days(plan.start_date, template_day_ids(meta["template_id"]), day_indexes)
+        entries = [DailyPlanEntry(plan_id=plan.id, **day) for day in days]
+    else:
+        # Rolling plan from before templates: rebuild its own days from the stored seed
+        days = build_plan_days(meta["rules"], plan.start_date, meta["seed"], day_indexes)
+        entries = [DailyPlanEntry(plan_id=plan.id, exercises=_entry_exercises(day["exercise_payload"]), **day) for day in days]
+    db.session.add_all(entries)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    return len(days)
+
+
+def materialize_window(plan: Optional[UserPlan], today: Optional[date] = None) -> None:
+    """Make sure a plan has rows through today + PLAN_MATERIALIZE_DAYS."""
+    if plan is None or plan.materialized_through is None:
+        return
+    today = today or datetime.utcnow().date()
+    ensure_plan_entries(plan, today + timedelta(days=current_app.config.get("PLAN_MATERIALIZE_DAYS") or 0))
+
+
+def materialize_plans_through(day: date) -> int:
+    """
+    Materialize every rolling plan up to `day` (capped at its end), so batch
+    jobs can read entries set-based. Returns the number of plans extended.
+    """
+    plans = UserPlan.query.filter(
+        UserPlan.materialized_through < day,
+        UserPlan.materialized_through < UserPlan.end_date,
+    ).all()
+    for plan in plans:
+        ensure_plan_entries(plan, day)
+    return len(plans)
+
+
+def bump_plan_version(plan_id: int) -> None:
+    """Invalidate a plan's ETags after one of its days changed; the caller commits."""
+    UserPlan.query.filter_by(id=plan_id).update(
+        {"version": func.coalesce(UserPlan.version, 0) + 1},
+        synchronize_session=False,
+    )
+
+
+def plan_etag(plan: UserPlan, *extra) -> str:
+    """
+    Validator for responses built from `plan`: changes with its version, with
+    materialization and, via `extra` (e.g. today's date), with anything else
+    the response depends on. created_at guards against reused plan ids.
+    """
+    parts = (plan.id, plan.created_at, plan.version, plan.materialized_through) + extra
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def plans_version(user_id: int) -> Tuple:
+    """(plan count, version sum): changes when any of the user's plans does."""
+    return db.session.query(func.count(UserPlan.id), func.coalesce(func.sum(func.coalesce(UserPlan.version, 0)), 0)).filter(
+        UserPlan.user_id == user_id
+    ).one()
+
+
+def _entry_exercises(exercise_payload: List[List], model=PlanEntryExercise) -> List:
+    """Normalized exercise rows (plan entry or template day) mirroring a compact payload."""
+    return [
+        model(exercise_id=exercise_id, position=position, phase=phase, sets=sets, reps=str(reps))
+        for position, (exercise_id, phase, sets, reps) in enumerate(exercise_payload)
+    ]
+
+
+def entry_exercises(user_id: int):
+    """
+    Subquery of the exercises prescribed on the user's plan entries, one row
+    per (entry_id, position) with exercise_id, phase, sets, reps and the
+    entry's date and is_exercise_completed. Entries on a template read their
+    template day's plan_template_exercises; older entries their own
+    plan_entry_exercises. Per-exercise analytics should select from this.
+    """
+    def prescribed(exercise, on):
+        return (
+            select(
+                DailyPlanEntry.id.label("entry_id"), DailyPlanEntry.date, DailyPlanEntry.is_exercise_completed,
+                exercise.exercise_id, exercise.position, exercise.phase, exercise.sets, exercise.reps,
+            )
+            .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+            .join(exercise, on)
+            .where(UserPlan.user_id == user_id)
+        )
+
+    return union_all(
+        prescribed(PlanTemplateExercise, PlanTemplateExercise.template_day_id == DailyPlanEntry.template_day_id),
+        prescribed(PlanEntryExercise, PlanEntryExercise.entry_id == DailyPlanEntry.id),
+    ).subquery("entry_exercises")
+
+
+def exercise_totals(user_id: int, limit: int = 10) -> List[Dict]:
+    """
+    The user's most completed exercises: how many plan days prescribed each
+    and on how many of those the workout was checked in.
+    """
+    prescribed = entry_exercises(user_id)
+    completed = func.sum(case((prescribed.c.is_exercise_completed.is_(True), 1), else_=0))
+    rows = db.session.execute(
+        select(prescribed.c.exercise_id, Exercise.name, func.count().label("prescribed"), completed.label("completed"))
+        .join(Exercise, Exercise.id == prescribed.c.exercise_id)
+        .group_by(prescribed.c.exercise_id, Exercise.name)
+        .order_by(completed.desc(), func.count().desc(), prescribed.c.exercise_id)
+        .limit(limit)
+    )
+    return [
+        {"exercise_id": row.exercise_id, "name": row.name, "prescribed": row.prescribed, "completed": row.completed}
+        for row in rows
+    ]
+
+
+def compact_legacy_payloads(batch_size: int = 500) -> int:
+    """
+    Migrate entries that still store full exercise dicts to the compact
+    [exercise_id, phase, sets, reps] format and backfill plan_entry_exercises.
+    Idempotent; returns the number of entries converted.
+    """
+    converted = 0
+    last_id = 0
+    while True:
+        batch = (
+            DailyPlanEntry.query.options(selectinload(DailyPlanEntry.exercises))
+            .filter(DailyPlanEntry.id > last_id)
+            .order_by(DailyPlanEntry.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for entry in batch:
+            payload = entry.exercise_payload or []
+            if payload and isinstance(payload[0], dict):
+                entry.exercise_payload = [
+                    [ex["id"], ex.get("phase"), ex.get("sets"), ex.get("reps")]
+                    for ex in payload if ex.get("id") is not None
+                ]
+                converted += 1
+            if entry.exercise_payload and not entry.exercises:
+                entry.exercises = _entry_exercises(entry.exercise_payload)
+        last_id = batch[-1].id
+        db.session.commit()
+    return converted
+
+
+# Bulk Regeneration
+
+def plan_regeneration_query(goal: Optional[str] = None, fitness_level: Optional[str] = None, expiring_before: Optional[date] = None):
+    """Query of User.id for users whose plans should be regenerated."""
+    query = db.session.query(User.id)
+    if goal:
+        query = query.filter(User.goal == goal)
+    if fitness_level:
+        query = query.filter(User.fitness_level == fitness_level)
+    if expiring_before:
+        expiring = (
+            select(UserPlan.user_id)
+            .group_by(UserPlan.user_id)
+            .having(func.max(UserPlan.end_date) < expiring_before)
+        )
+        query = query.filter(User.id.in_(expiring))
+    return query.order_by(User.id)
+
+
+def _delete_plans(user_ids: List[int]) -> None:
+    """
+    Bulk-delete the users' plans and everything hanging off their entries,
+    then drop the leaderboard points of the deleted check-ins and mark the
+    users' streaks for a rescan. Does not commit.
+    """
+    from services.leaderboard_service import rebuild_leaderboards
+    plan_ids = select(UserPlan.id).where(UserPlan.user_id.in_(user_ids))
+    entry_ids = select(DailyPlanEntry.id).where(DailyPlanEntry.plan_id.in_(plan_ids))
+    for stmt in (
+        delete(PlanEntryExercise).where(PlanEntryExercise.entry_id.in_(entry_ids)),
+        delete(UserCheckIn).where(UserCheckIn.daily_entry_id.in_(entry_ids)),
+        delete(DailyPlanEntry).where(DailyPlanEntry.plan_id.in_(plan_ids)),
+        delete(UserPlan).where(UserPlan.user_id.in_(user_ids)),
+        update(User).where(User.id.in_(user_ids)).values(
+            workout_streak=0, diet_streak=0, workout_streak_through=None, diet_streak_through=None,
+        ),
+    ):
+        db.session.execute(stmt.execution_options(synchronize_session=False))
+    rebuild_leaderboards(user_ids, commit=False)
+
+
+def regenerate_plans_for_users(user_ids: List[int], start_date: Optional[str] = None, keep_history: bool = False, chunk_size: int = 1000) -> Dict:
+    """
+    Replace the plans of `user_ids` using bulk INSERTs in chunks of `chunk_size` rows.
+    Unless `keep_history`, the users' streaks are rescanned over the new plans.
+    One transaction per call; returns counts of users and entries written.
+    """
+    from services.streak_service import rescan_streaks
+    start_date_obj = _parse_start_date(start_date)
+    users = User.query.filter(User.id.in_(user_ids)).all()
+    if not keep_history:
+        _delete_plans(user_ids)
+
+    materialize_days = current_app.config.get("PLAN_MATERIALIZE_DAYS")
+    built = [build_month_plan(user, start_date_obj, materialize_days) for user in users]
+    if not built:
+        db.session.commit()
+        return {"users": 0, "entries": 0}
+
+    plan_ids = db.session.scalars(
+        insert(UserPlan).returning(UserPlan.id, sort_by_parameter_order=True),
+        [plan_values for plan_values, _ in built],
+    ).all()
+    entry_rows = [
+        dict(day, plan_id=plan_id)
+        for plan_id, (_, days) in zip(plan_ids, built)
+        for day in days
+    ]
+
+    # Exercises stay on the shared template days; entry_exercises() reads them from there
+    for i in range(0, len(entry_rows), chunk_size):
+        db.session.execute(insert(DailyPlanEntry), entry_rows[i:i + chunk_size])
+
+    if not keep_history:
+        for user in users:
+            rescan_streaks(user, commit=False)
+    db.session.commit()
+    return {"users": len(users), "entries": len(entry_rows)}
+
+
+_worker_app = None
+
+
+def _init_regenerate_worker() -> None:
+    global _worker_app
+    import app as app_module
+    _worker_app = app_module.app
+
+
+def _regenerate_worker(user_ids: List[int], start_date: Optional[str], keep_history: bool) -> Dict:
+    with _worker_app.app_context():
+        return regenerate_plans_for_users(user_ids, start_date, keep_history)
+
+
+def regenerate_plans(user_id_query, workers: int = 4, batch_size: int = 200, start_date: Optional[str] = None,
+                     keep_history: bool = False, report: Callable[[str], None] = print) -> Dict:
+    """
+    Stream user ids from `user_id_query` and regenerate their plans across a
+    process pool, `batch_size` users per task. Reports throughput as batches finish.
+    """
+    totals = {"users": 0, "entries": 0, "batches": 0}
+    started = time.perf_counter()
+
+    def collect(done):
+        for future in done:
+            result = future.result()
+            totals["users"] += result["users"]
+            totals["entries"] += result["entries"]
+            totals["batches"] += 1
+        elapsed = time.perf_counter() - started
+        report(f"{totals['users']} users, {totals['entries']} entries in {elapsed:.1f}s "
+               f"({totals['users'] / elapsed:.0f} users/s, {totals['entries'] / elapsed:.0f} entries/s)")
+
+    user_ids: Iterable = (user_id for (user_id,) in user_id_query.yield_per(batch_size))
+    if db.engine.dialect.name == "sqlite":
+        # SQLite readers block writers: don't hold a cursor open while workers commit
+        user_ids = list(user_ids)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"), initializer=_init_regenerate_worker) as pool:
+        pending = set()
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) < batch_size:
+                continue
+            pending.add(pool.submit(_regenerate_worker, batch, start_date, keep_history))
+            batch = []
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        if batch:
+            pending.add(pool.submit(_regenerate_worker, batch, start_date, keep_history))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    return totals
@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+from typing import Dict, List
+from sqlalchemy import select
+from models import DailyPlanEntry, Notification, UserPlan, db
+from services.plan_service import is_break_day
+
+# Read Models
+#
+# Small __slots__ objects filled from column-projected queries, for pages and
+# endpoints that show a few scalar fields and never need the ORM instance or
+# its JSON payload columns.
+
+class PlanDay:
+    """A plan day's date and completion flags, as calendars show it."""
+
+    __slots__ = ("id", "date", "is_exercise_day", "is_exercise_completed", "is_diet_completed")
+
+    COLUMNS = (
+        DailyPlanEntry.id, DailyPlanEntry.date, DailyPlanEntry.is_exercise_day,
+        DailyPlanEntry.is_exercise_completed, DailyPlanEntry.is_diet_completed,
+    )
+
+    def __init__(self, id, date, is_exercise_day, is_exercise_completed, is_diet_completed):
+        self.id = id  # None for days not materialized yet
+        self.date = date
+        self.is_exercise_day = is_exercise_day
+        self.is_exercise_completed = is_exercise_completed
+        self.is_diet_completed = is_diet_completed
+
+    @classmethod
+    def of(cls, entry: DailyPlanEntry) -> "PlanDay":
+        return cls(entry.id, entry.date, entry.is_exercise_day, entry.is_exercise_completed, entry.is_diet_completed)
+
+    @property
+    def is_done(self) -> bool:
+        """Diet checked in, and the workout too on exercise days."""
+        return bool(self.is_diet_completed and (self.is_exercise_completed or not self.is_exercise_day))
+
+    def status(self, today: date) -> str:
+        """Calendar state: future, completed, missed or today."""
+        if self.date > today:
+            return "future"
+        if self.is_done:
+            return "completed"
+        return "missed" if self.date < today else "today"
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "date": self.date.isoformat(),
+            "is_exercise_day": self.is_exercise_day,
+            "is_exercise_completed": self.is_exercise_completed,
+            "is_diet_completed": self.is_diet_completed,
+        }
+
+
+def plan_days(plan: UserPlan) -> List[PlanDay]:
+    """
+    Every day of `plan` in date order. Days a rolling plan hasn't
+    materialized yet are filled in from its schedule, without writing them.
+    """
+    days = [
+        PlanDay(*row) for row in db.session.execute(
+            select(*PlanDay.COLUMNS).where(DailyPlanEntry.plan_id == plan.id).order_by(DailyPlanEntry.date)
+        )
+    ]
+    if plan.materialized_through is not None:
+        day = plan.materialized_through + timedelta(days=1)
+        while day <= plan.end_date:
+            days.append(PlanDay(None, day, not is_break_day((day - plan.start_date).days), False, False))
+            day += timedelta(days=1)
+    return days
+
+
+class NotificationView:
+    """The fields a notification is shown with, in the feed and on the live stream."""
+
+    __slots__ = ("id", "user_id", "title", "message", "type", "is_read", "created_at", "payload_json")
+
+    COLUMNS = (
+        Notification.id, Notification.user_id, Notification.title, Notification.message,
+        Notification.type, Notification.is_read, Notification.created_at, Notification.payload_json,
+    )
+
+    def __init__(self, id, user_id, title, message, type, is_read, created_at, payload_json):
+        self.id = id
+        self.user_id = user_id
+        self.title = title
+        self.message = message
+        self.type = type
+        self.is_read = is_read
+        self.created_at = created_at
+        self.payload_json = payload_json
+
+    @classmethod
+    def from_rows(cls, rows) -> List["NotificationView"]:
+        """Views of rows selected (or RETURNING) with COLUMNS."""
+        return [cls(*row) for row in rows]
@@ -1,9 +1,32 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, case, distinct, func, or_, select, update
+from sqlalchemy.orm import aliased
 from models import User, DailyPlanEntry, UserPlan, db
+from services.plan_service import bump_plan_version, ensure_plan_entries, materialize_plans_through, plans_version
+from services.day_context import day_context
 
 # Streak Service
 
+# kind -> (streak column, column holding the last day already counted in it)
+STREAK_COLUMNS = {
+    "workout": (User.workout_streak, User.workout_streak_through),
+    "diet": (User.diet_streak, User.diet_streak_through),
+}
+
+# kind -> SQL condition for a plan day that keeps the streak alive (rest days always do)
+KEPT_CONDITIONS = {
+    "workout": or_(DailyPlanEntry.is_exercise_day.is_(False), DailyPlanEntry.is_exercise_completed.is_(True)),
+    "diet": DailyPlanEntry.is_diet_completed.is_(True),
+}
+
+
+def _is_kept(kind: str, entry) -> bool:
+    if kind == "workout":
+        return (not entry.is_exercise_day) or bool(entry.is_exercise_completed)
+    return bool(entry.is_diet_completed)
+
 def estimate_transformation_days(weight: float, target: float, goal: str) -> int:
     """
     Estimate transformation days using linear regression-style calculation.
@@ -39,95 +62,461 @@ def estimate_transformation_days(weight: float, target: float, goal: str) -> int
     return days
 
 def calculate_streaks(user: User) -> Dict:
+    """Wrapper for backward compatibility: a full rescan, see rescan_streaks()."""
+    if not user: return {"workout": 0, "diet": 0}
+    return rescan_streaks(user)
+
+
+# Streak History
+#
+# DailyPlanEntry.streak_group numbers workout streak runs (gaps and islands):
+# every kept day of a run carries the date.toordinal() of the run's first day,
+# missed and not-yet-judged days carry NULL. Run ids only grow over time, so
+# the run in progress is always the user's highest group so far.
+
+def _plans_of(user_condition):
+    return select(UserPlan.id).join(User, User.id == UserPlan.user_id).where(user_condition)
+
+
+def _mark_workout_day(day: date, user_condition) -> None:
     """
-    Calculate and update user streaks (Workout & Diet).
-    Rules:
-    - Workout Streak: Consecutive days of exercise. Rest days count if not missed.
-      If missed, streak resets.
-    - Diet Streak: Consecutive days of diet completion.
+    Set streak_group on `day`'s entries of the users matching `user_condition`,
+    before their workout counters move past the day: a kept day joins the run
+    in progress, or starts one if the streak is 0; a missed day joins none.
     """
-    if not user: return {"workout": 0, "diet": 0}
+    owner = select(UserPlan.user_id).where(UserPlan.id == DailyPlanEntry.plan_id).correlate_except(UserPlan).scalar_subquery()
+    streak = select(User.workout_streak).where(User.id == owner).scalar_subquery()
+    earlier, earlier_plan = aliased(DailyPlanEntry), aliased(UserPlan)
+    run = (
+        select(func.max(earlier.streak_group))
+        .join(earlier_plan, earlier_plan.id == earlier.plan_id)
+        .where(earlier_plan.user_id == owner, earlier.date < day)
+        .scalar_subquery()
+    )
+    starts_run = day.toordinal()
+    db.session.execute(
+        update(DailyPlanEntry)
+        .where(DailyPlanEntry.date == day, DailyPlanEntry.plan_id.in_(_plans_of(user_condition)))
+        .values(streak_group=case(
+            (KEPT_CONDITIONS["workout"], case((streak > 0, func.coalesce(run, starts_run)), else_=starts_run)),
+            else_=None,
+        ))
+        .execution_options(synchronize_session=False)
+    )
 
-    # Find active or latest plan
-    plan = UserPlan.query.filter_by(user_id=user.id).order_by(UserPlan.created_at.desc()).first()
-    if not plan: return {"workout": 0, "diet": 0}
-    
-    today = datetime.utcnow().date()
-    
-    # Fetch entries up to yesterday (Streaks are usually built on past completetion)
-    # But for "Current Streak" we include today if done.
-    
-    entries = DailyPlanEntry.query.filter_by(plan_id=plan.id).filter(DailyPlanEntry.date <= today).order_by(DailyPlanEntry.date.desc()).all()
-    
-    # Calculate Workout Streak
-    w_streak = 0
-    # Sort entries by date desc (Today -> Past)
-    # Filter only relevant days (Exercise days or completed entries)
-    # Actually, streak rules: Consecutive days where (Exercise Done OR Rest Day).
-    # If today is NOT done yet, it shouldn't break streak from yesterday.
-    
-    # Check if today is in list
-    has_today = False
-    if entries and entries[0].date == today:
-        has_today = True
-        
-    start_index = 0
-    
-    # Special handling for "Today":
-    # If Today is DONE -> Streak includes today.
-    # If Today is NOT DONE -> Streak is whatever it was yesterday (doesn't reset to 0 unless yesterday was missed).
-    
-    if has_today:
-        e = entries[0]
-        today_success = (e.is_exercise_day and e.is_exercise_completed) or (not e.is_exercise_day)
-        if today_success:
-            w_streak = 1
-            start_index = 1
-        else:
-            # Today not done (or falied), so streak is based on yesterday.
-            # But if today is required and failed? (Usually exercise must be done).
-            # If not done yet, we ignore today for streak calculation and check yesterday.
-            start_index = 1
-            pass
-            
-            
-    # Iterate backwards
-    for i in range(start_index, len(entries)):
-        e = entries[i]
-        is_success = (e.is_exercise_day and e.is_exercise_completed) or (not e.is_exercise_day)
-        
-        # Check continuity (optional, but assumed contiguous for now)
-        # If we find a failure, STOP.
-        if is_success:
-            w_streak += 1
-        else:
-            break
 
-    # Calculate Diet Streak (simpler: pure consecutive completed days)
-    d_streak = 0
-    d_start = 0
-    if has_today:
-        if entries[0].is_diet_completed:
-            d_streak = 1
-            d_start = 1
-        else:
-            d_start = 1 # Skip today if not done
-            
-    for i in range(d_start, len(entries)):
-        if entries[i].is_diet_completed:
-            d_streak += 1
-        else:
+def _run_in_progress(user_id: int, before: date) -> Optional[int]:
+    return db.session.scalar(
+        select(func.max(DailyPlanEntry.streak_group))
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .where(UserPlan.user_id == user_id, DailyPlanEntry.date <= before)
+    )
+
+
+def rebuild_streak_groups(user: User) -> int:
+    """
+    Recompute streak_group over all of a user's plans, bumping the version of
+    each plan with an entry that changed; returns entries changed.
+    """
+    through = user.workout_streak_through or datetime.utcnow().date() - timedelta(days=1)
+    rows = (
+        db.session.query(DailyPlanEntry.id, DailyPlanEntry.plan_id, DailyPlanEntry.date, DailyPlanEntry.is_exercise_day,
+                         DailyPlanEntry.is_exercise_completed, DailyPlanEntry.streak_group)
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .filter(UserPlan.user_id == user.id)
+        .all()
+    )
+    kept: Dict[date, bool] = {}
+    for row in rows:
+        kept[row.date] = kept.get(row.date, False) or _is_kept("workout", row)
+
+    groups: Dict[date, Optional[int]] = {}
+    run = None
+    for day in sorted(kept):
+        if day > through:
+            groups[day] = None
+            continue
+        run = (run or day.toordinal()) if kept[day] else None
+        groups[day] = run
+
+    changed = [row for row in rows if row.streak_group != groups[row.date]]
+    if changed:
+        db.session.execute(update(DailyPlanEntry), [{"id": row.id, "streak_group": groups[row.date]} for row in changed])
+        # Streak history is part of /api/plan/stats
+        for plan_id in {row.plan_id for row in changed}:
+            bump_plan_version(plan_id)
+    return len(changed)
+
+
+# Set-based Recomputation
+
+def _judged_days(kind: str, today: date, user_id: Optional[int] = None):
+    """
+    One row per (user, day with a plan entry) up to today with kept = 1/0,
+    over every plan; just `user_id`'s days if given. Today is only included
+    once kept, since the day isn't over.
+    """
+    kept = func.max(case((KEPT_CONDITIONS[kind], 1), else_=0))
+    query = (
+        select(UserPlan.user_id, DailyPlanEntry.date, kept.label("kept"))
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .where(DailyPlanEntry.date <= today)
+        .group_by(UserPlan.user_id, DailyPlanEntry.date)
+        .having(or_(DailyPlanEntry.date < today, kept == 1))
+    )
+    if user_id is not None:
+        query = query.where(UserPlan.user_id == user_id)
+    return query.subquery()
+
+
+def _islands(kind: str, today: date, user_id: Optional[int] = None):
+    """
+    Gaps and islands over _judged_days(): consecutive kept days share an
+    `island` number (row_number over all days minus row_number over days
+    with the same kept flag); `recency` is 1 on each user's latest day.
+    """
+    days = _judged_days(kind, today, user_id)
+    return select(
+        days.c.user_id,
+        days.c.date,
+        days.c.kept,
+        (
+            func.row_number().over(partition_by=days.c.user_id, order_by=days.c.date)
+            - func.row_number().over(partition_by=(days.c.user_id, days.c.kept), order_by=days.c.date)
+        ).label("island"),
+        func.row_number().over(partition_by=days.c.user_id, order_by=days.c.date.desc()).label("recency"),
+    ).subquery()
+
+
+def _current_runs(kind: str, today: date, user_id: Optional[int] = None):
+    """(user_id, days, last day) of each user's run containing their latest judged day, if kept."""
+    islands = _islands(kind, today, user_id)
+    return (
+        select(islands.c.user_id, func.count(), func.max(islands.c.date))
+        .where(islands.c.kept == 1)
+        .group_by(islands.c.user_id, islands.c.island)
+        .having(func.min(islands.c.recency) == 1)
+    )
+
+
+def recompute_streaks(today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Recompute every user's workout and diet streaks, and every streak_group,
+    from plan entries with window-function queries (SQLite 3.25+ and
+    PostgreSQL), then bulk-update users and entries. Used for repairs and
+    upgrades instead of calling rescan_streaks() per user.
+    """
+    today = today or datetime.utcnow().date()
+    yesterday = today - timedelta(days=1)
+
+    users = {
+        user_id: {"id": user_id, "workout_streak": 0, "diet_streak": 0,
+                  "workout_streak_through": yesterday, "diet_streak_through": yesterday}
+        for (user_id,) in db.session.query(User.id)
+    }
+    for kind, (streak_col, through_col) in STREAK_COLUMNS.items():
+        for user_id, days, last_day in db.session.execute(_current_runs(kind, today)):
+            users[user_id][streak_col.key] = days
+            users[user_id][through_col.key] = max(last_day, yesterday)
+    if users:
+        db.session.execute(update(User), list(users.values()))
+
+    islands = _islands("workout", today)
+    runs = (
+        select(
+            islands.c.user_id,
+            islands.c.date,
+            func.min(islands.c.date).over(partition_by=(islands.c.user_id, islands.c.island)).label("run_start"),
+        )
+        .where(islands.c.kept == 1)
+        .subquery()
+    )
+    entry_runs = (
+        select(DailyPlanEntry.id, runs.c.run_start)
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .join(runs, and_(runs.c.user_id == UserPlan.user_id, runs.c.date == DailyPlanEntry.date))
+    )
+    groups = [{"id": entry_id, "streak_group": run_start.toordinal()} for entry_id, run_start in db.session.execute(entry_runs)]
+    db.session.execute(
+        update(DailyPlanEntry)
+        .where(DailyPlanEntry.streak_group.isnot(None))
+        .values(streak_group=None)
+        .execution_options(synchronize_session=False)
+    )
+    if groups:
+        db.session.execute(update(DailyPlanEntry), groups)
+    # Streak history may have moved on any plan: drop every /api/plan/stats ETag
+    db.session.execute(update(UserPlan).values(version=func.coalesce(UserPlan.version, 0) + 1))
+
+    db.session.commit()
+    return {"users": len(users), "streak_days": len(groups)}
+
+
+def _latest_plan(user: User) -> Optional[UserPlan]:
+    return UserPlan.query.filter_by(user_id=user.id).order_by(UserPlan.created_at.desc()).first()
+
+
+def rescan_streaks(user: User, today: Optional[date] = None, commit: bool = True, attempts: int = 3) -> Dict:
+    """
+    Recompute one user's streaks and streak_group over all of their plans,
+    with the same queries as recompute_streaks(). Used after late check-ins
+    and for users not tracked incrementally yet. Each counter is written
+    compare-and-set against the values read before the scan. If a
+    concurrent check-in or rollover moved it first, that kind is scanned
+    again, up to `attempts` times. Plans are bumped when a counter or
+    streak_group moved. With commit=False the caller's transaction carries
+    the update.
+    """
+    today = today or datetime.utcnow().date()
+    yesterday = today - timedelta(days=1)
+    plan = _latest_plan(user)
+    if plan:
+        ensure_plan_entries(plan, today, commit=commit) # Rolling plans may not have rows for days the user skipped
+
+    pending = dict(STREAK_COLUMNS)
+    moved = False
+    for _ in range(attempts):
+        old = db.session.execute(
+            select(User.workout_streak, User.workout_streak_through, User.diet_streak, User.diet_streak_through)
+            .where(User.id == user.id)
+        ).one()
+        for kind, (streak_col, through_col) in list(pending.items()):
+            streak, through = 0, yesterday
+            for _user_id, days, last_day in db.session.execute(_current_runs(kind, today, user.id)):
+                streak, through = days, max(last_day, yesterday)
+            claimed = db.session.execute(
+                update(User)
+                .where(
+                    User.id == user.id,
+                    streak_col == getattr(old, streak_col.key),
+                    through_col == getattr(old, through_col.key),
+                )
+                .values({streak_col: streak, through_col: through})
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if claimed:
+                del pending[kind]
+                moved = moved or (streak, through) != (getattr(old, streak_col.key), getattr(old, through_col.key))
+        if not pending:
             break
-            
-    # Update User Model
-    if w_streak != user.workout_streak or d_streak != user.diet_streak:
-        user.workout_streak = w_streak
-        user.diet_streak = d_streak
+
+    if moved:
+        db.session.execute(
+            update(UserPlan)
+            .where(UserPlan.user_id == user.id)
+            .values(version=func.coalesce(UserPlan.version, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.expire(user, [col.key for cols in STREAK_COLUMNS.values() for col in cols])
+    rebuild_streak_groups(user)
+    if commit:
         db.session.commit()
-    
-    return {"workout": w_streak, "diet": d_streak}
+    return {"workout": user.workout_streak or 0, "diet": user.diet_streak or 0}
+
+
+def streak_segments(user_id: int) -> List[Dict]:
+    """
+    Every workout streak run of the user across all plans, oldest first,
+    from a single GROUP BY over streak_group.
+    """
+    rows = (
+        db.session.query(
+            DailyPlanEntry.streak_group,
+            func.min(DailyPlanEntry.date),
+            func.max(DailyPlanEntry.date),
+            func.count(distinct(DailyPlanEntry.date)),
+        )
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .filter(UserPlan.user_id == user_id, DailyPlanEntry.streak_group.isnot(None))
+        .group_by(DailyPlanEntry.streak_group)
+        .order_by(DailyPlanEntry.streak_group)
+    )
+    return [{"start": start, "end": end, "days": days} for _, start, end, days in rows]
+
+
+def streak_stats(user: User) -> Dict:
+    """Current, longest and past workout streaks plus the current diet streak."""
+    streaks = day_context(user).streaks
+    segments = streak_segments(user.id)
+    return {
+        "current_streak": streaks["workout"],
+        "longest_streak": max([segment["days"] for segment in segments] + [streaks["workout"]]),
+        "diet_streak": streaks["diet"],
+        "history": [
+            {"start": s["start"].isoformat(), "end": s["end"].isoformat(), "days": s["days"]}
+            for s in segments
+        ],
+    }
+
+
+def streak_stats_etag(user: User) -> str:
+    """
+    Validator for streak_stats(user), cheap enough to check before building
+    it: the (caught up) streaks and through dates, the versions of every plan
+    the history is drawn from, and today.
+    """
+    ctx = day_context(user)
+    parts = (
+        user.id, ctx.today, ctx.streaks, plans_version(user.id),
+        user.workout_streak_through, user.diet_streak_through,
+    )
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _kept_days(user_id: int, first: date, last: date) -> Dict[date, Dict[str, bool]]:
+    """Per day in [first, last] that has a plan entry, whether each streak was kept."""
+    rows = (
+        db.session.query(DailyPlanEntry.date, DailyPlanEntry.is_exercise_day, DailyPlanEntry.is_exercise_completed, DailyPlanEntry.is_diet_completed)
+        .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+        .filter(UserPlan.user_id == user_id, DailyPlanEntry.date.between(first, last))
+    )
+    days: Dict[date, Dict[str, bool]] = {}
+    for row in rows:
+        kept = days.setdefault(row.date, {kind: False for kind in STREAK_COLUMNS})
+        for kind in STREAK_COLUMNS:
+            kept[kind] = kept[kind] or _is_kept(kind, row)
+    return days
+
+
+def roll_streaks(user: User, through: Optional[date] = None, commit: bool = True) -> None:
+    """
+    Advance the stored streaks day by day up to `through` (default yesterday):
+    a kept day extends a streak, a missed one resets it, and a day without a
+    plan entry leaves it as is. Up-to-date users cost no queries; users who
+    were away cost one query over the days they missed. With commit=False
+    the caller's transaction carries the update.
+    """
+    through = through or datetime.utcnow().date() - timedelta(days=1)
+    if user.workout_streak_through is None or user.diet_streak_through is None:
+        rescan_streaks(user, commit=commit) # Not tracked incrementally yet: rescan once
+        return
+    first = min(user.workout_streak_through, user.diet_streak_through) + timedelta(days=1)
+    if first > through:
+        return
+
+    plan = _latest_plan(user)
+    if plan:
+        ensure_plan_entries(plan, through, commit=commit) # Rolling plans may not have rows for days the user skipped
+    days = _kept_days(user.id, first, through)
+
+    for kind, (streak_col, through_col) in STREAK_COLUMNS.items():
+        old_through = getattr(user, through_col.key)
+        streak = getattr(user, streak_col.key) or 0
+        run = _run_in_progress(user.id, old_through) if kind == "workout" and streak else None
+        groups = {}
+        day = old_through + timedelta(days=1)
+        while day <= through:
+            if day in days:
+                if days[day][kind]:
+                    streak, run = streak + 1, run or day.toordinal()
+                else:
+                    streak, run = 0, None
+                groups[day] = run
+            day += timedelta(days=1)
+        # Compare-and-set: a concurrent check-in or rollover that moved on first wins
+        claimed = User.query.filter(User.id == user.id, through_col == old_through).update(
+            {streak_col: streak, through_col: through}, synchronize_session=False
+        )
+        if claimed and kind == "workout":
+            for day, group in groups.items():
+                db.session.execute(
+                    update(DailyPlanEntry)
+                    .where(DailyPlanEntry.date == day, DailyPlanEntry.plan_id.in_(_plans_of(User.id == user.id)))
+                    .values(streak_group=group)
+                    .execution_options(synchronize_session=False)
+                )
+    if commit:
+        db.session.commit()
+
+
+def record_checkin(user: User, entry: DailyPlanEntry, kind: str) -> Optional[Dict]:
+    """
+    Count today's check-in toward the user's streak with a single atomic
+    UPDATE, so concurrent check-ins can't lose an increment, and return both
+    streaks as updated. Returns None for any other day: a late check-in for a
+    day the rollover already judged needs a rescan_streaks(), which
+    is the caller's to schedule. Leaves the commit to the caller.
+    """
+    today = datetime.utcnow().date()
+    if entry.date != today:
+        return None
+
+    roll_streaks(user, today - timedelta(days=1), commit=False)
+    streak_col, through_col = STREAK_COLUMNS[kind]
+    if kind == "workout":
+        _mark_workout_day(today, (User.id == user.id) & (through_col == today - timedelta(days=1)))
+    already_counted = through_col >= today
+    row = db.session.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values({
+            streak_col: case(
+                (already_counted, streak_col),
+                (through_col == today - timedelta(days=1), streak_col + 1),
+                else_=1,
+            ),
+            through_col: case((already_counted, through_col), else_=today),
+        })
+        .returning(User.workout_streak, User.diet_streak)
+        .execution_options(synchronize_session=False)
+    ).one()
+    return {"workout": row.workout_streak or 0, "diet": row.diet_streak or 0}
+
+
+def current_streaks(user: User) -> Dict:
+    """The user's streaks, read from their columns once rolled forward to yesterday."""
+    if not user: return {"workout": 0, "diet": 0}
+    roll_streaks(user)
+    return {"workout": user.workout_streak or 0, "diet": user.diet_streak or 0}
+
+
+def rollover_streaks(day: Optional[date] = None) -> Dict[str, int]:
+    """
+    Judge `day` (default yesterday) for every user: one set-based UPDATE per
+    streak for users counted through the day before, then a catch-up for users
+    further behind. Safe to run more than once for the same day.
+    """
+    day = day or datetime.utcnow().date() - timedelta(days=1)
+
+    # Rolling plans of inactive users may not have rows for the day yet
+    materialize_plans_through(day)
+
+    counts = {}
+    for kind, (streak_col, through_col) in STREAK_COLUMNS.items():
+        if kind == "workout":
+            _mark_workout_day(day, through_col == day - timedelta(days=1))
+        day_entries = (
+            select(DailyPlanEntry.id)
+            .join(UserPlan, UserPlan.id == DailyPlanEntry.plan_id)
+            .where(UserPlan.user_id == User.id, DailyPlanEntry.date == day)
+        )
+        result = db.session.execute(
+            update(User)
+            .where(through_col == day - timedelta(days=1))
+            .values({
+                streak_col: case(
+                    (day_entries.where(KEPT_CONDITIONS[kind]).exists(), streak_col + 1),
+                    (day_entries.exists(), 0),
+                    else_=streak_col,
+                ),
+                through_col: day,
+            })
+            .execution_options(synchronize_session=False)
+        )
+        counts[kind] = result.rowcount
+    db.session.commit()
+
+    lagging = User.query.filter(or_(
+        User.workout_streak_through.is_(None), User.workout_streak_through < day,
+        User.diet_streak_through.is_(None), User.diet_streak_through < day,
+    )).all()
+    for user in lagging:
+        roll_streaks(user, day)
+    counts["caught_up"] = len(lagging)
+    return counts
+
 
 def compute_streaks(user_id: int, plan_id: int) -> Dict:
     """Wrapper for backward compatibility."""
     user = User.query.get(user_id)
-    return calculate_streaks(user)
+    return current_streaks(user)
@@ -0,0 +1,147 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import aliased
+from models import WaterLog, WaterRollup, db
+from services.db_utils import upsert
+
+# Water Service
+
+DAILY_GOAL_ML = 3000
+MAX_LOG_ML = 5000  # Largest single log accepted
+
+# period -> first day of the period containing a date
+ROLLUP_PERIODS: Dict[str, Callable[[date], date]] = {
+    "week": lambda day: day - timedelta(days=day.weekday()),
+    "month": lambda day: day.replace(day=1),
+}
+
+
+def _previous_start(period: str, start: date) -> date:
+    return ROLLUP_PERIODS[period](start - timedelta(days=1))
+
+
+def log_water(user_id: int, amount_ml: int, day: Optional[date] = None) -> int:
+    """
+    Add `amount_ml` to the user's total for `day` (default today) and to its
+    week and month rollups: two atomic upserts, so concurrent taps all count.
+    Returns the day's new total; commits.
+    """
+    day = day or datetime.utcnow().date()
+    now = datetime.utcnow()
+    ((total,),) = upsert(
+        WaterLog,
+        [{"user_id": user_id, "date": day, "amount_ml": amount_ml, "updated_at": now}],
+        conflict=("user_id", "date"),
+        update=lambda excluded: {
+            "amount_ml": func.coalesce(WaterLog.amount_ml, 0) + excluded.amount_ml,
+            "updated_at": excluded.updated_at,
+        },
+        returning=(WaterLog.amount_ml,),
+    )
+    # Only the upsert that took the day above zero counts it as logged
+    first_of_day = total - amount_ml <= 0 < total
+    upsert(
+        WaterRollup,
+        [
+            {"user_id": user_id, "period": period, "period_start": start(day), "total_ml": amount_ml,
+             "days_logged": int(first_of_day), "updated_at": now}
+            for period, start in ROLLUP_PERIODS.items()
+        ],
+        conflict=("user_id", "period", "period_start"),
+        update=lambda excluded: {
+            "total_ml": WaterRollup.total_ml + excluded.total_ml,
+            "days_logged": WaterRollup.days_logged + excluded.days_logged,
+            "updated_at": excluded.updated_at,
+        },
+    )
+    db.session.commit()
+    return total
+
+
+def water_today(user_id: int, day: Optional[date] = None) -> int:
+    """The user's total for `day` (default today): a single-row read."""
+    day = day or datetime.utcnow().date()
+    return db.session.scalar(
+        select(WaterLog.amount_ml).where(WaterLog.user_id == user_id, WaterLog.date == day)
+    ) or 0
+
+
+def water_rollups(user_id: int, period: str, count: int, today: Optional[date] = None) -> List[Dict]:
+    """
+    The user's last `count` weeks or months up to the current one, oldest
+    first, read from water_rollups; periods without any water come back as 0.
+    """
+    today = today or datetime.utcnow().date()
+    starts = [ROLLUP_PERIODS[period](today)]
+    while len(starts) < count:
+        starts.append(_previous_start(period, starts[-1]))
+    rows = {
+        row.period_start: row for row in db.session.execute(
+            select(WaterRollup.period_start, WaterRollup.total_ml, WaterRollup.days_logged).where(
+                WaterRollup.user_id == user_id,
+                WaterRollup.period == period,
+                WaterRollup.period_start >= starts[-1],
+            )
+        )
+    }
+    rollups = []
+    for start in reversed(starts):
+        row = rows.get(start)
+        total, days = (row.total_ml, row.days_logged) if row else (0, 0)
+        rollups.append({
+            "start": start.isoformat(),
+            "total_ml": total,
+            "days_logged": days,
+            "avg_ml": total // days if days else 0,
+        })
+    return rollups
+
+
+def collapse_water_logs() -> int:
+    """
+    Merge each user's rows for a day into one holding the day's total, so
+    uq_water_logs_user_date can be built; water used to be logged a row per
+    glass. Returns rows removed.
+    """
+    first_ids = select(func.min(WaterLog.id)).group_by(WaterLog.user_id, WaterLog.date)
+    same_day = aliased(WaterLog)
+    day_total = (
+        select(func.sum(same_day.amount_ml))
+        .where(same_day.user_id == WaterLog.user_id, same_day.date == WaterLog.date)
+        .scalar_subquery()
+    )
+    db.session.execute(
+        update(WaterLog)
+        .where(WaterLog.id.in_(first_ids.having(func.count() > 1)))
+        .values(amount_ml=day_total)
+        .execution_options(synchronize_session=False)
+    )
+    removed = WaterLog.query.filter(WaterLog.id.not_in(first_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def rebuild_water_rollups() -> int:
+    """Recompute every water_rollups row from water_logs. Returns rollup rows written."""
+    totals = defaultdict(lambda: [0, 0])
+    logged = db.session.execute(
+        select(WaterLog.user_id, WaterLog.date, WaterLog.amount_ml).where(WaterLog.amount_ml > 0)
+    )
+    for user_id, day, amount in logged:
+        for period, start in ROLLUP_PERIODS.items():
+            total = totals[(user_id, period, start(day))]
+            total[0] += amount
+            total[1] += 1
+
+    now = datetime.utcnow()
+    db.session.query(WaterRollup).delete(synchronize_session=False)
+    if totals:
+        db.session.execute(insert(WaterRollup), [
+            {"user_id": user_id, "period": period, "period_start": start,
+             "total_ml": total, "days_logged": days, "updated_at": now}
+            for (user_id, period, start), (total, days) in totals.items()
+        ])
+    db.session.commit()
+    return len(totals)
@@ -1,99 +1,143 @@
-from typing import Dict, List
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set
 import random
-from models import Exercise
+import zlib
+from services.cache import TTLCache
+from services.exercise_catalog import catalog
 
 # Workout Service
 
-def generate_exercises_list(goal: str, fitness_level: str, equipment: str) -> List[Dict]:
+# Per-user daily routines, keyed by (user_id, date, goal, fitness_level, equipment)
+routine_cache = TTLCache(maxsize=2048, ttl=6 * 3600)
+
+def _primary_muscles(goal: str) -> List[str]:
+    """Target muscle groups for a goal key."""
+    # Map new simplified keys to logic
+    if "lose" in goal or "fat_loss" in goal: 
+        return ["Full Body", "Legs", "Chest", "Back"]
+    elif "gain" in goal or "muscle_gain" in goal: 
+        return ["Chest", "Back", "Legs", "Shoulders", "Arms"]
+    elif "recomp" in goal or "core" in goal: 
+        return ["Full Body", "Abs", "Back"]
+    return ["Full Body"] # Default
+
+
+def build_routine_pools(goal: str, fitness_level: str, equipment: str) -> Dict:
     """
-    Generate a professional 10-15 exercise workout routine.
-    Structure: Warm-up (2) -> Main (7-11) -> Finisher (1-2) -> Cool-down (1)
+    Resolve the candidate exercises for every routine phase once.
+    Pools are ordered by exercise id so seeded draws are reproducible.
     """
-    
     # Safety Check
     if not goal:
         goal = "general_fitness"
     
-    # 1. Determine Difficulty & Targets
-    diff_map = {"beginner": "Beginner", "intermediate": "Intermediate", "advanced": "Advanced"}
-    target_difficulty = diff_map.get(fitness_level, "Beginner")
-    
-    # Target Muscles based on Goal
-    primary_muscles = []
-    # Map new simplified keys to logic
-    if "lose" in goal or "fat_loss" in goal: 
-        primary_muscles = ["Full Body", "Legs", "Chest", "Back"]
-    elif "gain" in goal or "muscle_gain" in goal: 
-        primary_muscles = ["Chest", "Back", "Legs", "Shoulders", "Arms"]
-    elif "recomp" in goal or "core" in goal: 
-        primary_muscles = ["Full Body", "Abs", "Back"]
-    else: 
-        primary_muscles = ["Full Body"] # Default
+    primary_muscles = _primary_muscles(goal)
     
     # Equipment Filter
     # If no_equipment, strictly bodyweight. If with_equipment, prefer equipment but allow bodyweight.
     require_equip = (equipment == "with_equipment")
+    equipment_filter = None if require_equip else "Bodyweight"
     
-    # Helper to fetch by tag/type
-    def get_ex(tags, limit, allow_repeat=False, strict_muscle=False):
-        query = Exercise.query
-        
-        # Filter by equipment
-        if not require_equip:
-            query = query.filter(Exercise.equipment.ilike("%Bodyweight%"))
-            
-        # Filter by tags (partial match)
-        if isinstance(tags, list):
-            pass 
-        else:
-             query = query.filter(Exercise.tags.ilike(f"%{tags}%"))
-             
-        candidates = query.all()
-        
-        # Filter strictly by muscle if requested
-        if strict_muscle and primary_muscles:
-             candidates = [c for c in candidates if any(m.lower() in (c.muscle_group or "").lower() for m in primary_muscles)]
-             
-        if not candidates: return []
-        
-        return random.sample(candidates, min(limit, len(candidates)))
+    target_count = 10 if fitness_level == "beginner" else (12 if fitness_level == "intermediate" else 15)
+    main_count = target_count - 4 # Reserve for other phases
+    
+    # Main pool excludes warm-up/cool-down moves, scoped to muscle groups
+    main_excludes = ["warmup", "cooldown", "stretch"]
+    relevant_main = catalog.candidates(exclude_tags=main_excludes, equipment=equipment_filter, muscle_groups=primary_muscles)
+    if len(relevant_main) < main_count:
+        relevant_main = catalog.candidates(exclude_tags=main_excludes, equipment=equipment_filter) # Fallback to all if not enough specific ones
+    
+    return {
+        "warmup": catalog.candidates(tags=["warmup"], equipment=equipment_filter),
+        "mobility": catalog.candidates(tags=["mobility"]),
+        "main": relevant_main,
+        "main_count": main_count,
+        "hiit": catalog.candidates(tags=["hiit"], equipment=equipment_filter),
+        "abs": catalog.candidates(tags=["abs"], equipment=equipment_filter),
+        "stretch": catalog.candidates(tags=["stretch"], equipment=equipment_filter),
+    }
+
+
+def _pick(rng, candidates: List[Dict], limit: int, avoid: Set[int]) -> List[Dict]:
+    """Sample without repeats, drawing from avoided exercises only if the pool runs short."""
+    fresh = [c for c in candidates if c["id"] not in avoid]
+    picked = rng.sample(fresh, min(limit, len(fresh)))
+    if len(picked) < limit:
+        stale = [c for c in candidates if c["id"] in avoid]
+        picked += rng.sample(stale, min(limit - len(picked), len(stale)))
+    return picked
+
+
+def _format_exercise(ex: Dict, phase: str, sets: int, reps: str) -> Dict:
+    """Full exercise object as served to templates and the API."""
+    return {
+        "name": ex["name"],
+        "phase": phase,
+        "sets": sets,
+        "reps": reps,
+        "muscle_group": ex["muscle_group"],
+        "equipment": ex["equipment"],
+        "difficulty": ex["difficulty"],
+        "description": ex["description"],
+        "animation_url": ex["animation_url"] or "https://assets.lottiefiles.com/packages/lf20_9xRkZk.json",
+        "thumbnail_url": ex["thumbnail_url"] or "https://placehold.co/100x100?text=Ex",
+        "id": ex["id"]
+    }
+
+
+def compact_routine(routine: List[Dict]) -> List[List]:
+    """Reduce a routine to [exercise_id, phase, sets, reps] rows for storage."""
+    return [[ex["id"], ex["phase"], ex["sets"], ex["reps"]] for ex in routine]
+
+
+def hydrate_exercises(payload: Optional[List]) -> List[Dict]:
+    """
+    Expand a stored exercise_payload into full exercise objects.
+    Accepts the compact [exercise_id, phase, sets, reps] rows as well as the
+    legacy format that stored full dicts; exercises no longer in the catalog are skipped.
+    """
+    hydrated = []
+    for row in payload or []:
+        if isinstance(row, dict):
+            hydrated.append(row)
+            continue
+        exercise_id, phase, sets, reps = row
+        ex = catalog.get(exercise_id)
+        if ex:
+            hydrated.append(_format_exercise(ex, phase, sets, reps))
+    return hydrated
 
+
+def draw_routine(pools: Dict, rng=random, avoid: Iterable[int] = ()) -> List[Dict]:
+    """
+    Draw one routine from prebuilt pools.
+    Structure: Warm-up (2) -> Main (7-11) -> Finisher (1-2) -> Cool-down (1)
+    `avoid` holds exercise ids to skip when alternatives exist (e.g. the previous session).
+    """
+    avoid = set(avoid)
+    used: Set[int] = set()
     routine = []
     
     # PHASE 1: WARM-UP (2 Exercises)
     # Mobility, Light Cardio
-    warmups = get_ex("warmup", 2)
-    if not warmups: # Fallback query
-        warmups = Exercise.query.filter(Exercise.tags.ilike("%mobility%")).limit(2).all()
+    warmups = _pick(rng, pools["warmup"], 2, avoid)
+    if not warmups: # Fallback lookup
+        warmups = pools["mobility"][:2]
     routine.extend([{"phase": "Warm-up", "data": w} for w in warmups])
+    used.update(w["id"] for w in warmups)
 
     # PHASE 2: MAIN LIFT (7-11 Exercises)
-    target_count = 10 if fitness_level == "beginner" else (12 if fitness_level == "intermediate" else 15)
-    main_count = target_count - 4 # Reserve for other phases
-    
-    # Query Main Exercises
-    main_query = Exercise.query.filter(Exercise.tags.notin_(["warmup", "cooldown", "stretch"]))
-    if not require_equip:
-         main_query = main_query.filter(Exercise.equipment.ilike("%Bodyweight%"))
-    
-    # Filter by difficulty approx
-    all_main = main_query.all()
-    
-    # Scoping to muscle groups
-    relevant_main = [e for e in all_main if any(m.lower() in (e.muscle_group or "").lower() for m in primary_muscles)]
-    if len(relevant_main) < main_count:
-        relevant_main = all_main # Fallback to all if not enough specific ones
-        
-    selected_main = random.sample(relevant_main, min(main_count, len(relevant_main)))
+    selected_main = _pick(rng, pools["main"], pools["main_count"], avoid | used)
     routine.extend([{"phase": "Main Workout", "data": e} for e in selected_main])
+    used.update(e["id"] for e in selected_main)
     
     # PHASE 3: FINISHER (1-2 Exercises)
     # HIIT or Core
-    finishers = get_ex("hiit", 1) or get_ex("abs", 1)
+    finishers = _pick(rng, pools["hiit"], 1, used) or _pick(rng, pools["abs"], 1, used)
     routine.extend([{"phase": "Finisher", "data": f} for f in finishers])
 
     # PHASE 4: COOL-DOWN (1 Exercise)
-    cooldowns = get_ex("stretch", 1)
+    cooldowns = _pick(rng, pools["stretch"], 1, avoid)
     routine.extend([{"phase": "Cool-down", "data": c} for c in cooldowns])
     
     # Format Result
@@ -105,35 +149,31 @@ def generate_exercises_list(goal: str, fitness_level: str, equipment: str) -> Li
         reps = "10-12"
         if item["phase"] == "Warm-up": sets=1; reps="60 sec"
         elif item["phase"] == "Main Workout": 
-            if "strength" in ex.tags: sets=4; reps="8-10"
+            if "strength" in ex["tags"]: sets=4; reps="8-10"
             else: sets=3; reps="12-15"
         elif item["phase"] == "Finisher": sets=2; reps="Failure"
         elif item["phase"] == "Cool-down": sets=1; reps="60 sec hold"
         
-        formatted_routine.append({
-            "name": ex.name,
-            "phase": item["phase"],
-            "sets": sets,
-            "reps": reps,
-            "muscle_group": ex.muscle_group,
-            "equipment": ex.equipment,
-            "difficulty": ex.difficulty,
-            "description": ex.description,
-            "animation_url": ex.animation_url or "https://assets.lottiefiles.com/packages/lf20_9xRkZk.json",
-            "thumbnail_url": ex.thumbnail_url or "https://placehold.co/100x100?text=Ex",
-            "id": ex.id
-        })
+        formatted_routine.append(_format_exercise(ex, item["phase"], sets, reps))
         
     return formatted_routine
 
 
-def recommend_workout(goal: str, fitness_level: str, freq: int) -> Dict:
+def generate_exercises_list(goal: str, fitness_level: str, equipment: str, rng=random) -> List[Dict]:
+    """
+    Generate a professional 10-15 exercise workout routine.
+    Structure: Warm-up (2) -> Main (7-11) -> Finisher (1-2) -> Cool-down (1)
+    """
+    return draw_routine(build_routine_pools(goal, fitness_level, equipment), rng)
+
+
+def recommend_workout(goal: str, fitness_level: str, freq: int, rng=random) -> Dict:
     """
     Legacy wrapper retained for compatibility, now uses generate_exercises_list.
     """
     # Simply generate one routine and package it
     # We default to requesting equipment if available in the app context, or just "with_equipment" logic
-    exercises = generate_exercises_list(goal, fitness_level, "with_equipment")
+    exercises = generate_exercises_list(goal, fitness_level, "with_equipment", rng)
     
     return {
         "goal": goal,
@@ -143,6 +183,28 @@ def recommend_workout(goal: str, fitness_level: str, freq: int) -> Dict:
         "calories_burn": len(exercises) * 20
     }
 
+def recommend_workout_for_user(user, day: Optional[date] = None) -> Dict:
+    """
+    Stable routine for a user on a given day (defaults to today, UTC).
+    Seeded per user and day so refreshes show the same workout; cached until
+    the day, the user's goal/level, or the TTL changes.
+    """
+    day = day or datetime.utcnow().date()
+    equipment = "with_equipment"
+    key = (user.id, day, user.goal, user.fitness_level, equipment)
+
+    def build():
+        seed = zlib.crc32(f"{user.id}:{day.isoformat()}".encode())
+        return recommend_workout(user.goal, user.fitness_level, user.freq_per_week or 3, random.Random(seed))
+
+    return routine_cache.get_or_set(key, build)
+
+
+def invalidate_user_routines(user_id: int) -> None:
+    """Forget cached routines after a profile change."""
+    routine_cache.discard_if(lambda key: key[0] == user_id)
+
+
 def get_equipment_for_workout(exercises: List[Dict]) -> List[str]:
     """Extract required equipment from a list of exercises."""
     equipment = set()
@@ -155,6 +217,17 @@ def get_equipment_for_workout(exercises: List[Dict]) -> List[str]:
                 if clean: equipment.add(clean)
     return list(equipment)
 
+def _daily_focus(day_index: int, goal: Optional[str] = None) -> str:
+    """
+    Rotate the "goal" used for routine generation to create variety in daily focus.
+    0=Push, 1=Pull, 2=Legs, 3=Core, 4=Full Body (the user's own goal when known)
+    """
+    rotation = ["muscle_gain", "back", "legs", "abs", goal or "fat_loss"]
+    day_type = rotation[day_index % len(rotation)]
+    if "back" in day_type: day_type = "muscle_gain" # Back is muscle
+    return day_type
+
+
 def recommend_workout_day(goal: str, fitness_level: str, day_index: int, is_break: bool) -> List[Dict]:
     """
     Recommend exercises for a specific day in the plan.
@@ -163,19 +236,32 @@ def recommend_workout_day(goal: str, fitness_level: str, day_index: int, is_brea
     if is_break:
         return []
 
-    # Simple rotation based on day index (0-based)
-    # 0=Push, 1=Pull, 2=Legs, 3=Core, 4=Full Body
-    rotation = ["muscle_gain", "back", "legs", "abs", "fat_loss"]
-    day_type = rotation[day_index % len(rotation)]
-    
     # Use the robust generation logic which handles phases and volume
     equipment_prio = "with_equipment" # Default to using equipment if available
     
-    # We rotate the "goal" parameter slightly to create variety in daily focus,
-    # but still respect the user's primary goal in the long run.
-    daily_focus = day_type
-    if "back" in day_type: daily_focus = "muscle_gain" # Back is muscle
+    return generate_exercises_list(_daily_focus(day_index, goal), fitness_level, equipment_prio)
+
+
+def generate_workout_month(goal: str, level: str, equipment: str, days: Iterable[int], seed: int) -> Dict[int, List[Dict]]:
+    """
+    Generate routines for all exercise days of a plan in one pass.
+    `days` are 0-based plan day indexes. Candidate pools are built once per
+    daily focus and every draw comes from a single RNG seeded with `seed`,
+    so the same seed (and exercise library) always yields the same month.
+    Main lifts avoid repeating the previous session of the same focus.
+    """
+    rng = random.Random(seed)
+    pools_by_focus: Dict[str, Dict] = {}
+    last_by_focus: Dict[str, Set[int]] = {}
+    month = {}
     
-    exercises = generate_exercises_list(daily_focus, fitness_level, equipment_prio)
+    for day_index in sorted(days):
+        focus = _daily_focus(day_index, goal)
+        if focus not in pools_by_focus:
+            pools_by_focus[focus] = build_routine_pools(focus, level, equipment)
+        
+        routine = draw_routine(pools_by_focus[focus], rng, avoid=last_by_focus.get(focus, ()))
+        last_by_focus[focus] = {ex["id"] for ex in routine if ex["phase"] == "Main Workout"}
+        month[day_index] = routine
     
-    return exercises
+    return month
@@ -138,7 +138,8 @@ async function generatePlan() {
             method: 'POST',
             body: JSON.stringify({ start_date: new Date().toISOString().split('T')[0] })
         });
-        if (res.ok) {
+        const job = res.ok ? await waitForJob((await res.json()).job_id) : null;
+        if (job && job.status === 'done') {
             alert("Plan created!");
             location.reload();
         } else {
@@ -152,6 +153,17 @@ async function generatePlan() {
     }
 }
 
+async function waitForJob(jobId, intervalMs = 1000, maxPolls = 60) {
+    for (let i = 0; i < maxPolls; i++) {
+        const res = await fetch(`/api/jobs/${jobId}`);
+        if (!res.ok) return null;
+        const job = await res.json();
+        if (job.status === 'done' || job.status === 'failed') return job;
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+    return null;
+}
+
 async function fetchTodayPlan() {
     const container = document.getElementById('planContainer');
     const createBtn = document.getElementById('createPlanBtn');
@@ -311,11 +323,50 @@ function initNotifications() {
         markAllBtn.addEventListener('click', markAllNotificationsRead);
     }
 
+    // Notifications are scheduled by local time, so tell the server ours (logged-in pages only)
+    if (btn) syncTimezone();
+
     // Initial fetch for badge
     fetchNotifications();
 
-    // Poll every 5 minutes
-    setInterval(fetchNotifications, 300000);
+    // Live updates over Server-Sent Events when the server runs workers that can hold them; poll otherwise
+    if (btn && window.EventSource && document.body.dataset.notificationStream === 'on') {
+        streamNotifications();
+    } else if (btn) {
+        setInterval(fetchNotifications, 60000);
+    }
+}
+
+// Last list fetched from /api/notifications, kept current by the stream
+let notifList = [];
+
+function streamNotifications() {
+    // EventSource reconnects by itself, resuming after the last event id it saw
+    const source = new EventSource('/api/notifications/stream');
+
+    source.addEventListener('notification', (e) => {
+        const n = JSON.parse(e.data);
+        if (notifList.some(existing => existing.id === n.id)) return;
+        notifList = [n, ...notifList].slice(0, 20);
+        renderNotifications(notifList);
+    });
+
+    source.addEventListener('unread', (e) => {
+        setUnreadCount(JSON.parse(e.data).unread);
+    });
+}
+
+async function syncTimezone() {
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+    if (!tz || localStorage.getItem('gymsphereTimezone') === tz) return;
+    try {
+        const res = await fetch('/api/onboard', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ timezone: tz })
+        });
+        if (res.ok) localStorage.setItem('gymsphereTimezone', tz);
+    } catch (e) { console.error("Error saving timezone", e); }
 }
 
 async function fetchNotifications() {
@@ -323,6 +374,7 @@ async function fetchNotifications() {
         const res = await fetch('/api/notifications');
         const notifs = await res.json();
 
+        notifList = notifs;
         renderNotifications(notifs);
         updateBadge(notifs);
     } catch (e) { console.error("Error fetching notifications", e); }
@@ -360,11 +412,13 @@ function renderNotifications(notifs) {
 }
 
 function updateBadge(notifs) {
+    setUnreadCount(notifs.filter(n => !n.is_read).length);
+}
+
+function setUnreadCount(unread) {
     const badge = document.getElementById('notifBadge');
     const countDisplay = document.getElementById('unreadCountDisplay');
 
-    const unread = notifs.filter(n => !n.is_read).length;
-
     if (badge) {
         if (unread > 0) {
             badge.classList.remove('hidden');
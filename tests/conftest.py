@@ -0,0 +1,57 @@
+import os
+import tempfile
+import time
+
+# Config reads DATABASE_URL at import, so point it at a scratch database first
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "gymsphere-test.db")
+
+import pytest
+
+from app import create_app
+from models import User, db
+from services import checkin_service
+
+
+def _wait_for_effects(timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while checkin_service._pending_effects:
+        assert time.monotonic() < deadline, "check-in effects still pending"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        _wait_for_effects()  # Before the next test drops the tables under them
+        db.session.remove()
+
+
+@pytest.fixture
+def wait_for_effects(app):
+    """Block until the check-in effects queued so far have run, then read afresh."""
+    def wait() -> None:
+        _wait_for_effects()
+        db.session.expire_all()
+    return wait
+
+
+@pytest.fixture
+def user(app):
+    user = User(fullname="Test User", email="test@example.com", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+        session["_fresh"] = True
+    return client
@@ -0,0 +1,203 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import DailyPlanEntry, UserPlan, db
+from services import background, checkin_service
+from services.streak_service import calculate_streaks, recompute_streaks, roll_streaks
+
+TODAY = datetime.utcnow().date()
+
+
+def _plan(user, *days, exercised=()):
+    """A plan with an exercise day on each of `days`, done on those in `exercised`."""
+    plan = UserPlan(user_id=user.id, start_date=min(days), end_date=max(days))
+    db.session.add(plan)
+    db.session.flush()
+    entries = [
+        DailyPlanEntry(plan_id=plan.id, date=day, is_exercise_day=True, is_exercise_completed=day in exercised)
+        for day in days
+    ]
+    db.session.add_all(entries)
+    db.session.commit()
+    return entries
+
+
+def test_after_commit_callbacks_run_in_order_on_commit(app):
+    calls = []
+    background.after_commit(calls.append, "first")
+    background.after_commit(calls.append, "second")
+    assert calls == []
+
+    db.session.commit()
+
+    assert calls == ["first", "second"]
+
+
+def test_after_commit_callbacks_dropped_on_rollback(app):
+    calls = []
+    background.after_commit(calls.append, "rolled back")
+
+    db.session.rollback()
+    db.session.commit()
+
+    assert calls == []
+
+
+def test_checkin_effects_dropped_on_rollback(user):
+    checkin_service.queue_checkin_effects(user.id, "badges")
+
+    db.session.rollback()
+    db.session.commit()
+
+    assert checkin_service._pending_effects == {}
+
+
+def test_effects_queued_while_running_share_one_pass(user, monkeypatch, wait_for_effects):
+    started, release, runs = threading.Event(), threading.Event(), []
+
+    def slow_badges(effect_user):
+        runs.append(effect_user.id)
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setitem(checkin_service.CHECKIN_EFFECTS, "badges", slow_badges)
+    checkin_service.queue_checkin_effects(user.id, "badges")
+    db.session.commit()
+    assert started.wait(5)
+    for _ in range(4):
+        checkin_service.queue_checkin_effects(user.id, "badges")
+        db.session.commit()
+    release.set()
+    wait_for_effects()
+
+    assert runs == [user.id, user.id]
+
+
+def test_checkin_today_is_one_commit(user, client, wait_for_effects):
+    yesterday = TODAY - timedelta(days=1)
+    _, entry = _plan(user, yesterday, TODAY, exercised=[yesterday])
+    roll_streaks(user)
+    client.get("/api/plan/today")  # The first request also resumes queued jobs
+    wait_for_effects()
+    request_thread, commits = threading.get_ident(), []
+
+    def count(conn):
+        commits.append(threading.get_ident())
+
+    event.listen(db.engine, "commit", count)
+    try:
+        response = client.post("/api/plan/checkin", json={"entry_id": entry.id, "type": "exercise"})
+    finally:
+        event.remove(db.engine, "commit", count)
+
+    assert response.status_code == 200
+    assert response.get_json()["streaks"]["workout"] == 2
+    assert commits.count(request_thread) == 1  # Effects commit on the background pool
+
+
+def test_late_checkin_is_rescanned_after_commit(user, client, wait_for_effects):
+    (entry,) = _plan(user, TODAY - timedelta(days=1))
+    roll_streaks(user)
+    assert user.workout_streak == 0
+
+    response = client.post("/api/plan/checkin", json={"entry_id": entry.id, "type": "exercise"})
+    wait_for_effects()
+
+    assert response.status_code == 200
+    assert user.workout_streak == calculate_streaks(user)["workout"] == 1
+
+
+def test_late_checkin_counts_days_from_an_earlier_plan(user, client, wait_for_effects):
+    yesterday = TODAY - timedelta(days=1)
+    earlier_days = [TODAY - timedelta(days=n) for n in range(10, 0, -1)]
+    *_, late_entry = _plan(user, *earlier_days, exercised=earlier_days[:-1])
+    _plan(user, TODAY)  # Regenerated: the latest plan starts today
+    recompute_streaks()
+    assert user.workout_streak == 0  # Yesterday was missed
+
+    response = client.post("/api/plan/checkin", json={"entry_id": late_entry.id, "type": "exercise"})
+    wait_for_effects()
+
+    assert response.status_code == 200
+    assert (user.workout_streak, user.workout_streak_through) == (10, yesterday)
+    recompute_streaks()
+    db.session.refresh(user)
+    assert user.workout_streak == 10
+
+
+def test_checkin_by_untracked_user_is_one_commit(user, client, wait_for_effects):
+    yesterday = TODAY - timedelta(days=1)
+    _plan(user, TODAY - timedelta(days=2), yesterday, exercised=[TODAY - timedelta(days=2), yesterday])
+    (entry,) = _plan(user, TODAY)
+    assert user.workout_streak_through is None
+    client.get("/api/plan/today")  # The first request also resumes queued jobs
+    wait_for_effects()
+    request_thread, commits = threading.get_ident(), []
+
+    def count(conn):
+        commits.append(threading.get_ident())
+
+    event.listen(db.engine, "commit", count)
+    try:
+        response = client.post("/api/plan/checkin", json={"entry_id": entry.id, "type": "exercise"})
+    finally:
+        event.remove(db.engine, "commit", count)
+
+    assert response.get_json()["streaks"]["workout"] == 3
+    assert commits.count(request_thread) == 1
+
+
+def test_failed_effect_is_logged_with_traceback(user, monkeypatch, caplog, wait_for_effects):
+    def broken(effect_user):
+        raise RuntimeError("badge table on fire")
+
+    monkeypatch.setitem(checkin_service.CHECKIN_EFFECTS, "badges", broken)
+    checkin_service.queue_checkin_effects(user.id, "badges")
+    db.session.commit()
+    wait_for_effects()
+
+    (record,) = [r for r in caplog.records if r.name == "services.checkin_service"]
+    assert "badges failed" in record.getMessage()
+    assert record.exc_info[1].args == ("badge table on fire",)
+
+
+def test_failed_after_commit_callback_is_logged_not_raised(app, caplog):
+    calls = []
+
+    def broken():
+        raise RuntimeError("boom")
+
+    background.after_commit(broken)
+    background.after_commit(calls.append, "still runs")
+    db.session.commit()
+
+    assert calls == ["still runs"]
+    assert any(r.name == "services.background" and r.exc_info for r in caplog.records)
+
+
+def test_stats_etag_changes_once_the_rescan_has_run(user, client, monkeypatch, wait_for_effects):
+    days = [TODAY - timedelta(days=n) for n in range(6, 0, -1)]
+    *_, late, _, _, _ = _plan(user, *days, exercised=[days[0], days[1], days[4], days[5]])
+    recompute_streaks()
+    release, rescan = threading.Event(), checkin_service.CHECKIN_EFFECTS["streaks"]
+
+    def held_rescan(effect_user):
+        release.wait(5)
+        rescan(effect_user)
+
+    monkeypatch.setitem(checkin_service.CHECKIN_EFFECTS, "streaks", held_rescan)
+    assert client.post("/api/plan/checkin", json={"entry_id": late.id, "type": "exercise"}).status_code == 200
+    before = client.get("/api/plan/stats")
+    release.set()
+    wait_for_effects()
+
+    after = client.get("/api/plan/stats", headers={"If-None-Match": before.headers["ETag"]})
+
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    # The late day joined the first run; the current streak is the same two days
+    assert [run["days"] for run in before.get_json()["history"]] == [2, 2]
+    assert [run["days"] for run in after.get_json()["history"]] == [3, 2]
+    assert after.get_json()["current_streak"] == 2
@@ -0,0 +1,121 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+
+from models import DailyPlanEntry, User, UserCheckIn, UserPlan, db
+from services.checkin_service import MAX_BATCH, parse_client_ts
+from services.streak_service import calculate_streaks
+
+TODAY = datetime.utcnow().date()
+
+
+def _plan(user, first, last):
+    """An untouched plan with an exercise day on every date from `first` to `last`."""
+    plan = UserPlan(user_id=user.id, start_date=first, end_date=last)
+    db.session.add(plan)
+    db.session.flush()
+    day = first
+    while day <= last:
+        db.session.add(DailyPlanEntry(plan_id=plan.id, date=day, is_exercise_day=True))
+        day += timedelta(days=1)
+    db.session.commit()
+    return {entry.date: entry.id for entry in DailyPlanEntry.query.filter_by(plan_id=plan.id)}
+
+
+def _sync(client, *items):
+    response = client.post("/api/plan/checkins:batch", json={"checkins": list(items)})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_batch_item_statuses(user, client):
+    entries = _plan(user, TODAY - timedelta(days=1), TODAY)
+    done = db.session.get(DailyPlanEntry, entries[TODAY - timedelta(days=1)])
+    done.is_diet_completed = True
+    db.session.commit()
+
+    body = _sync(
+        client,
+        {"entry_id": entries[TODAY], "type": "exercise"},
+        {"entry_id": entries[TODAY], "type": "exercise"},       # repeated in the batch
+        {"entry_id": done.id, "type": "diet"},                   # done before the sync
+        {"entry_id": 999999, "type": "diet"},
+        {"entry_id": entries[TODAY], "type": "stretch"},
+        {"entry_id": entries[TODAY], "type": "diet", "client_ts": "yesterday"},
+    )
+
+    assert [(result["status"], result.get("error")) for result in body["results"]] == [
+        ("applied", None),
+        ("duplicate", None),
+        ("duplicate", None),
+        ("error", "Entry not found"),
+        ("error", "Unknown check-in type"),
+        ("error", "Invalid client_ts"),
+    ]
+    assert UserCheckIn.query.filter_by(user_id=user.id).count() == 1
+    replay = _sync(client, {"entry_id": entries[TODAY], "type": "exercise"})
+    assert replay["results"][0]["status"] == "duplicate"
+    assert UserCheckIn.query.filter_by(user_id=user.id).count() == 1
+
+
+def test_other_users_entries_are_not_found(user, client):
+    other = User(fullname="Other User", email="other@example.com", password_hash="x")
+    db.session.add(other)
+    db.session.commit()
+    entries = _plan(other, TODAY, TODAY)
+
+    body = _sync(client, {"entry_id": entries[TODAY], "type": "exercise"})
+
+    assert body["results"][0]["status"] == "error"
+    assert not db.session.get(DailyPlanEntry, entries[TODAY]).is_exercise_completed
+
+
+@pytest.mark.parametrize("checkins", [{"entry_id": 1}, [1, 2], [{"entry_id": 1}] * (MAX_BATCH + 1)])
+def test_malformed_or_oversized_batch_is_rejected(client, checkins):
+    response = client.post("/api/plan/checkins:batch", json={"checkins": checkins})
+    assert response.status_code == 400
+
+
+def test_late_checkins_synced_out_of_order(user, client, wait_for_effects):
+    entries = _plan(user, TODAY - timedelta(days=3), TODAY)
+    days = [TODAY - timedelta(days=1), TODAY - timedelta(days=3), TODAY - timedelta(days=2)]
+
+    body = _sync(client, *(
+        {"entry_id": entries[day], "type": kind} for day in days for kind in ("exercise", "diet")
+    ))
+
+    assert {result["status"] for result in body["results"]} == {"applied"}
+    wait_for_effects()  # The rescan for late days runs after the commit
+    stored = {"workout": user.workout_streak, "diet": user.diet_streak}
+    assert stored == calculate_streaks(user) == {"workout": 3, "diet": 3}
+
+
+def test_client_ts_is_stored_as_utc(user, client):
+    entries = _plan(user, TODAY - timedelta(days=1), TODAY - timedelta(days=1))
+    day = TODAY - timedelta(days=1)
+
+    _sync(client, {"entry_id": entries[day], "type": "exercise", "client_ts": f"{day.isoformat()}T15:30:00+05:30"})
+
+    logged = UserCheckIn.query.filter_by(user_id=user.id).one()
+    assert logged.timestamp == datetime(day.year, day.month, day.day, 10, 0)
+
+
+def test_client_ts_before_the_entry_day_is_clamped(user, client):
+    day = TODAY - timedelta(days=1)
+    entries = _plan(user, day, day)
+
+    _sync(client, {"entry_id": entries[day], "type": "exercise", "client_ts": "2020-01-01T08:00:00"})
+
+    logged = UserCheckIn.query.filter_by(user_id=user.id).one()
+    assert logged.timestamp == datetime.combine(day, time.min)
+
+
+def test_parse_client_ts():
+    now = datetime(2026, 3, 10, 12, 0)
+    day = now.date() - timedelta(days=2)
+    assert parse_client_ts(None, now, day) == now
+    assert parse_client_ts("2030-01-01T08:00:00", now, day) == now
+    assert parse_client_ts("2020-01-01T08:00:00", now, day) == datetime.combine(day, time.min)
+    assert parse_client_ts("2026-03-10T09:00:00-02:00", now, day) == datetime(2026, 3, 10, 11, 0)
+    with pytest.raises(ValueError):
+        parse_client_ts("not a time", now, day)
@@ -0,0 +1,40 @@
+from models import Exercise, db
+from services.exercise_catalog import query_exercises_by_tags, set_exercise_tags
+
+
+def _exercise(name, *tags):
+    exercise = Exercise(name=name)
+    set_exercise_tags(exercise, tags)
+    db.session.add(exercise)
+    return exercise
+
+
+def _names(query):
+    return sorted(exercise.name for exercise in query)
+
+
+def test_include_and_exclude_tags(app):
+    _exercise("Push-up", "strength", "chest")
+    _exercise("Burpee", "hiit", "strength")
+    _exercise("Hamstring Stretch", "stretch", "mobility")
+    db.session.commit()
+
+    assert _names(query_exercises_by_tags()) == ["Burpee", "Hamstring Stretch", "Push-up"]
+    assert _names(query_exercises_by_tags(include=["Strength"])) == ["Burpee", "Push-up"]
+    assert _names(query_exercises_by_tags(include=["strength", "hiit"])) == ["Burpee"]
+    assert _names(query_exercises_by_tags(exclude=["hiit", "mobility"])) == ["Push-up"]
+    assert _names(query_exercises_by_tags(include=["strength"], exclude=["chest"])) == ["Burpee"]
+    # Exclusion is by whole tag, not substring of the comma-separated copy
+    assert _names(query_exercises_by_tags(exclude=["str"])) == ["Burpee", "Hamstring Stretch", "Push-up"]
+
+
+def test_admin_exercise_list_filters_by_tag(app, client, user):
+    user.is_admin = True
+    _exercise("Push-up", "strength", "chest")
+    _exercise("Burpee", "hiit", "strength")
+    db.session.commit()
+
+    page = client.get("/admin?tag=strength&exclude_tag=hiit").get_data(as_text=True)
+
+    assert "Push-up" in page
+    assert "Burpee" not in page
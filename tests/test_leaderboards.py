@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta
+
+from models import LeaderboardScore, User, db
+from services.leaderboard_service import board_key, prune_leaderboards, top_scores, user_standing
+
+WEDNESDAY = date(2026, 3, 11)
+WEEK = board_key("week", WEDNESDAY)
+
+
+def _users(*names):
+    users = [User(fullname=name, email=f"{name}@example.com", password_hash="x") for name in names]
+    db.session.add_all(users)
+    db.session.flush()
+    return users
+
+
+def _score(board, user, score):
+    db.session.add(LeaderboardScore(board=board, user_id=user.id, score=score))
+
+
+def test_tied_scores_share_a_rank(app):
+    ann, bob, cat, dan, eve, fay = _users("ann", "bob", "cat", "dan", "eve", "fay")
+    for user, score in ((ann, 5), (bob, 3), (cat, 3), (dan, 1), (eve, 0)):
+        _score(WEEK, user, score)
+    _score("all", fay, 9)  # Not on this week's board
+    db.session.commit()
+
+    top = top_scores("week", 10, today=WEDNESDAY)
+
+    assert [(row["rank"], row["name"], row["score"]) for row in top] == [
+        (1, "ann", 5), (2, "cat", 3), (2, "bob", 3), (4, "dan", 1),
+    ]
+    assert [row["rank"] for row in top_scores("week", 2, today=WEDNESDAY)] == [1, 2]
+    assert [user_standing(user.id, "week", today=WEDNESDAY)["rank"] for user in (ann, bob, cat, dan)] == [1, 2, 2, 4]
+
+
+def test_user_without_a_score_has_no_standing(app):
+    scored, zero, absent = _users("scored", "zero", "absent")
+    _score(WEEK, scored, 2)
+    _score(WEEK, zero, 0)
+    db.session.commit()
+
+    assert user_standing(scored.id, "week", today=WEDNESDAY) == {"rank": 1, "score": 2, "metric": "Check-ins"}
+    assert user_standing(zero.id, "week", today=WEDNESDAY) is None
+    assert user_standing(absent.id, "week", today=WEDNESDAY) is None
+    assert user_standing(scored.id, "all", today=WEDNESDAY) is None
+
+
+def test_prune_removes_only_expired_weekly_boards(app):
+    (user,) = _users("pruned")
+    weeks = [board_key("week", WEDNESDAY - timedelta(weeks=n)) for n in range(5)]
+    for board in weeks + ["all"]:
+        _score(board, user, 1)
+    db.session.commit()
+
+    assert prune_leaderboards(2, today=WEDNESDAY) == 2
+
+    assert sorted(s.board for s in LeaderboardScore.query) == sorted(weeks[:3] + ["all"])
+    assert prune_leaderboards(2, today=WEDNESDAY) == 0
+
+
+def test_prune_command_uses_the_configured_weeks(app):
+    (user,) = _users("cli")
+    today = datetime.utcnow().date()
+    for n in (0, 1, 2):
+        _score(board_key("week", today - timedelta(weeks=n)), user, 1)
+    _score("all", user, 3)
+    db.session.commit()
+    app.config["LEADERBOARD_KEEP_WEEKS"] = 1
+
+    result = app.test_cli_runner().invoke(args=["leaderboards-prune"])
+
+    assert result.exit_code == 0
+    assert "Removed 1 scores" in result.output
+    db.session.expire_all()
+    assert LeaderboardScore.query.count() == 3
@@ -0,0 +1,61 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Notification, User, db
+
+START = datetime(2026, 3, 1, 9, 0)
+
+
+def _notify(user, minutes, is_read=False):
+    notification = Notification(user_id=user.id, title=f"at {minutes}", is_read=is_read,
+                                created_at=START + timedelta(minutes=minutes))
+    db.session.add(notification)
+    return notification
+
+
+def _pages(client, limit):
+    pages, cursor = [], None
+    while True:
+        url = f"/api/notifications?limit={limit}" + (f"&before={cursor}" if cursor else "")
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([n["id"] for n in response.get_json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_feed_pages_cover_every_notification_once(client, user):
+    # Ties on created_at inside both groups, and across a page boundary
+    unread = [_notify(user, m) for m in (0, 5, 5, 5, 10, 20, 20)]
+    read = [_notify(user, m, is_read=True) for m in (1, 1, 15, 15, 15)]
+    other = User(fullname="Other", email="other@example.com", password_hash="x")
+    db.session.add(other)
+    db.session.flush()
+    _notify(other, 30)
+    db.session.commit()
+
+    def feed_order(group):
+        return [n.id for n in sorted(group, key=lambda n: (n.created_at, n.id), reverse=True)]
+    expected = feed_order(unread) + feed_order(read)
+
+    for limit in (1, 2, 3, 5, 12, 50):
+        pages = _pages(client, limit)
+        assert [notification_id for page in pages for notification_id in page] == expected
+        assert all(len(page) == limit for page in pages[:-1])
+        assert 0 < len(pages[-1]) <= limit
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    base64.urlsafe_b64encode(b"[true, 1]").decode(),
+    base64.urlsafe_b64encode(b'[true, "yesterday", 1]').decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_malformed_cursor_is_a_bad_request(client, cursor):
+    response = client.get(f"/api/notifications?before={cursor}")
+
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
@@ -0,0 +1,70 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from models import DailyPlanEntry, Notification, User, UserPlan, db
+from services.notification_scheduler import run_notifications, user_zone
+
+WEDNESDAY = date(2026, 3, 11)
+
+
+@pytest.fixture(autouse=True)
+def notice_hours(app):
+    app.config.update(NOTIFICATION_MORNING_HOUR=7, NOTIFICATION_EVENING_HOUR=18)
+
+
+def _at(day, hour, minute=0):
+    return datetime(day.year, day.month, day.day, hour, minute, tzinfo=timezone.utc)
+
+
+def _user(email, tz=None):
+    user = User(fullname=email.split("@")[0], email=email, password_hash="x", timezone=tz)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _keys(kind):
+    return sorted(n.dedupe_key for n in Notification.query.filter(Notification.dedupe_key.like(f"{kind}:%")))
+
+
+def test_second_run_in_the_same_hour_sends_nothing(user):
+    plan = UserPlan(user_id=user.id, start_date=WEDNESDAY - timedelta(days=1), end_date=WEDNESDAY + timedelta(days=1))
+    db.session.add(plan)
+    db.session.flush()
+    db.session.add_all([
+        DailyPlanEntry(plan_id=plan.id, date=WEDNESDAY - timedelta(days=1), is_exercise_day=True),  # missed
+        DailyPlanEntry(plan_id=plan.id, date=WEDNESDAY, is_exercise_day=True),
+        DailyPlanEntry(plan_id=plan.id, date=WEDNESDAY + timedelta(days=1), is_exercise_day=False),
+    ])
+    db.session.commit()
+
+    first = run_notifications(_at(WEDNESDAY, 20))
+    sent = Notification.query.count()
+    second = run_notifications(_at(WEDNESDAY, 20, 45))
+
+    assert first == {"coach": 1, "missed_workout": 1, "tomorrow_plan": 1, "weekly_summary": 0}
+    assert second == {"coach": 0, "missed_workout": 0, "tomorrow_plan": 0, "weekly_summary": 0}
+    assert Notification.query.count() == sent == 3
+    assert _keys("missed_workout") == [f"missed_workout:{user.id}:2026-03-10"]
+    assert _keys("tomorrow_plan") == [f"tomorrow_plan:{user.id}:2026-03-12"]
+
+
+def test_users_are_bucketed_by_local_time(app):
+    kolkata = _user("kolkata@example.com", "Asia/Kolkata")
+    los_angeles = _user("la@example.com", "America/Los_Angeles")
+
+    run_notifications(_at(WEDNESDAY, 6, 30))  # 12:00 in Kolkata, 23:30 the day before in Los Angeles
+
+    assert _keys("coach") == [f"coach:{kolkata.id}:2026-03-11", f"coach:{los_angeles.id}:2026-03-10"]
+
+
+def test_invalid_timezone_falls_back_to_utc(app):
+    bogus = _user("bogus@example.com", "Bogus/Zone")
+    unset = _user("unset@example.com")
+    assert user_zone("Bogus/Zone").key == "UTC"
+
+    assert run_notifications(_at(WEDNESDAY, 6, 59))["coach"] == 0
+    assert run_notifications(_at(WEDNESDAY, 7, 0))["coach"] == 2
+
+    assert _keys("coach") == sorted([f"coach:{bogus.id}:2026-03-11", f"coach:{unset.id}:2026-03-11"])
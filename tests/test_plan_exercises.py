@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from models import DailyPlanEntry, Exercise, PlanEntryExercise, PlanTemplate, PlanTemplateDay, PlanTemplateExercise, UserPlan, db
+
+TODAY = datetime.utcnow().date()
+
+
+def test_exercise_totals_read_template_and_inline_entries(user, client):
+    squat, plank = Exercise(name="Squat"), Exercise(name="Plank")
+    db.session.add_all([squat, plank])
+    db.session.flush()
+    squat_day = PlanTemplateDay(day_index=0, is_exercise_day=True, exercises=[
+        PlanTemplateExercise(exercise_id=squat.id, position=0, phase="Main Workout", sets=3, reps="10"),
+    ])
+    plank_day = PlanTemplateDay(day_index=1, is_exercise_day=True, exercises=[
+        PlanTemplateExercise(exercise_id=plank.id, position=0, phase="Finisher", sets=3, reps="30s"),
+    ])
+    db.session.add(PlanTemplate(content_hash="t" * 64, inputs_json={}, seed=1, total_days=2, days=[squat_day, plank_day]))
+    db.session.flush()
+    plan = UserPlan(user_id=user.id, start_date=TODAY - timedelta(days=2), end_date=TODAY)
+    db.session.add(plan)
+    db.session.flush()
+    db.session.add_all([
+        # Two days on the shared template, one done
+        DailyPlanEntry(plan_id=plan.id, date=TODAY - timedelta(days=2), is_exercise_day=True,
+                       template_day_id=squat_day.id, is_exercise_completed=True),
+        DailyPlanEntry(plan_id=plan.id, date=TODAY - timedelta(days=1), is_exercise_day=True,
+                       template_day_id=plank_day.id),
+        # A day from before templates, with its own exercise rows
+        DailyPlanEntry(plan_id=plan.id, date=TODAY, is_exercise_day=True, is_exercise_completed=True, exercises=[
+            PlanEntryExercise(exercise_id=squat.id, position=0, phase="Main Workout", sets=4, reps="8"),
+        ]),
+    ])
+    db.session.commit()
+
+    response = client.get("/api/plan/exercises")
+
+    assert response.get_json() == [
+        {"exercise_id": squat.id, "name": "Squat", "prescribed": 2, "completed": 2},
+        {"exercise_id": plank.id, "name": "Plank", "prescribed": 1, "completed": 0},
+    ]
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from models import DailyPlanEntry, LeaderboardScore, User, UserCheckIn, UserPlan, db
+from services.leaderboard_service import add_checkin_points, board_key
+from services.plan_service import regenerate_plans_for_users
+
+TODAY = datetime.utcnow().date()
+
+
+def test_regeneration_drops_scores_and_streaks_of_deleted_checkins(user):
+    yesterday = TODAY - timedelta(days=1)
+    plan = UserPlan(user_id=user.id, start_date=yesterday, end_date=yesterday)
+    db.session.add(plan)
+    db.session.flush()
+    entry = DailyPlanEntry(plan_id=plan.id, date=yesterday, is_exercise_day=True, is_exercise_completed=True)
+    db.session.add(entry)
+    db.session.flush()
+    db.session.add(UserCheckIn(user_id=user.id, daily_entry_id=entry.id, type="exercise", timestamp=datetime.utcnow()))
+    add_checkin_points(user.id, [("exercise", yesterday)])
+    user.workout_streak, user.workout_streak_through = 1, yesterday
+    db.session.commit()
+
+    result = regenerate_plans_for_users([user.id], start_date=TODAY.isoformat())
+
+    assert result["users"] == 1
+    assert UserCheckIn.query.count() == 0
+    assert LeaderboardScore.query.count() == 0
+    user = db.session.get(User, user.id)
+    assert (user.workout_streak, user.workout_streak_through) == (0, yesterday)
+    assert UserPlan.query.filter_by(user_id=user.id).one().start_date == TODAY
+
+
+def test_regeneration_keeps_other_users_scores(user):
+    other = User(fullname="Other User", email="other@example.com", password_hash="x")
+    db.session.add(other)
+    db.session.flush()
+    add_checkin_points(other.id, [("diet", TODAY)])
+    db.session.commit()
+
+    regenerate_plans_for_users([user.id], start_date=TODAY.isoformat())
+
+    assert {(row.user_id, row.board, row.score) for row in LeaderboardScore.query} == {
+        (other.id, "all", 1), (other.id, board_key("week", TODAY), 1),
+    }
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from models import DailyPlanEntry, UserPlan, db
+from services.streak_service import calculate_streaks, recompute_streaks, rescan_streaks, roll_streaks, rollover_streaks
+
+TODAY = datetime.utcnow().date()
+
+
+def _plan(user, days):
+    """A plan with an exercise day per {date: (exercise done, diet done)}."""
+    plan = UserPlan(user_id=user.id, start_date=min(days), end_date=max(days))
+    db.session.add(plan)
+    db.session.flush()
+    for day, (exercised, dieted) in days.items():
+        db.session.add(DailyPlanEntry(
+            plan_id=plan.id, date=day, is_exercise_day=True,
+            is_exercise_completed=exercised, is_diet_completed=dieted,
+        ))
+    db.session.commit()
+    return plan
+
+
+def _entry(plan, day):
+    return DailyPlanEntry.query.filter_by(plan_id=plan.id, date=day).one()
+
+
+def test_checkin_today_extends_streak_like_a_rescan(user, client):
+    plan = _plan(user, {
+        TODAY - timedelta(days=3): (True, True),
+        TODAY - timedelta(days=2): (True, True),
+        TODAY - timedelta(days=1): (True, True),
+        TODAY: (False, False),
+    })
+    roll_streaks(user)
+    assert (user.workout_streak, user.diet_streak) == (3, 3)
+
+    response = client.post("/api/plan/checkin", json={"entry_id": _entry(plan, TODAY).id, "type": "exercise"})
+
+    assert response.status_code == 200
+    assert response.get_json()["streaks"] == {"workout": 4, "diet": 3}
+    db.session.refresh(user)
+    assert calculate_streaks(user) == {"workout": 4, "diet": 3}
+
+
+def test_repeated_checkin_counts_once(user, client):
+    plan = _plan(user, {TODAY - timedelta(days=1): (True, False), TODAY: (False, False)})
+    roll_streaks(user)
+    entry_id = _entry(plan, TODAY).id
+
+    for _ in range(3):
+        response = client.post("/api/plan/checkin", json={"entry_id": entry_id, "type": "exercise"})
+
+    assert response.get_json()["streaks"] == {"workout": 2, "diet": 0}
+
+
+def test_rollover_extends_kept_and_resets_missed_streaks(user):
+    _plan(user, {TODAY - timedelta(days=1): (False, True)})
+    user.workout_streak = user.diet_streak = 5
+    user.workout_streak_through = user.diet_streak_through = TODAY - timedelta(days=2)
+    db.session.commit()
+
+    rollover_streaks(TODAY - timedelta(days=1))
+
+    db.session.refresh(user)
+    assert (user.workout_streak, user.diet_streak) == (0, 6)
+    assert user.workout_streak_through == user.diet_streak_through == TODAY - timedelta(days=1)
+
+
+def test_day_without_plan_entry_leaves_streak(user):
+    user.workout_streak = user.diet_streak = 5
+    user.workout_streak_through = user.diet_streak_through = TODAY - timedelta(days=2)
+    db.session.commit()
+
+    rollover_streaks(TODAY - timedelta(days=1))
+
+    db.session.refresh(user)
+    assert (user.workout_streak, user.diet_streak) == (5, 5)
+
+
+def test_checkin_on_a_regenerated_plan_agrees_with_recompute(user, client):
+    _plan(user, {
+        TODAY - timedelta(days=2): (True, True),
+        TODAY - timedelta(days=1): (True, True),
+    })
+    regenerated = _plan(user, {TODAY: (False, False)})
+    assert rescan_streaks(user) == {"workout": 2, "diet": 2}
+
+    client.post("/api/plan/checkin", json={"entry_id": _entry(regenerated, TODAY).id, "type": "diet"})
+
+    db.session.refresh(user)
+    incremental = (user.workout_streak, user.diet_streak)
+    recompute_streaks()
+    db.session.refresh(user)
+    assert incremental == (user.workout_streak, user.diet_streak) == (2, 3)
+
+
+def test_rescan_bumps_plan_versions_only_when_something_moved(user):
+    older = _plan(user, {TODAY - timedelta(days=2): (True, False)})
+    newer = _plan(user, {TODAY - timedelta(days=1): (True, True)})
+
+    rescan_streaks(user)
+    db.session.refresh(older)
+    db.session.refresh(newer)
+    scanned = (older.version, newer.version)
+    assert min(scanned) > 1
+
+    rescan_streaks(user)
+    db.session.refresh(older)
+    db.session.refresh(newer)
+    assert (older.version, newer.version) == scanned
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from migrations import create_missing_indexes
+from models import WaterLog, WaterRollup, db
+from services.water_service import collapse_water_logs, log_water, rebuild_water_rollups, water_rollups, water_today
+
+SUNDAY = date(2026, 3, 15)  # Week of Monday 9 March
+
+
+def _rollups(user_id):
+    return {
+        (r.period, r.period_start): (r.total_ml, r.days_logged)
+        for r in WaterRollup.query.filter_by(user_id=user_id)
+    }
+
+
+def test_repeated_logs_on_a_day_share_one_row(user):
+    assert [log_water(user.id, amount, SUNDAY) for amount in (250, 500, 250)] == [250, 750, 1000]
+    log_water(user.id, 300, SUNDAY - timedelta(days=1))
+
+    assert [(w.date, w.amount_ml) for w in WaterLog.query.order_by(WaterLog.date)] == [
+        (SUNDAY - timedelta(days=1), 300), (SUNDAY, 1000),
+    ]
+    assert water_today(user.id, SUNDAY) == 1000
+    assert _rollups(user.id) == {
+        ("week", date(2026, 3, 9)): (1300, 2),
+        ("month", date(2026, 3, 1)): (1300, 2),
+    }
+    assert water_rollups(user.id, "week", 2, today=SUNDAY)[-1] == {
+        "start": "2026-03-09", "total_ml": 1300, "days_logged": 2, "avg_ml": 650,
+    }
+
+
+def test_water_log_route_adds_to_todays_total(client):
+    totals = [client.post("/api/water/log", json={"amount": 400}).get_json()["total"] for _ in range(3)]
+
+    assert totals == [400, 800, 1200]
+    assert WaterLog.query.count() == 1
+    assert client.post("/api/water/log", json={"amount": 0}).status_code == 400
+
+
+def test_collapse_then_rebuild_rollups(user):
+    # A database from before uq_water_logs_user_date: one row per glass
+    db.session.execute(text("DROP INDEX uq_water_logs_user_date"))
+    monday, month_end = date(2026, 3, 9), date(2026, 2, 28)
+    db.session.add_all([
+        WaterLog(user_id=user.id, date=monday, amount_ml=250),
+        WaterLog(user_id=user.id, date=monday, amount_ml=250),
+        WaterLog(user_id=user.id, date=monday, amount_ml=500),
+        WaterLog(user_id=user.id, date=SUNDAY, amount_ml=0),
+        WaterLog(user_id=user.id, date=SUNDAY, amount_ml=0),
+        WaterLog(user_id=user.id, date=month_end, amount_ml=750),  # Same week as 1 March, another month
+        WaterLog(user_id=user.id, date=date(2026, 3, 1), amount_ml=400),
+    ])
+    db.session.commit()
+
+    assert collapse_water_logs() == 3
+    assert rebuild_water_rollups() == 4
+    create_missing_indexes()  # The unique index can be built now
+
+    assert sorted((w.date, w.amount_ml) for w in WaterLog.query) == [
+        (month_end, 750), (date(2026, 3, 1), 400), (monday, 1000), (SUNDAY, 0),
+    ]
+    assert _rollups(user.id) == {
+        ("week", date(2026, 2, 23)): (1150, 2),
+        ("week", monday): (1000, 1),  # The empty Sunday is not a logged day
+        ("month", date(2026, 2, 1)): (750, 1),
+        ("month", date(2026, 3, 1)): (1400, 2),
+    }
+    # Logging after the collapse lands on the merged row
+    assert log_water(user.id, 250, monday) == 1250
+    assert _rollups(user.id)[("week", monday)] == (1250, 1)
@@ -0,0 +1,106 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from models import DailyPlanEntry, SleepLog, User, UserCheckIn, UserPlan, UserProgress, WaterLog, db
+from services.notification_service import weekly_summary_rows
+
+WEEK_END = date(2026, 3, 15)
+WEEK_START = WEEK_END - timedelta(days=6)
+
+
+def _at(day, hour=8):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+def _user(name):
+    user = User(fullname=name, email=f"{name}@example.com", password_hash="x")
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _plan(user, days):
+    """days: {date: (is_exercise_day, is_exercise_completed, is_diet_completed)}"""
+    plan = UserPlan(user_id=user.id, start_date=min(days), end_date=max(days))
+    db.session.add(plan)
+    db.session.flush()
+    entries = {}
+    for day, (exercise, done, diet) in days.items():
+        entries[day] = DailyPlanEntry(plan_id=plan.id, date=day, is_exercise_day=exercise,
+                                      is_exercise_completed=done, is_diet_completed=diet)
+    db.session.add_all(entries.values())
+    db.session.flush()
+    return entries
+
+
+def _per_user_figures(user_id):
+    """The same figures one user at a time, the way the summary used to be built."""
+    starts_at, ends_at = _at(WEEK_START, 0), _at(WEEK_END + timedelta(days=1), 0)
+    plan = UserPlan.query.filter_by(user_id=user_id).order_by(UserPlan.id.desc()).first()
+    entries = [e for e in (plan.daily_entries if plan else []) if WEEK_START <= e.date <= WEEK_END]
+    water = WaterLog.query.filter(WaterLog.user_id == user_id, WaterLog.date.between(WEEK_START, WEEK_END)).all()
+    sleep = [s.hours for s in SleepLog.query.filter(SleepLog.user_id == user_id,
+                                                     SleepLog.date.between(WEEK_START, WEEK_END))]
+    weigh_ins = UserProgress.query.filter(
+        UserProgress.user_id == user_id, UserProgress.weight.isnot(None),
+        UserProgress.logged_at >= starts_at - timedelta(days=28), UserProgress.logged_at < ends_at,
+    ).order_by(UserProgress.logged_at.desc()).all()
+    this_week = [p.weight for p in weigh_ins if p.logged_at >= starts_at]
+    before = [p.weight for p in weigh_ins if p.logged_at < starts_at]
+    return {
+        "planned": sum(1 for e in entries if e.is_exercise_day),
+        "completed": sum(1 for e in entries if e.is_exercise_day and e.is_exercise_completed),
+        "plan_days": len(entries),
+        "diet_days": sum(1 for e in entries if e.is_diet_completed),
+        "checkins": UserCheckIn.query.filter(UserCheckIn.user_id == user_id, UserCheckIn.timestamp >= starts_at,
+                                             UserCheckIn.timestamp < ends_at).count(),
+        "water_ml": sum(w.amount_ml for w in water) if water else None,
+        "water_days": len({w.date for w in water}) if water else None,
+        "sleep_hours": sum(sleep) / len(sleep) if sleep else None,
+        "weight": this_week[0] if this_week else None,
+        "previous_weight": before[0] if before else None,
+    }
+
+
+def test_aggregate_matches_per_user_figures(app):
+    busy, logger, idle, weigher = (_user(name) for name in ("busy", "logger", "idle", "weigher"))
+
+    _plan(busy, {WEEK_START + timedelta(days=i): (True, True, True) for i in range(7)})  # Superseded below
+    entries = _plan(busy, {
+        WEEK_START - timedelta(days=1): (True, True, True),  # Before the week
+        WEEK_START: (True, True, False),
+        WEEK_START + timedelta(days=1): (False, False, True),
+        WEEK_START + timedelta(days=3): (True, False, True),
+        WEEK_END: (True, True, True),
+        WEEK_END + timedelta(days=1): (True, True, True),  # After it
+    })
+    db.session.add_all([
+        UserCheckIn(user_id=busy.id, daily_entry_id=entries[WEEK_START].id, type="exercise", timestamp=_at(WEEK_START)),
+        UserCheckIn(user_id=busy.id, daily_entry_id=entries[WEEK_END].id, type="both", timestamp=_at(WEEK_END, 23)),
+        UserCheckIn(user_id=busy.id, daily_entry_id=entries[WEEK_START - timedelta(days=1)].id, type="both",
+                    timestamp=_at(WEEK_START - timedelta(days=1))),
+        WaterLog(user_id=busy.id, date=WEEK_START, amount_ml=1500),
+        WaterLog(user_id=busy.id, date=WEEK_END, amount_ml=2250),
+        SleepLog(user_id=busy.id, date=WEEK_START + timedelta(days=2), hours=7.5),
+        UserProgress(user_id=busy.id, weight=80.0, logged_at=_at(WEEK_START - timedelta(days=40))),  # Too old
+        UserProgress(user_id=busy.id, weight=82.0, logged_at=_at(WEEK_START - timedelta(days=10))),
+        UserProgress(user_id=busy.id, weight=81.5, logged_at=_at(WEEK_START - timedelta(days=3))),
+        UserProgress(user_id=busy.id, weight=81.0, logged_at=_at(WEEK_START + timedelta(days=1))),
+        UserProgress(user_id=busy.id, weight=80.6, logged_at=_at(WEEK_END, 20)),
+        WaterLog(user_id=logger.id, date=WEEK_START + timedelta(days=4), amount_ml=1000),
+        WaterLog(user_id=logger.id, date=WEEK_END + timedelta(days=1), amount_ml=3000),  # After the week
+        SleepLog(user_id=logger.id, date=WEEK_START, hours=6.0),
+        SleepLog(user_id=logger.id, date=WEEK_END, hours=8.0),
+        UserProgress(user_id=weigher.id, weight=70.0, logged_at=_at(WEEK_START + timedelta(days=2))),
+    ])
+    db.session.commit()
+
+    users = [busy.id, logger.id, idle.id, weigher.id]
+    rows = weekly_summary_rows(select(User.id).where(User.id.in_(users)), WEEK_END)
+
+    assert [row.id for row in rows] == users
+    for row in rows:
+        figures = {key: getattr(row, key) for key in _per_user_figures(row.id)}
+        assert figures == _per_user_figures(row.id), row.id
+    assert rows[0].previous_weight == 81.5 and rows[0].weight == 80.6